@@ -1,26 +1,16 @@
-import csv
+import argparse
+import io
+import os
 import re
-import uuid
+import time
 
-from os import path
-from pya2l import DB, model
 from pya2l.api import inspect
-from sys import argv
-from xml.etree.ElementTree import Element, SubElement, Comment, ElementTree
 
-USE_CONSTANTS = False  # Should we use "constants" / "scalars" in the XDF? They kind of aren't good at all...
-
-db = DB()
-session = (
-    db.open_existing(argv[1]) if path.exists(f"{argv[1]}db") else db.import_a2l(argv[1])
-)
+import buildcache
+import xdftemplates
+from xmlbackend import Element, SubElement
 
-BASE_OFFSET = (
-    session.query(model.MemorySegment)
-    .filter(model.MemorySegment.name == "_ROM")
-    .first()
-    .address
-)
+USE_CONSTANTS = False  # Should we use "constants" / "scalars" in the XDF? They kind of aren't good at all...
 
 data_sizes = {
     "UWORD": 2,
@@ -32,20 +22,15 @@ data_sizes = {
     "FLOAT32_IEEE": 4,
 }
 
-axis_in_xdf = {
-    "address": False,
-    }
+REGION_SIZE = 0x400000
 
 # XDF Serialization methods
 
-categories = []
 
-
-def xdf_add_category(xdfheader, category):
-    if category not in categories:
-        categories.append(category)
-        index = categories.index(category)
-        xdf_category(xdfheader, category, index)
+def xdf_register_categories(categories, table_def):
+    for category in xdftemplates.table_categories(table_def):
+        if category not in categories:
+            categories.append(category)
 
 
 def xdf_root_with_configuration(title):
@@ -72,7 +57,7 @@ def xdf_root_with_configuration(title):
     region = SubElement(xdfheader, "REGION")
     region.set("type", "0xFFFFFFFF")
     region.set("startaddress", "0x0")
-    region.set("size", "0x400000")
+    region.set("size", hex(REGION_SIZE))
     region.set("regionflags", "0x0")
     region.set("name", "Binary")
     region.set("desc", "BIN for the XDF")
@@ -148,7 +133,7 @@ def xdf_axis_with_table(table: Element, id, axis_def):
     return axis
 
 
-def xdf_table_with_root(root: Element, table_def):
+def xdf_table_with_root(root: Element, categories, table_def):
     table = SubElement(root, "XDFTABLE")
     table.set("uniqueid", table_def["z"]["address"])
     table.set("flags", "0x30")
@@ -161,11 +146,11 @@ def xdf_table_with_root(root: Element, table_def):
         table_categories.append(table_def["sub_category"])       
     if "subsub_category" in table_def:
         table_categories.append(table_def["subsub_category"])            
-    xdf_add_table_categories(table, table_categories)
+    xdf_add_table_categories(table, categories, table_categories)
     return table
 
 
-def xdf_add_table_categories(table, table_categories):
+def xdf_add_table_categories(table, categories, table_categories):
     index = 0
     for category in table_categories:
         categorymem = SubElement(table, "CATEGORYMEM")
@@ -174,7 +159,7 @@ def xdf_add_table_categories(table, table_categories):
         index += 1
 
 
-def xdf_constant_with_root(root: Element, table_def):
+def xdf_constant_with_root(root: Element, categories, table_def):
     table = SubElement(root, "XDFCONSTANT")
     table.set("uniqueid", table_def["z"]["address"])
     title = SubElement(table, "title")
@@ -186,7 +171,7 @@ def xdf_constant_with_root(root: Element, table_def):
         table_categories.append(table_def["sub_category"])
     if "subsub_category" in table_def:
         table_categories.append(table_def["subsub_category"])
-    xdf_add_table_categories(table, table_categories)
+    xdf_add_table_categories(table, categories, table_categories)
 
     xdf_embeddeddata(table, "z", table_def["z"])
 
@@ -198,7 +183,7 @@ def xdf_constant_with_root(root: Element, table_def):
     return table
 
 
-def xdf_table_from_axis(root: Element, table_def, axis_name):
+def xdf_table_from_axis(root: Element, categories, table_def, axis_name):
     table = SubElement(root, "XDFTABLE")
     table.set("uniqueid", table_def[axis_name]["address"])
     table.set("flags", "0x30")
@@ -207,7 +192,7 @@ def xdf_table_from_axis(root: Element, table_def, axis_name):
         f'{table_def["title"]} : {axis_name} axis : {table_def[axis_name]["name"]}'
     )
     description = SubElement(table, "description")
-    description.text = table_def[axis_name]["name"]
+    description.text = xdftemplates.axis_description(table_def[axis_name])
     
     table_categories = ["Axis"]
     
@@ -216,7 +201,7 @@ def xdf_table_from_axis(root: Element, table_def, axis_name):
         # table_categories.append(table_def["sub_category"])
     # table_categories.append("Axis")
     
-    xdf_add_table_categories(table, table_categories)
+    xdf_add_table_categories(table, categories, table_categories)
     fake_xdf_axis_with_size(table, "x", table_def[axis_name]["length"])
     fake_xdf_axis_with_size(table, "y", 1)
     xdf_axis_with_table(table, "z", table_def[axis_name])
@@ -241,8 +226,8 @@ def calc_map_size(characteristic: inspect.Characteristic):
     return map_size
 
 
-def adjust_address(address):
-    return address - BASE_OFFSET
+def adjust_address(address, base_offset):
+    return address - base_offset
 
 
 # A2L to "normal" conversion methods
@@ -254,14 +239,14 @@ def fix_degree(bad_string):
     )  # Replace Unicode "unknown" with degree sign
 
 
-def axis_ref_to_dict(axis_ref: inspect.AxisDescr):
+def axis_ref_to_dict(axis_ref: inspect.AxisDescr, base_offset):
     axis_value = {
         "name": axis_ref.axisPtsRef.name,
         "units": fix_degree(axis_ref.axisPtsRef.compuMethod.unit),
         "min": axis_ref.lowerLimit,
         "max": axis_ref.upperLimit,
         "address": hex(
-            adjust_address(axis_ref.axisPtsRef.address)
+            adjust_address(axis_ref.axisPtsRef.address, base_offset)
             + data_sizes[axis_ref.axisPtsRef.depositAttr.axisPts["x"]["datatype"]]
         ),  # We need to offset the axis by 1 value, the first value is another length
         "length": axis_ref.maxAxisPoints,
@@ -289,117 +274,276 @@ def coefficients_to_equation(coefficients):
         return "Cannot handle polynomial ratfunc because we do not know how to invert!"
 
 
-# Begin
+def table_def_from_row(c_data: inspect.Characteristic, row, base_offset):
+    """Describes the table for one CSV row as a plain dict, ready for the XDF writers."""
+    category = row["Category 1"]
+    sub_category = row["Category 2"]
+    subsub_category = row["Category 3"]
+    custom_name = row["Custom Name"]
+    axisDescriptions = c_data.axisDescriptions
+
+    table_def = {
+        "title": c_data.longIdentifier,
+        "description": c_data.displayIdentifier,
+        "category": category,
+        "z": {
+            "min": c_data.lowerLimit,
+            "max": c_data.upperLimit,
+            "address": hex(adjust_address(c_data.address, base_offset)),
+            "dataSize": c_data.deposit.fncValues["datatype"],
+            "units": fix_degree(c_data.compuMethod.unit),
+        },
+    }
 
-root, xdfheader = xdf_root_with_configuration(argv[1])
-xdf_add_category(xdfheader, "Axis")
+    if custom_name is not None and len(custom_name) > 0:
+        table_def["description"] += f'\nOriginal Name: {table_def["title"]}'
+        table_def["title"] = custom_name
 
-with open(argv[2], encoding="utf-8-sig") as csvfile:
-    print("Enhance...")
-    csvreader = csv.DictReader(csvfile)
-    for row in csvreader:
-        tablename = row["Table Name"]
-        category = row["Category 1"]
-        sub_category = row["Category 2"]
-        subsub_category = row["Category 3"]
-        custom_name = row["Custom Name"]
-        characteristics = (
-            session.query(model.Characteristic)
-            .order_by(model.Characteristic.name)
-            .filter(model.Characteristic.name == tablename)
-            .first()
-        )
-        if characteristics is None:
-            print("******** Could not find ! ", tablename)
+    if sub_category is not None and len(sub_category) > 0:
+        table_def["sub_category"] = sub_category
+
+    if subsub_category is not None and len(subsub_category) > 0:
+        table_def["subsub_category"] = subsub_category
+
+    if len(c_data.compuMethod.coeffs) == 0 or table_def["z"]["dataSize"] == "FLOAT32_IEEE":
+        table_def["z"]["math"] = "X"
+    else:
+        table_def["z"]["math"] = coefficients_to_equation(c_data.compuMethod.coeffs)
+
+    if len(axisDescriptions) == 0 and USE_CONSTANTS is True:
+        table_def["constant"] = True
+    
+    if len(axisDescriptions) > 0:
+        table_def["x"] = axis_ref_to_dict(axisDescriptions[0], base_offset)
+        table_def["z"]["length"] = table_def["x"]["length"]
+        table_def["description"] += f'\nX: {table_def["x"]["name"]}'
+    
+    if len(axisDescriptions) > 1:
+        table_def["y"] = axis_ref_to_dict(axisDescriptions[1], base_offset)
+        table_def["description"] += f'\nY: {table_def["y"]["name"]}'
+        table_def["z"]["rows"] = table_def["y"]["length"]
+
+    return table_def
+
+
+def xdf_new_axis_tables(axis_in_xdf, table_def):
+    """Returns the axes of table_def that have no axis table in the XDF yet, and marks them as written.
+
+    axis_in_xdf is the set of axis addresses already written, so a shared
+    axis gets one table however many maps use it.
+    """
+    new_axes = []
+    for axis_name in ("x", "y"):
+        if axis_name not in table_def:
             continue
-        c_data = inspect.Characteristic(session, tablename)
-        table_offset = adjust_address(c_data.address)
-        table_length = calc_map_size(c_data)
-        axisDescriptions = c_data.axisDescriptions
-
-        xdf_add_category(xdfheader, category)
-
-        table_def = {
-            "title": c_data.longIdentifier,
-            "description": c_data.displayIdentifier,
-            "category": category,
-            "z": {
-                "min": c_data.lowerLimit,
-                "max": c_data.upperLimit,
-                "address": hex(adjust_address(c_data.address)),
-                "dataSize": c_data.deposit.fncValues["datatype"],
-                "units": fix_degree(c_data.compuMethod.unit),
-            },
-        }
+        #if row["Generate X Axis"].lower() == "true":
 
-        if custom_name is not None and len(custom_name) > 0:
-            table_def["description"] += f'\nOriginal Name: {table_def["title"]}'
-            table_def["title"] = custom_name
+        address = table_def[axis_name]["address"]
+        if address not in axis_in_xdf:
+            axis_in_xdf.add(address)
+            new_axes.append(axis_name)
+    return new_axes
 
-        if sub_category is not None and len(sub_category) > 0:
-            xdf_add_category(xdfheader, sub_category)
-            table_def["sub_category"] = sub_category
 
-        if subsub_category is not None and len(subsub_category) > 0:
-            xdf_add_category(xdfheader, subsub_category)
-            table_def["subsub_category"] = subsub_category
+def xdf_add_table_def(root: Element, categories, axis_in_xdf, table_def):
+    """Writes one table_def, and the tables for any of its axes not written yet."""
+    xdf_register_categories(categories, table_def)
 
-        if len(c_data.compuMethod.coeffs) == 0 or table_def["z"]["dataSize"] == "FLOAT32_IEEE":
-            table_def["z"]["math"] = "X"
+    if "constant" in table_def:
+        xdf_constant_with_root(root, categories, table_def)
+        return
+
+    table = xdf_table_with_root(root, categories, table_def)
+    for axis_name in xdf_new_axis_tables(axis_in_xdf, table_def):
+        xdf_table_from_axis(root, categories, table_def, axis_name)
+
+    for axis_name in ("x", "y"):
+        if axis_name in table_def:
+            xdf_axis_with_table(table, axis_name, table_def[axis_name])
         else:
-            table_def["z"]["math"] = coefficients_to_equation(c_data.compuMethod.coeffs)
-
-        if len(axisDescriptions) == 0 and USE_CONSTANTS is True:
-            table_def["constant"] = True
-        
-        if len(axisDescriptions) > 0:
-            table_def["x"] = axis_ref_to_dict(axisDescriptions[0])
-            table_def["z"]["length"] = table_def["x"]["length"]
-            table_def["description"] += f'\nX: {table_def["x"]["name"]}'
-        
-        if len(axisDescriptions) > 1:
-            table_def["y"] = axis_ref_to_dict(axisDescriptions[1])
-            table_def["description"] += f'\nY: {table_def["y"]["name"]}'
-            table_def["z"]["rows"] = table_def["y"]["length"]
+            fake_xdf_axis_with_size(table, axis_name, 1)
+    xdf_axis_with_table(table, "z", table_def["z"])
+
+
+def table_defs_from_rows(a2l, rows, chunk_size=None):
+    """Yields the table_def for each CSV row found in an open A2LSession.
+
+    Each axis carries "users", the characteristics in the A2L sharing it.
+    With chunk_size, the A2L objects are released every chunk_size rows.
+    """
+    print("Enhance...")
+    axis_users = a2l.axis_users()
 
+    def convert(c_data, row):
+        table_def = table_def_from_row(c_data, row, a2l.base_offset)
+        for axis_name in ("x", "y"):
+            if axis_name in table_def:
+                table_def[axis_name]["users"] = axis_users.get(table_def[axis_name]["name"], [])
+        return table_def
+
+    return a2l.extract(rows, convert, chunk_size)
+
+
+def build_xdf(table_defs, title):
+    """Builds the XDF as an element tree."""
+    categories = ["Axis"]
+    axis_in_xdf = set()
+
+    root, xdfheader = xdf_root_with_configuration(title)
+    for table_def in table_defs:
+        xdf_add_table_def(root, categories, axis_in_xdf, table_def)
+    for index, category in enumerate(categories):
+        xdf_category(xdfheader, category, index)
+    return root
+
+
+def render_xdf(table_defs, title):
+    """Renders the same document as build_xdf straight to text from precompiled fragments."""
+    categories = ["Axis"]
+    axis_in_xdf = set()
+
+    fragments = []
+    for table_def in table_defs:
+        xdf_register_categories(categories, table_def)
         if "constant" in table_def:
-            constant = xdf_constant_with_root(root, table_def)
+            fragments.append(xdftemplates.constant(table_def, categories))
+            continue
+        fragments.append(xdftemplates.table(table_def, categories))
+        for axis_name in xdf_new_axis_tables(axis_in_xdf, table_def):
+            fragments.append(xdftemplates.axis_table(table_def, axis_name, categories))
+    return xdftemplates.document(title, categories, fragments, REGION_SIZE)
+
+
+def table_layout(table_def):
+    """Summarizes the data ranges of a table_def like xdfreader.read_table, for xdfvalidate."""
+    axes = {}
+    for axis_name in ("x", "y", "z"):
+        if axis_name not in table_def:
+            continue
+        axis_def = table_def[axis_name]
+        bits = data_sizes[axis_def["dataSize"]] * 8
+        axes[axis_name] = {
+            "address": int(axis_def["address"], 16),
+            "bits": bits,
+            "cols": axis_def["length"] if "length" in axis_def else 1,
+            "rows": axis_def["rows"] if axis_name == "z" and "rows" in axis_def else 1,
+            "major_stride_bits": bits,
+            "minor_stride_bits": 0,
+        }
+    return {"title": table_def["title"], "address": axes["z"]["address"], "axes": axes}
+
+
+def validate_table_defs(table_defs):
+    """Returns the layout issues (overlaps, duplicates, out of region) of the tables."""
+    import xdfvalidate
+
+    return xdfvalidate.validate_tables([table_layout(table_def) for table_def in table_defs], [(0, REGION_SIZE)])
+
+
+def write_xdf(text, output):
+    """Writes the XDF text, leaving output untouched when it already holds the same document."""
+    return buildcache.replace_if_changed(output, text, encoding="us-ascii", errors="xmlcharrefreplace")
+
+
+def tool_sources():
+    """The source files that shape a2l2xdf's output, hashed into its .deps files."""
+    import a2lclean
+    import a2lsession
+    import xmlbackend
+
+    return [__file__, xdftemplates.__file__, xmlbackend.__file__, a2lsession.__file__, a2lclean.__file__]
+
+
+def file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def watch(paths, interval=0.25, settle=0.3):
+    """Yields the paths that changed, once each burst of edits has been quiet for settle seconds."""
+    signatures = {path: file_signature(path) for path in paths}
+    while True:
+        time.sleep(interval)
+        changed = [path for path in paths if file_signature(path) != signatures[path]]
+        if not changed:
+            continue
+        # Editors often save in several writes; wait until the files stop changing
+        while True:
+            current = {path: file_signature(path) for path in paths}
+            time.sleep(settle)
+            if current == {path: file_signature(path) for path in paths}:
+                break
+        changed = [path for path in paths if current[path] != signatures[path]]
+        signatures = current
+        if changed:
+            yield changed
+
+
+def main():
+    from a2lsession import A2LSession, read_rows
+    from xdfmerge import merge_xdf_in_place, print_stats
+
+    parser = argparse.ArgumentParser(description="Generate an XDF from an A2L and a table CSV.")
+    parser.add_argument("a2l", help="A2L file; its database is cached next to it as <a2l>db.")
+    parser.add_argument("csv", help="Tables to export, see default.csv.")
+    parser.add_argument("--merge", metavar="XDF", help="Merge the tables into this existing XDF instead of writing <a2l>.xdf.")
+    parser.add_argument("--keep-existing", action="store_true", help="With --merge, only add tables the XDF does not have yet.")
+    parser.add_argument("--no-validate", action="store_true", help="Skip the overlap and region checks.")
+    parser.add_argument("--chunk-size", type=int, metavar="N", help="Release the A2L objects every N tables to bound memory on very large A2Ls.")
+    parser.add_argument("--prune", action="store_true", help="Import only the characteristics in the CSV and what they depend on.")
+    parser.add_argument("--force", action="store_true", help="Regenerate <a2l>.xdf even if its inputs have not changed.")
+    parser.add_argument("--watch", action="store_true", help="Keep the A2L open and regenerate whenever the CSV or A2L is saved.")
+    args = parser.parse_args()
+
+    output = f"{args.a2l}.xdf"
+    inputs = [args.a2l, args.csv]
+    tool = buildcache.tool_digest(*tool_sources())
+    options = {"title": args.a2l}
+    validate = not args.no_validate
+    if not args.merge and not args.force and not args.watch and buildcache.up_to_date(output, inputs, tool, options):
+        print(f"{output} is up to date")
+        return
+
+    def generate(a2l, rows):
+        if args.merge:
+            generated = io.BytesIO(a2l.to_xdf(rows, validate=validate, chunk_size=args.chunk_size).encode("us-ascii", "xmlcharrefreplace"))
+            print_stats(merge_xdf_in_place(args.merge, generated, args.keep_existing), args.merge)
         else:
-            table = xdf_table_with_root(root, table_def)
-
-            if "x" in table_def:
-                xdf_axis_with_table(table, "x", table_def["x"])
-                #if row["Generate X Axis"].lower() == "true":
-                
-                duplicate = 0
-                check_address = table_def["x"]["address"]
-                while check_address in axis_in_xdf:
-                    duplicate += 1
-                    check_address += " "
-                    
-                axis_in_xdf[check_address] = True
-                if check_address == table_def["x"]["address"]:
-                    xdf_table_from_axis(root, table_def, "x")
-            else:
-                fake_xdf_axis_with_size(table, "x", 1)
-
-            if "y" in table_def:
-                xdf_axis_with_table(table, "y", table_def["y"])
-                #if row["Generate Y Axis"].lower() == "true":
-                                
-                duplicate = 0
-                check_address = table_def["y"]["address"]
-                while check_address in axis_in_xdf:
-                    duplicate += 1
-                    check_address += " "
-                    
-                axis_in_xdf[check_address] = True
-                if check_address == table_def["y"]["address"]:
-                
-                    xdf_table_from_axis(root, table_def, "y")
-            else:
-                fake_xdf_axis_with_size(table, "y", 1)
-
-            xdf_axis_with_table(table, "z", table_def["z"])
-
-ElementTree(root).write(f"{argv[1]}.xdf")
+            a2l.to_xdf(rows, output, validate=validate, chunk_size=args.chunk_size)
+            buildcache.record(output, inputs, tool, options)
+
+    rows = read_rows(args.csv)
+    keep = [row["Table Name"] for row in rows] if args.prune else None
+    a2l = A2LSession(args.a2l, keep=keep)
+    generate(a2l, rows)
+    if not args.watch:
+        return
+
+    # The session and its characteristic cache stay open, so only new rows are read from the A2L
+    print(f"Watching {args.csv} and {args.a2l}, Ctrl+C to stop")
+    try:
+        for changed in watch(inputs):
+            start = time.perf_counter()
+            try:
+                rows = read_rows(args.csv)
+                names = [row["Table Name"] for row in rows]
+                reopen = args.a2l in changed or (args.prune and not set(names) <= set(keep))
+                if a2l is not None and reopen:
+                    a2l.close()
+                    a2l = None
+                if a2l is None:
+                    keep = names if args.prune else None
+                    a2l = A2LSession(args.a2l, keep=keep)
+                generate(a2l, rows)
+                print(f"Regenerated {args.merge or output} in {time.perf_counter() - start:.2f}s")
+            except Exception as e:
+                print(f"******** Could not regenerate: {type(e).__name__}: {e}")
+    except KeyboardInterrupt:
+        print("Stopped watching")
+
+
+if __name__ == "__main__":
+    main()
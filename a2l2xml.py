@@ -1,30 +1,15 @@
-import csv
 import re
-import uuid
 
-from os import path
-from pya2l import DB, model
+import argparse
+
 from pya2l.api import inspect
-from sys import argv
-from xml.etree.ElementTree import Element, SubElement, Comment, ElementTree
-import xml.etree.ElementTree as ET
 
-import pprint
+import buildcache
+import xmlbackend
+from xmlbackend import Element, SubElement
 
 USE_CONSTANTS = False  # Should we use "constants" / "scalars" in the XML? They kind of aren't good at all...
 
-db = DB()
-session = (
-    db.open_existing(argv[1]) if path.exists(f"{argv[1]}db") else db.import_a2l(argv[1])
-)
-
-BASE_OFFSET = (
-    session.query(model.MemorySegment)
-    .filter(model.MemorySegment.name == "_ROM")
-    .first()
-    .address
-)
-
 data_sizes = {
     "UWORD": 2,
     "UBYTE": 1,
@@ -45,14 +30,8 @@ storage_types = {
     "FLOAT32_IEEE": 'float',
 }
 
-tables_in_xml = {
-    "name": False,
-    }
-
 # XML Serialization methods
 
-categories = []
-
 
 def xml_root_with_configuration(title):
     root = Element("ecus")
@@ -127,8 +106,8 @@ def calc_map_size(characteristic: inspect.Characteristic):
     return map_size
 
 
-def adjust_address(address):
-    return address - BASE_OFFSET
+def adjust_address(address, base_offset):
+    return address - base_offset
 
 
 # A2L to "normal" conversion methods
@@ -140,14 +119,14 @@ def fix_degree(bad_string):
     )  # Replace Unicode "unknown" with degree sign
 
 
-def axis_ref_to_dict(axis_ref: inspect.AxisDescr):
+def axis_ref_to_dict(axis_ref: inspect.AxisDescr, base_offset):
     axis_value = {
         "name": axis_ref.axisPtsRef.name,
         "units": fix_degree(axis_ref.axisPtsRef.compuMethod.unit),
         "min": axis_ref.lowerLimit,
         "max": axis_ref.upperLimit,
         "address": hex(
-            adjust_address(axis_ref.axisPtsRef.address)
+            adjust_address(axis_ref.axisPtsRef.address, base_offset)
             + data_sizes[axis_ref.axisPtsRef.depositAttr.axisPts["x"]["datatype"]]
         ),  # We need to offset the axis by 1 value, the first value is another length
         "length": axis_ref.maxAxisPoints,
@@ -188,93 +167,131 @@ def coefficients_to_equation(coefficients, inverse):
         return "Cannot handle polynomial ratfunc because we do not know how to invert!"
 
 
-# Begin
+def table_def_from_row(c_data: inspect.Characteristic, row, base_offset, tables_in_xml):
+    """Describes the map for one CSV row as a plain dict; tables_in_xml tracks titles already used."""
+    category = row["Category 1"]
+    category2 = row["Category 2"]
+    category3 = row["Category 3"]
+    custom_name = row["Custom Name"]
+    axisDescriptions = c_data.axisDescriptions
+
+
+    table_def = {
+        "title": c_data.longIdentifier,
+        "description": c_data.displayIdentifier,
+        "category": [category],
+        "z": {
+            "min": c_data.lowerLimit,
+            "max": c_data.upperLimit,
+            "address": hex(adjust_address(c_data.address, base_offset)),
+            "dataSize": c_data.deposit.fncValues["datatype"],
+            "units": fix_degree(c_data.compuMethod.unit),
+        },
+    }
+
+    if custom_name is not None and len(custom_name) > 0:
+        table_def["description"] += f'|Original Name: {table_def["title"]}'
+        table_def["title"] = custom_name
+
+    duplicate = 0
+    check_title = table_def["title"]
+    while check_title in tables_in_xml:
+        duplicate += 1
+        check_title += " "
+
+    tables_in_xml[check_title] = True
+    if check_title != table_def["title"]:
+        id_name = table_def["description"]
+        table_def["title"] += f" [{id_name}]" #f" {duplicate}"
+        #print(table_def["title"])
+    
+    tables_in_xml[table_def["title"]] = True
+    
+
+    if category2 is not None and len(category2) > 0:
+        table_def["category"].append(category2)
+        
+    if category3 is not None and len(category3) > 0:
+        table_def["category"].append(category3)
 
-root, xmlheader = xml_root_with_configuration(argv[1])
+    if len(c_data.compuMethod.coeffs) > 0:
+        table_def["z"]["math"] = coefficients_to_equation(c_data.compuMethod.coeffs, False)
+    else:
+        table_def["z"]["math"] = "X"
 
-with open(argv[2], encoding="utf-8-sig") as csvfile:
-    print("Enhance...")
-    csvreader = csv.DictReader(csvfile)
-    for row in csvreader:
-        tablename = row["Table Name"]
-        category = row["Category 1"]
-        category2 = row["Category 2"]
-        category3 = row["Category 3"]
-        custom_name = row["Custom Name"]
-        characteristics = (
-            session.query(model.Characteristic)
-            .order_by(model.Characteristic.name)
-            .filter(model.Characteristic.name == tablename)
-            .first()
-        )
-        if characteristics is None:
-            print("******** Could not find ! ", tablename)
-            continue
-        c_data = inspect.Characteristic(session, tablename)
-        table_offset = adjust_address(c_data.address)
-        table_length = calc_map_size(c_data)
-        axisDescriptions = c_data.axisDescriptions
-
-
-        table_def = {
-            "title": c_data.longIdentifier,
-            "description": c_data.displayIdentifier,
-            "category": [category],
-            "z": {
-                "min": c_data.lowerLimit,
-                "max": c_data.upperLimit,
-                "address": hex(adjust_address(c_data.address)),
-                "dataSize": c_data.deposit.fncValues["datatype"],
-                "units": fix_degree(c_data.compuMethod.unit),
-            },
+    if len(c_data.compuMethod.coeffs) > 0:
+        table_def["z"]["math2"] = coefficients_to_equation(c_data.compuMethod.coeffs, True)
+    else:
+        table_def["z"]["math2"] = "X"
+
+    if len(axisDescriptions) == 0 and USE_CONSTANTS is True:
+        table_def["constant"] = True
+    if len(axisDescriptions) > 0:
+        table_def["x"] = axis_ref_to_dict(axisDescriptions[0], base_offset)
+        table_def["z"]["length"] = table_def["x"]["length"]
+        table_def["description"] += f'|X: {table_def["x"]["name"]}'
+    if len(axisDescriptions) > 1:
+        table_def["y"] = axis_ref_to_dict(axisDescriptions[1], base_offset)
+        table_def["description"] += f'|Y: {table_def["y"]["name"]}'
+        table_def["z"]["rows"] = table_def["y"]["length"]
+
+    return table_def
+
+
+def build_xml(a2l, rows, title, chunk_size=None):
+    """Builds the XML mappack tree for the CSV rows from an open A2LSession."""
+    tables_in_xml = {
+        "name": False,
         }
 
-        if custom_name is not None and len(custom_name) > 0:
-            table_def["description"] += f'|Original Name: {table_def["title"]}'
-            table_def["title"] = custom_name
-
-        duplicate = 0
-        check_title = table_def["title"]
-        while check_title in tables_in_xml:
-            duplicate += 1
-            check_title += " "
-
-        tables_in_xml[check_title] = True
-        if check_title != table_def["title"]:
-            id_name = table_def["description"]
-            table_def["title"] += f" [{id_name}]" #f" {duplicate}"
-            #print(table_def["title"])
-        
-        tables_in_xml[table_def["title"]] = True
-        
+    root, xmlheader = xml_root_with_configuration(title)
+
+    print("Enhance...")
+    def convert(c_data, row):
+        return table_def_from_row(c_data, row, a2l.base_offset, tables_in_xml)
+
+    for table_def in a2l.extract(rows, convert, chunk_size):
+        xml_table_with_root(xmlheader, table_def)
+    return root
+
+
+def write_xml(root, output):
+    """Writes the mappack, leaving output untouched when it already holds the same document."""
+    return buildcache.replace_if_changed(output, xmlbackend.tounicode(root), encoding="us-ascii", errors="xmlcharrefreplace")
+
+
+def tool_sources():
+    """The source files that shape a2l2xml's output, hashed into its .deps files."""
+    import a2lclean
+    import a2lsession
+
+    return [__file__, xmlbackend.__file__, a2lsession.__file__, a2lclean.__file__]
+
+
+def main():
+    from a2lsession import A2LSession, read_rows
+
+    parser = argparse.ArgumentParser(description="Generate an XML mappack from an A2L.")
+    parser.add_argument("a2l")
+    parser.add_argument("csv", help="Tables to export, see default.csv.")
+    parser.add_argument("--chunk-size", type=int, metavar="N", help="Release the A2L objects every N tables to bound memory on very large A2Ls.")
+    parser.add_argument("--prune", action="store_true", help="Import only the characteristics in the CSV and what they depend on.")
+    parser.add_argument("--force", action="store_true", help="Regenerate <a2l>.xml even if its inputs have not changed.")
+    args = parser.parse_args()
+
+    output = f"{args.a2l}.xml"
+    inputs = [args.a2l, args.csv]
+    tool = buildcache.tool_digest(*tool_sources())
+    options = {"title": args.a2l}
+    if not args.force and buildcache.up_to_date(output, inputs, tool, options):
+        print(f"{output} is up to date")
+        return
+
+    rows = read_rows(args.csv)
+    a2l = A2LSession(args.a2l, keep=[row["Table Name"] for row in rows] if args.prune else None)
+    a2l.to_xml(rows, output, chunk_size=args.chunk_size)
+    buildcache.record(output, inputs, tool, options)
+
 
-        if category2 is not None and len(category2) > 0:
-            table_def["category"].append(category2)
-            
-        if category3 is not None and len(category3) > 0:
-            table_def["category"].append(category3)
-
-        if len(c_data.compuMethod.coeffs) > 0:
-            table_def["z"]["math"] = coefficients_to_equation(c_data.compuMethod.coeffs, False)
-        else:
-            table_def["z"]["math"] = "X"
-
-        if len(c_data.compuMethod.coeffs) > 0:
-            table_def["z"]["math2"] = coefficients_to_equation(c_data.compuMethod.coeffs, True)
-        else:
-            table_def["z"]["math2"] = "X"
-
-        if len(axisDescriptions) == 0 and USE_CONSTANTS is True:
-            table_def["constant"] = True
-        if len(axisDescriptions) > 0:
-            table_def["x"] = axis_ref_to_dict(axisDescriptions[0])
-            table_def["z"]["length"] = table_def["x"]["length"]
-            table_def["description"] += f'|X: {table_def["x"]["name"]}'
-        if len(axisDescriptions) > 1:
-            table_def["y"] = axis_ref_to_dict(axisDescriptions[1])
-            table_def["description"] += f'|Y: {table_def["y"]["name"]}'
-            table_def["z"]["rows"] = table_def["y"]["length"]
-
-        table = xml_table_with_root(xmlheader, table_def)
-
-ElementTree(root).write(f"{argv[1]}.xml")
+if __name__ == "__main__":
+    main()
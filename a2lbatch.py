@@ -0,0 +1,195 @@
+"""Runs a manifest of A2L conversion jobs across a pool of worker processes.
+
+    python3 a2lbatch.py jobs.csv [-j 4]
+
+The manifest is a CSV with one job per row:
+
+    op,a2l,csv,output,a2l2,bin,bin2,search_term
+    xdf,sw100/ecu.a2l,default.csv,out/sw100.xdf,,,,
+    xml,sw100/ecu.a2l,default.csv,out/sw100.xml,,,,
+    compare,sw100/ecu.a2l,,out/diff.txt,sw101/ecu.a2l,sw100.bin,sw101.bin,
+
+op is xdf, xml or compare, as for a2ldaemon; relative paths are taken from
+the manifest's directory. Compare results go to output, one "name : long
+identifier" per line, or are printed when it is empty.
+
+Jobs are grouped by A2L so each database is opened once per group. A2Ls
+without a database of their current content are imported first, largest
+first, and each group is started as soon as the databases it needs are
+ready. Timings are reported per job.
+"""
+import argparse
+import csv
+import io
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import redirect_stdout
+
+OPS = ("xdf", "xml", "compare")
+PATH_KEYS = ("a2l", "csv", "output", "a2l2", "bin", "bin2")
+
+
+def read_manifest(manifest):
+    """Reads the manifest into daemon-style request dicts with absolute paths."""
+    base = os.path.dirname(os.path.abspath(manifest))
+    jobs = []
+    with open(manifest, encoding="utf-8-sig") as csvfile:
+        for line, row in enumerate(csv.DictReader(csvfile), 2):
+            request = {key: value.strip() for key, value in row.items() if key and value and value.strip()}
+            if request.get("op") not in OPS:
+                raise ValueError(f"{manifest}:{line}: op must be one of {', '.join(OPS)}")
+            if "a2l" not in request or (request["op"] == "compare") != ("bin" in request):
+                raise ValueError(f"{manifest}:{line}: missing a2l, or bin for compare")
+            if request["op"] != "compare":
+                if "csv" not in request:
+                    raise ValueError(f"{manifest}:{line}: missing csv")
+                request["title"] = request["a2l"]  # Titled like the a2l2xdf / a2l2xml output
+            for key in PATH_KEYS:
+                if key in request:
+                    request[key] = os.path.join(base, request[key])
+            if request["op"] == "compare":
+                request.setdefault("a2l2", request["a2l"])
+                request.setdefault("bin2", request["bin"])
+            elif "output" not in request:
+                request["output"] = f"{request['a2l']}.{request['op']}"
+            request["line"] = line
+            jobs.append(request)
+    return jobs
+
+
+def has_database(a2l_path):
+    """True when a2l_path has a database imported from its current content."""
+    from a2lsession import a2l_record, current_database
+
+    return current_database(a2l_path, a2l_record(a2l_path)) is not None
+
+
+def import_a2l(a2l_path):
+    """Imports an A2L into its database. Runs in a worker process; returns (seconds, log)."""
+    from a2lsession import A2LSession
+
+    start = time.perf_counter()
+    log = io.StringIO()
+    with redirect_stdout(log):
+        A2LSession(a2l_path).close()
+    return time.perf_counter() - start, log.getvalue()
+
+
+def run_group(jobs):
+    """Runs jobs sharing an A2L against one session. Runs in a worker process.
+
+    Returns (request, ok, seconds, log) for each job.
+    """
+    from a2ldaemon import SessionCache, run_job
+
+    cache = SessionCache(max_sessions=2)
+    results = []
+    for request in jobs:
+        start = time.perf_counter()
+        log = io.StringIO()
+        try:
+            with redirect_stdout(log):
+                reply = run_job(cache, request)
+                if request["op"] == "compare":
+                    lines = [f"{name} : {long_identifier}" for name, long_identifier in reply["differences"]]
+                    if "output" in request:
+                        with open(request["output"], "w", encoding="utf-8") as f:
+                            f.writelines(line + "\n" for line in lines)
+                    else:
+                        print("\n".join(lines))
+            ok = True
+        except Exception as e:
+            ok = False
+            log.write(f"{type(e).__name__}: {e}\n")
+        results.append((request, ok, time.perf_counter() - start, log.getvalue()))
+    for session in cache.sessions.values():
+        session.close()
+    return results
+
+
+def job_label(request):
+    if request["op"] == "compare":
+        return f"compare {request['bin']} {request['bin2']}"
+    return f"{request['op']} {request['a2l']} -> {request['output']}"
+
+
+def run_manifest(manifest, workers=None):
+    """Runs every job in the manifest and prints per-job timings; returns True if all succeeded."""
+    jobs = read_manifest(manifest)
+    for request in jobs:
+        if "output" in request and os.path.dirname(request["output"]):
+            os.makedirs(os.path.dirname(request["output"]), exist_ok=True)
+
+    groups = {}
+    for request in jobs:
+        groups.setdefault(request["a2l"], []).append(request)
+    needs = {
+        a2l_path: {request[key] for request in group for key in ("a2l", "a2l2") if key in request}
+        for a2l_path, group in groups.items()
+    }
+    to_import = sorted(
+        {a2l_path for required in needs.values() for a2l_path in required if not has_database(a2l_path)},
+        key=lambda a2l_path: os.path.getsize(a2l_path) if os.path.exists(a2l_path) else 0,
+        reverse=True,  # The biggest imports take longest, start them first
+    )
+
+    failures = []
+    failed_imports = set()
+    total = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(import_a2l, a2l_path): ("import", a2l_path) for a2l_path in to_import}
+        importing = set(to_import)
+        waiting = dict(groups)
+
+        def start_ready_groups():
+            for a2l_path in list(waiting):
+                if not needs[a2l_path] & importing:
+                    group = waiting.pop(a2l_path)
+                    if needs[a2l_path] & failed_imports:
+                        for request in group:
+                            failures.append(request)
+                            print(f"******** Skipped line {request['line']}: {job_label(request)} (import failed)")
+                        continue
+                    pending[pool.submit(run_group, group)] = ("group", a2l_path)
+
+        start_ready_groups()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, a2l_path = pending.pop(future)
+                if kind == "import":
+                    importing.discard(a2l_path)
+                    try:
+                        elapsed, log = future.result()
+                        print(f"Imported {a2l_path} in {elapsed:.2f}s")
+                    except Exception as e:
+                        failed_imports.add(a2l_path)
+                        print(f"******** Failed to import {a2l_path}: {e}")
+                    continue
+                try:
+                    results = future.result()
+                except Exception as e:
+                    results = [(request, False, 0.0, f"{type(e).__name__}: {e}") for request in groups[a2l_path]]
+                for request, ok, elapsed, log in results:
+                    if ok:
+                        print(f"{job_label(request)} in {elapsed:.2f}s")
+                        if request["op"] == "compare" and "output" not in request:
+                            print(log, end="")
+                    else:
+                        failures.append(request)
+                        print(f"******** Failed line {request['line']}: {job_label(request)}: {log.strip().splitlines()[-1] if log.strip() else 'no output'}")
+            start_ready_groups()
+
+    print(f"Ran {len(jobs) - len(failures)}/{len(jobs)} jobs on {len(groups)} A2Ls in {time.perf_counter() - total:.2f}s")
+    return not failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a manifest of A2L conversion jobs in parallel.")
+    parser.add_argument("manifest", help="CSV of jobs: op,a2l,csv,output,a2l2,bin,bin2,search_term.")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Worker processes (default: CPU count).")
+    args = parser.parse_args()
+
+    if not run_manifest(args.manifest, args.jobs):
+        raise SystemExit(1)
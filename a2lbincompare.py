@@ -1,25 +1,9 @@
-from pya2l import DB, model
-from pya2l.api import inspect
 from sys import argv
 
-db = DB()
-db2 = DB()
-# session = db.import_a2l(argv[1])
+from a2lsession import COMPARE_OFFSET
 
 # CLI arguments: a2lbincompare.py [first_a2l] [first_bin] [second_a2l] [second_bin] [search_term?]
 
-# First A2L & bin
-session = db.open_existing(argv[1])
-data1 = open(argv[2], "rb").read()
-
-# Second A2L & bin
-session2 = db2.open_existing(argv[3])
-data2 = open(argv[4], "rb").read()
-
-search_term = (
-    argv[5] if len(argv) > 5 else None
-)
-
 def calc_map_size(characteristic):
     data_sizes = {
         "UWORD": 2,
@@ -37,39 +21,62 @@ def calc_map_size(characteristic):
     return map_size
 
 
-characteristics = (
-    session.query(model.Characteristic).order_by(model.Characteristic.name).all()
-)
+def compare(a2l, data1, a2l2, data2, search_term=None, offset=COMPARE_OFFSET):
+    """Returns (name, longIdentifier) for each characteristic whose data differs between the bins.
+
+    Characteristics are taken from the first A2LSession; ones missing from
+    the second are skipped.
+    """
+    differences = []
+    names = a2l.matching_names(search_term) if search_term else a2l.characteristic_names()
+    for name, long_identifier in names:
+        # Get characteristic from both A2Ls, using the name from the first one
+        characteristic_data = a2l.characteristic(name)
+        try:
+            characteristic_data2 = a2l2.characteristic(name)
+        except Exception:
+            characteristic_data2 = None
+        if characteristic_data2 is None:
+            continue
+            # print(name + " does not exist in: "+argv[3])
+
+        # Get the map size (should be the same but best to double check)
+        map_size = calc_map_size(characteristic_data)
+        map_size2 = calc_map_size(characteristic_data2)
 
-for c in characteristics:
-    if search_term and (search_term not in (c.name+c.longIdentifier)):
-        # Characteristic does not meet search term, continue
-        continue
+        # Get offset
+        offset1 = characteristic_data.address - offset
+        offset2 = characteristic_data2.address - offset
 
-    # Get characteristic from both A2Ls, using the name from the first one
-    characteristic_data = inspect.Characteristic(session, c.name)
-    try:
-        characteristic_data2 = inspect.Characteristic(session2, c.name)
-    except:
-        continue
-        # print(c.name + " does not exist in: "+argv[3])
+        # Get data from bin
+        data1_map = data1[offset1 : offset1 + map_size]
+        data2_map = data2[offset2 : offset2 + map_size2]
 
-    # Get the map size (should be the same but best to double check)
-    map_size = calc_map_size(characteristic_data)
-    map_size2 = calc_map_size(characteristic_data2)
+        # Check match
+        is_match = data1_map == data2_map
 
-    # Get offset
-    offset = characteristic_data.address - 0xA0800000
-    offset2 = characteristic_data2.address - 0xA0800000
+        if not is_match:
+            differences.append((characteristic_data.name, characteristic_data.longIdentifier))
+    return differences
 
-    # Get data from bin
-    data1_map = data1[offset : offset + map_size]
-    data2_map = data2[offset2 : offset2 + map_size2]
 
-    # Check match
-    is_match = data1_map == data2_map
+def main():
+    from a2lsession import A2LSession
 
-    if not is_match:
+    # First A2L & bin
+    session = A2LSession(argv[1])
+    # Second A2L & bin
+    session2 = A2LSession(argv[3])
+
+    search_term = (
+        argv[5] if len(argv) > 5 else None
+    )
+
+    for name, long_identifier in session.compare(argv[2], argv[4], other=session2, search_term=search_term):
         print(
-            characteristic_data.name + " : " + characteristic_data.longIdentifier
+            name + " : " + long_identifier
         )  #  " @ " + hex(offset) + ":" + hex(offset+map_size) +
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""Normalizes an A2L so pya2l can import it without manual fixes.
+
+    python3 a2lclean.py ecu.a2l [cleaned.a2l]
+
+* The encoding is detected (UTF-8, UTF-16 with a BOM, else CP1252 or
+  LATIN-1) and the file is rewritten as UTF-8, so degree signs and other
+  accented characters survive the import.
+* "//" inside a quoted string is read by pya2l as the start of a comment:
+  "//=" becomes "=" and any other "//" becomes "/ /".
+* Control characters other than tab and line breaks are dropped.
+
+The file is read in blocks of whole lines; blocks with nothing to fix are
+written straight through, so memory stays flat and large A2Ls are cleaned
+at close to disk speed.
+A2LSession runs this automatically before importing.
+"""
+import argparse
+import os
+import re
+import tempfile
+
+ENCODINGS = ("utf-8", "cp1252", "latin-1")
+BLOCK_SIZE = 1 << 20
+CONTROL_CHARACTERS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]")
+# Searching for each character on its own is much faster than the class above on clean text
+CONTROL_CHARACTER_LIST = [chr(code) for code in (*range(0x09), 0x0B, 0x0C, *range(0x0E, 0x20), 0x7F)]
+CODE_TOKENS = re.compile(r'"|/\*|//')
+STRING_TOKENS = re.compile(r'\\.|"|//=?')
+BLOCK_END = re.compile(r"\*/")
+
+
+class LineCleaner:
+    """Rewrites A2L lines, tracking whether a string or block comment is open across lines."""
+
+    def __init__(self):
+        self.state = "code"
+        self.comment_markers = 0
+        self.control_characters = 0
+
+    def clean_block(self, text):
+        """Cleans whole lines of text, skipping the per-line scan when nothing in it needs one."""
+        if (
+            self.state == "code"
+            and "//" not in text
+            and "/*" not in text
+            and "\\" not in text
+            and text.count('"') % 2 == 0
+            and not any(character in text for character in CONTROL_CHARACTER_LIST)
+        ):
+            return text
+        return "".join([self.clean(line) for line in text.splitlines(keepends=True)])
+
+    def clean(self, line):
+        if CONTROL_CHARACTERS.search(line):
+            line, count = CONTROL_CHARACTERS.subn("", line)
+            self.control_characters += count
+        if self.state == "code":
+            # Balanced quotes and no comment markers leave the state alone
+            if "//" not in line and "/*" not in line and "\\" not in line and line.count('"') % 2 == 0:
+                return line
+        elif self.state == "block":
+            if "*/" not in line:
+                return line
+        return self.scan(line)
+
+    def scan(self, line):
+        parts = []
+        position = 0
+        while position < len(line):
+            if self.state == "code":
+                token = CODE_TOKENS.search(line, position)
+                if token is None:
+                    break
+                if token.group() == "//":
+                    break  # The rest of the line is a comment
+                self.state = "string" if token.group() == '"' else "block"
+                position = token.end()
+            elif self.state == "block":
+                token = BLOCK_END.search(line, position)
+                if token is None:
+                    break
+                self.state = "code"
+                position = token.end()
+            else:
+                token = STRING_TOKENS.search(line, position)
+                if token is None:
+                    break
+                if token.group() == '"':
+                    self.state = "code"
+                elif token.group().startswith("//"):
+                    parts.append(line[:token.start()] + ("=" if token.group() == "//=" else "/ /"))
+                    line = line[token.end():]
+                    self.comment_markers += 1
+                    position = 0
+                    continue
+                position = token.end()
+        parts.append(line)
+        return "".join(parts)
+
+
+def source_encodings(path):
+    """Encodings to try for path, most likely first."""
+    with open(path, "rb") as f:
+        start = f.read(4)
+    if start.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return ("utf-16",)
+    if start.startswith(b"\xef\xbb\xbf"):
+        return ("utf-8-sig",) + ENCODINGS[1:]
+    return ENCODINGS
+
+
+def read_blocks(src):
+    """Yields the text of src in blocks of about BLOCK_SIZE characters, each ending on a line break."""
+    while True:
+        text = src.read(BLOCK_SIZE)
+        if not text:
+            return
+        yield text + src.readline()
+
+
+def clean_a2l(source, destination):
+    """Writes a cleaned UTF-8 copy of source to destination.
+
+    Returns (encoding, changed, cleaner): the encoding source was read with,
+    whether the text differs from the source bytes, and the cleaner's counts.
+    """
+    for encoding in source_encodings(source):
+        cleaner = LineCleaner()
+        changed = encoding != "utf-8"
+        try:
+            with open(source, encoding=encoding, newline="") as src, open(
+                destination, "w", encoding="utf-8", newline=""
+            ) as out:
+                for text in read_blocks(src):
+                    cleaned = cleaner.clean_block(text)
+                    if cleaned is not text:
+                        changed = changed or cleaned != text
+                    out.write(cleaned)
+        except UnicodeDecodeError:
+            continue
+        return encoding, changed, cleaner
+    raise ValueError(f"Could not decode {source}")
+
+
+def cleaned_path(a2l_path):
+    root, ext = os.path.splitext(a2l_path)
+    return f"{root}.clean{ext or '.a2l'}"
+
+
+def prepare_import(a2l_path):
+    """Returns the A2L path to import: a2l_path itself when it needs no cleaning, else its cleaned copy.
+
+    The cleaned copy is written next to the original only when something
+    changed, so already clean files are imported as they are.
+    """
+    directory = os.path.dirname(os.path.abspath(a2l_path))
+    fd, temporary = tempfile.mkstemp(suffix=".a2l", dir=directory)
+    os.close(fd)
+    try:
+        encoding, changed, cleaner = clean_a2l(a2l_path, temporary)
+        if not changed:
+            os.unlink(temporary)
+            return a2l_path
+        destination = cleaned_path(a2l_path)
+        os.replace(temporary, destination)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.unlink(temporary)
+        raise
+    print_summary(a2l_path, destination, encoding, cleaner)
+    return destination
+
+
+def print_summary(source, destination, encoding, cleaner):
+    print(
+        f"Cleaned {source} ({encoding}) into {destination}: {cleaner.comment_markers} comment markers"
+        f" in strings, {cleaner.control_characters} control characters removed"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Normalize an A2L for pya2l: UTF-8, no // in strings, no control characters.")
+    parser.add_argument("a2l")
+    parser.add_argument("output", nargs="?", help="Cleaned A2L to write (default: <name>.clean.a2l).")
+    args = parser.parse_args()
+
+    output = args.output or cleaned_path(args.a2l)
+    encoding, changed, cleaner = clean_a2l(args.a2l, output)
+    print_summary(args.a2l, output, encoding, cleaner)
@@ -0,0 +1,223 @@
+"""Resident conversion server that keeps A2L sessions warm between jobs.
+
+    python3 a2ldaemon.py serve [--port 47310 | --socket /tmp/a2l.sock] [--max-sessions 4]
+    python3 a2ldaemon.py xdf ecu.a2l default.csv [ecu.xdf]
+    python3 a2ldaemon.py xml ecu.a2l default.csv [ecu.xml]
+    python3 a2ldaemon.py compare a.a2l a.bin b.a2l b.bin [search_term]
+    python3 a2ldaemon.py stats | stop
+
+Requests and replies are one JSON object per line. The most recently used
+A2LSessions are kept open, least recently used first out. Jobs run one at a
+time on a worker thread so the server keeps accepting connections meanwhile.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import socket
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+
+from a2lsession import A2LSession, read_rows
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 47310
+
+
+class SessionCache:
+    """LRU of open A2LSessions, keyed on the A2L path and modification time."""
+
+    def __init__(self, max_sessions):
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, a2l_path):
+        """Returns the session for a2l_path, opening it if needed. Nothing is evicted until trim()."""
+        key = (os.path.abspath(a2l_path), os.path.getmtime(a2l_path))
+        if key in self.sessions:
+            self.hits += 1
+            self.sessions.move_to_end(key)
+            return self.sessions[key]
+        self.misses += 1
+        for k in [k for k in self.sessions if k[0] == key[0]]:
+            self.sessions.pop(k).close()  # The A2L was edited; the new session imports it again
+        self.sessions[key] = A2LSession(a2l_path)
+        return self.sessions[key]
+
+    def trim(self):
+        """Closes the least recently used sessions beyond max_sessions, once no job is using them."""
+        while len(self.sessions) > self.max_sessions:
+            _, evicted = self.sessions.popitem(last=False)
+            evicted.close()
+
+    def stats(self):
+        return {
+            "sessions": [path for path, _ in self.sessions],
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def run_job(cache, request):
+    """Runs one request against the cache and returns the reply dict.
+
+    Sessions are evicted only after the job, so a compare keeps both of its
+    A2Ls open even when max_sessions is 1.
+    """
+    try:
+        return dispatch(cache, request)
+    finally:
+        cache.trim()
+
+
+def dispatch(cache, request):
+    op = request.get("op")
+    if op == "xdf":
+        a2l = cache.get(request["a2l"])
+        output = request.get("output") or f"{request['a2l']}.xdf"
+        a2l.to_xdf(read_rows(request["csv"]), output, request.get("title"))
+        return {"output": output}
+    if op == "xml":
+        a2l = cache.get(request["a2l"])
+        output = request.get("output") or f"{request['a2l']}.xml"
+        a2l.to_xml(read_rows(request["csv"]), output, request.get("title"))
+        return {"output": output}
+    if op == "compare":
+        a2l = cache.get(request["a2l"])
+        a2l2 = cache.get(request["a2l2"])
+        differences = a2l.compare(request["bin"], request["bin2"], other=a2l2, search_term=request.get("search_term"))
+        return {"differences": differences}
+    if op == "stats":
+        return cache.stats()
+    raise ValueError(f"Unknown op: {op}")
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, unix_socket=None, max_sessions=4):
+    cache = SessionCache(max_sessions)
+    worker = ThreadPoolExecutor(max_workers=1)  # pya2l sessions are not thread safe
+    loop = asyncio.get_running_loop()
+    stopped = asyncio.Event()
+
+    def job(request):
+        start = time.perf_counter()
+        log = io.StringIO()
+        try:
+            with redirect_stdout(log):
+                reply = run_job(cache, request)
+            reply["ok"] = True
+        except Exception as e:
+            reply = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        reply["log"] = log.getvalue()
+        reply["seconds"] = time.perf_counter() - start
+        return reply
+
+    async def handle(reader, writer):
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError as e:
+                    reply = {"ok": False, "error": f"Invalid request: {e}"}
+                else:
+                    if request.get("op") == "stop":
+                        writer.write(json.dumps({"ok": True}).encode("utf-8") + b"\n")
+                        await writer.drain()
+                        stopped.set()
+                        return
+                    reply = await loop.run_in_executor(worker, job, request)
+                writer.write(json.dumps(reply).encode("utf-8") + b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    if unix_socket:
+        server = await asyncio.start_unix_server(handle, path=unix_socket)
+        print(f"Listening on {unix_socket}")
+    else:
+        server = await asyncio.start_server(handle, host, port)
+        print(f"Listening on {host}:{port}")
+    async with server:
+        await stopped.wait()
+    worker.shutdown()
+    if unix_socket:
+        os.unlink(unix_socket)
+
+
+def submit(request, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_socket=None):
+    """Sends one request to a running daemon and returns its reply."""
+    if unix_socket:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(unix_socket)
+    else:
+        connection = socket.create_connection((host, port))
+    with connection, connection.makefile("rwb") as stream:
+        stream.write(json.dumps(request).encode("utf-8") + b"\n")
+        stream.flush()
+        return json.loads(stream.readline())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep A2L sessions warm and run conversion jobs against them.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--socket", help="Use this Unix socket instead of a localhost TCP port.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="Run the daemon.")
+    serve_parser.add_argument("--max-sessions", type=int, default=4, help="A2L sessions kept open (default: 4).")
+
+    for op in ("xdf", "xml"):
+        convert_parser = commands.add_parser(op, help=f"Convert an A2L and table CSV to {op.upper()}.")
+        convert_parser.add_argument("a2l")
+        convert_parser.add_argument("csv")
+        convert_parser.add_argument("output", nargs="?")
+
+    compare_parser = commands.add_parser("compare", help="List characteristics that differ between two bins.")
+    compare_parser.add_argument("a2l")
+    compare_parser.add_argument("bin")
+    compare_parser.add_argument("a2l2")
+    compare_parser.add_argument("bin2")
+    compare_parser.add_argument("search_term", nargs="?")
+
+    commands.add_parser("stats", help="Show the open sessions and cache hits.")
+    commands.add_parser("stop", help="Stop the daemon.")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        asyncio.run(serve(args.host, args.port, args.socket, args.max_sessions))
+        return
+
+    # The daemon has its own working directory, so send absolute paths
+    request = {"op": args.command}
+    if args.command in ("xdf", "xml"):
+        request["title"] = args.a2l  # Titled like the a2l2xdf / a2l2xml output
+        if not args.output:
+            args.output = f"{args.a2l}.{args.command}"
+    for key in ("a2l", "csv", "output", "a2l2", "bin", "bin2"):
+        if getattr(args, key, None):
+            request[key] = os.path.abspath(getattr(args, key))
+    if getattr(args, "search_term", None):
+        request["search_term"] = args.search_term
+
+    reply = submit(request, args.host, args.port, args.socket)
+    if reply.get("log"):
+        print(reply["log"], end="")
+    if not reply["ok"]:
+        print(f"******** {reply['error']}")
+        raise SystemExit(1)
+    if args.command == "compare":
+        for name, long_identifier in reply["differences"]:
+            print(name + " : " + long_identifier)
+    elif args.command == "stats":
+        print(json.dumps({key: reply[key] for key in ("sessions", "hits", "misses")}, indent=2))
+    elif "output" in reply:
+        print(f"Wrote {reply['output']} in {reply['seconds']:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
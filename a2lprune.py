@@ -0,0 +1,240 @@
+"""Cuts an A2L down to the characteristics a CSV needs, so it imports in seconds.
+
+    python3 a2lprune.py ecu.a2l default.csv [pruned.a2l]
+
+The CHARACTERISTICs named in the CSV are kept together with everything they
+depend on: their RECORD_LAYOUTs, COMPU_METHODs (and the COMPU_TAB / VTAB /
+VTAB_RANGE those refer to), AXIS_PTS and input MEASUREMENTs. So that shared
+axes still list all their users, the other characteristics using a kept
+axis are kept too. Other CHARACTERISTIC, AXIS_PTS, MEASUREMENT, conversion,
+RECORD_LAYOUT, FUNCTION and GROUP blocks of the module are dropped; the
+header, MOD_COMMON, MOD_PAR (with its MEMORY_SEGMENTs), units and IF_DATA
+are copied as they are.
+
+The A2L is streamed twice: once to index its blocks and once to copy what
+is kept, so memory does not grow with the file. a2l2xdf and a2l2xml run
+this with --prune and produce the same output as without it.
+"""
+import argparse
+import csv
+import hashlib
+import os
+import re
+
+import buildcache
+from a2lclean import cleaned_path, read_blocks, source_encodings
+
+PRUNABLE = {
+    "CHARACTERISTIC",
+    "AXIS_PTS",
+    "MEASUREMENT",
+    "COMPU_METHOD",
+    "COMPU_TAB",
+    "COMPU_VTAB",
+    "COMPU_VTAB_RANGE",
+    "RECORD_LAYOUT",
+    "FUNCTION",
+    "GROUP",
+}
+# Positions, counted from the name, of header parameters naming another object
+HEADER_REFERENCES = {
+    "CHARACTERISTIC": (4, 6),  # Deposit, Conversion
+    "AXIS_PTS": (3, 4, 6),  # InputQuantity, Deposit, Conversion
+    "MEASUREMENT": (3,),  # Conversion
+    "AXIS_DESCR": (1, 2),  # InputQuantity, Conversion
+}
+# Keywords followed by the name of another object
+REFERENCE_KEYWORDS = {"AXIS_PTS_REF", "CURVE_AXIS_REF", "COMPARISON_QUANTITY", "COMPU_TAB_REF", "STATUS_STRING_REF"}
+TOKENS = re.compile(
+    r'"(?:\\.|[^"\\])*"'  # String
+    r"|/\*.*?\*/"  # Block comment
+    r"|//[^\n]*"  # Line comment
+    r'|"|/\*'  # String or comment running past the end of the block
+    r'|[^\s"]+',
+    re.S,
+)
+
+
+class A2lIndex:
+    """The prunable blocks of an A2L module and the names each one refers to."""
+
+    def __init__(self):
+        self.blocks = []  # (type, name, start, end) in file order
+        self.references = {}
+        self.axis_users = {}
+
+    def add(self, block_type, name, start, end, references):
+        self.blocks.append((block_type, name, start, end))
+        if references:
+            entry = self.references.setdefault(name, {})
+            for kind, names in references.items():
+                entry.setdefault(kind, []).extend(names)
+        if block_type == "CHARACTERISTIC":
+            for axis_name in references.get("AXIS_PTS_REF", ()):
+                self.axis_users.setdefault(axis_name, []).append(name)
+
+    def keep(self, characteristic_names):
+        """Returns the names of the blocks needed by the characteristics, and the names the A2L lacks."""
+        known = {name for block_type, name, _, _ in self.blocks if block_type == "CHARACTERISTIC"}
+        wanted = [name for name in characteristic_names if name in known]
+        missing = [name for name in characteristic_names if name not in known]
+
+        axes = {axis_name for name in wanted for axis_name in self.references.get(name, {}).get("AXIS_PTS_REF", ())}
+        pending = wanted + [user for axis_name in axes for user in self.axis_users.get(axis_name, ())]
+        kept = set()
+        while pending:
+            name = pending.pop()
+            if name in kept:
+                continue
+            kept.add(name)
+            for names in self.references.get(name, {}).values():
+                pending.extend(names)
+        return kept, missing
+
+
+def index_a2l(src):
+    """Reads the block structure of an open A2L text stream into an A2lIndex."""
+    index = A2lIndex()
+    stack = []
+    current = None  # [type, start, header tokens, references] of the module-level block being read
+    current_depth = 0
+    nested_header = None  # Header tokens of an AXIS_DESCR inside it
+    expect = None  # "begin" or "end" after the keyword, waiting for the block type
+    begin_at = 0  # File position of the last /begin, or of its line when only blanks precede it
+    previous = None
+    carry = ""
+    offset = 0  # File position of the start of carry
+    for text in read_blocks(src):
+        buffer = carry + text
+        carry = ""
+        for match in TOKENS.finditer(buffer):
+            token = match.group()
+            if token == '"' or token == "/*":
+                carry = buffer[match.start():]
+                break
+            if token.startswith(("/*", "//")):
+                continue
+            if expect is not None:
+                if expect == "begin":
+                    if current is None and stack and stack[-1] == "MODULE" and token in PRUNABLE:
+                        current = [token, begin_at, [], {}]
+                    elif current is not None and token == "AXIS_DESCR":
+                        nested_header = []
+                    stack.append(token)
+                else:
+                    if stack:
+                        stack.pop()
+                    if current is not None and len(stack) == current_depth:
+                        end = match.end()
+                        line_end = buffer.find("\n", end)
+                        if line_end != -1 and not buffer[end:line_end].strip():
+                            end = line_end + 1
+                        block_type, start, header, references = current
+                        if header:
+                            index.add(block_type, header[0], start, offset + end, references)
+                        current = None
+                    elif token == "AXIS_DESCR":
+                        nested_header = None
+                expect = None
+            elif token == "/begin" or token == "/end":
+                expect = token[1:]
+                begin_at = match.start()
+                line_start = buffer.rfind("\n", 0, begin_at) + 1
+                if not buffer[line_start:begin_at].strip():
+                    begin_at = line_start
+                begin_at += offset  # The block type may only come in the next buffer
+                if token == "/begin" and current is None:
+                    current_depth = len(stack)
+            elif current is not None:
+                if nested_header is not None and len(nested_header) < 3:
+                    nested_header.append(token)
+                    if len(nested_header) - 1 in HEADER_REFERENCES["AXIS_DESCR"]:
+                        current[3].setdefault("AXIS_DESCR", []).append(token)
+                elif len(current[2]) < 9 and len(stack) == current_depth + 1:
+                    current[2].append(token)
+                    if len(current[2]) - 1 in HEADER_REFERENCES.get(current[0], ()):
+                        current[3].setdefault("HEADER", []).append(token)
+                if previous in REFERENCE_KEYWORDS:
+                    current[3].setdefault(previous, []).append(token)
+            previous = token
+        offset += len(buffer) - len(carry)
+    return index
+
+
+def copy_kept(src, out, index, kept):
+    """Copies an open A2L text stream to out without the blocks that are not kept."""
+    dropped = iter([(start, end) for _, name, start, end in index.blocks if name not in kept])
+    drop = next(dropped, None)
+    offset = 0
+    for text in read_blocks(src):
+        text_end = offset + len(text)
+        position = offset
+        while drop is not None and drop[0] < text_end:
+            start, end = drop
+            if start > position:
+                out.write(text[position - offset:start - offset])
+            position = max(position, end)
+            if end > text_end:
+                break
+            drop = next(dropped, None)
+        if position < text_end:
+            out.write(text[position - offset:])
+        offset = text_end
+
+
+def prune_a2l(source, destination, characteristic_names):
+    """Writes the part of source needed by characteristic_names to destination as UTF-8.
+
+    Returns (kept blocks, total blocks, missing characteristic names).
+    """
+    for encoding in source_encodings(source):
+        try:
+            with open(source, encoding=encoding, newline="") as src:
+                index = index_a2l(src)
+        except UnicodeDecodeError:
+            continue
+        kept, missing = index.keep(characteristic_names)
+        with open(source, encoding=encoding, newline="") as src, open(
+            destination, "w", encoding="utf-8", newline=""
+        ) as out:
+            copy_kept(src, out, index, kept)
+        return sum(1 for block in index.blocks if block[1] in kept), len(index.blocks), missing
+    raise ValueError(f"Could not decode {source}")
+
+
+def pruned_path(a2l_path, characteristic_names, a2l_digest=None):
+    """Where the A2L pruned to these characteristics is written.
+
+    Each set of names and each version of the A2L gets its own file; pass
+    a2l_digest (the A2L's sha256) when it is already known.
+    """
+    a2l_digest = a2l_digest or buildcache.file_digest(a2l_path)
+    names = "\n".join(sorted(set(characteristic_names)))
+    digest = hashlib.sha1(f"{a2l_digest}\n{names}".encode("utf-8")).hexdigest()[:10]
+    root, ext = os.path.splitext(a2l_path)
+    return f"{root}.pruned-{digest}{ext or '.a2l'}"
+
+
+def prepare_pruned(a2l_path, characteristic_names, a2l_digest=None):
+    """Returns the path of the A2L pruned to characteristic_names, writing it unless its database exists."""
+    destination = pruned_path(a2l_path, characteristic_names, a2l_digest)
+    if not any(os.path.exists(f"{candidate}db") for candidate in (destination, cleaned_path(destination))):
+        kept, total, missing = prune_a2l(a2l_path, destination, characteristic_names)
+        print(f"Pruned {a2l_path} into {destination}: kept {kept} of {total} blocks")
+    return destination
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cut an A2L down to the characteristics in a CSV and their dependencies.")
+    parser.add_argument("a2l")
+    parser.add_argument("csv", help="Tables to keep, see default.csv.")
+    parser.add_argument("output", nargs="?", help="Pruned A2L to write (default: <name>.pruned-<hash>.a2l).")
+    args = parser.parse_args()
+
+    with open(args.csv, encoding="utf-8-sig") as csvfile:
+        names = [row["Table Name"] for row in csv.DictReader(csvfile)]
+    output = args.output or pruned_path(args.a2l, names)
+    kept, total, missing = prune_a2l(args.a2l, output, names)
+    for name in missing:
+        print("******** Could not find ! ", name)
+    print(f"Pruned {args.a2l} into {output}: kept {kept} of {total} blocks")
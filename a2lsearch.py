@@ -0,0 +1,312 @@
+"""Full-text search over the characteristics of an A2L, for picking tables to put in a CSV.
+
+    python3 a2lsearch.py ecu.a2l ignition advance
+    python3 a2lsearch.py ecu.a2l "unit:rpm" 0xa081 --csv --no-header --category Ignition >> tables.csv
+
+An SQLite FTS5 index of every CHARACTERISTIC's name, long identifier,
+unit (from its COMPU_METHOD), FUNCTION / GROUP membership and address is
+built once into `<a2l>.searchdb`, straight from the A2L text, and rebuilt
+when the A2L's size or modification time changes. Names are indexed whole
+and split into words, so "adv" finds "ign_adv_base"; every term is a
+prefix, and all terms must match. A term may name a column (`name:`,
+`long:`, `unit:`, `function:`, `address:`); terms starting with 0x search
+addresses. Results are ranked by relevance, names first.
+
+--csv prints the results as default.csv rows (Category 1 is --category or
+the characteristic's first function) after a header row; --no-header leaves
+it out, for appending to an existing CSV. A2LSession.compare's search_term
+also uses this index to find its candidates instead of scanning every
+characteristic.
+"""
+import argparse
+import csv
+import os
+import re
+import sqlite3
+import sys
+
+from a2lclean import read_blocks, source_encodings
+from a2lprune import TOKENS
+
+SCHEMA_VERSION = "1"
+INDEXED = {"CHARACTERISTIC", "COMPU_METHOD", "FUNCTION", "GROUP"}
+MEMBER_BLOCKS = {"DEF_CHARACTERISTIC", "REF_CHARACTERISTIC"}
+COLUMNS = {"name": "name", "long": "long_identifier", "unit": "unit", "function": "functions", "address": "address"}
+CSV_HEADER = ["Category 1", "Category 2", "Category 3", "Table Name", "Custom Name"]
+WORD_BREAKS = re.compile(r"_+|(?<=[a-z0-9])(?=[A-Z])|(?<=[A-Za-z])(?=[0-9])")
+
+
+def index_path(a2l_path):
+    return f"{a2l_path}.searchdb"
+
+
+def unquote(token):
+    if len(token) >= 2 and token.startswith('"') and token.endswith('"'):
+        return token[1:-1].replace('\\"', '"').replace("\\\\", "\\")
+    return token
+
+
+def iter_tokens(src):
+    """Yields the tokens of an open A2L text stream, skipping comments."""
+    carry = ""
+    for text in read_blocks(src):
+        buffer = carry + text
+        carry = ""
+        for match in TOKENS.finditer(buffer):
+            token = match.group()
+            if token == '"' or token == "/*":
+                carry = buffer[match.start():]
+                break
+            if not token.startswith(("/*", "//")):
+                yield token
+
+
+def read_a2l(src):
+    """Reads what the index needs from an open A2L text stream.
+
+    Returns (characteristics, units, members): characteristic header lists
+    [name, long identifier, type, address, deposit, max diff, conversion],
+    {compu method: unit} and {characteristic: [functions and groups]}.
+    """
+    characteristics = []
+    units = {}
+    members = {}
+    stack = []
+    current = None  # [type, header tokens] of the indexed block being read
+    current_depth = 0
+    expect = None
+    for token in iter_tokens(src):
+        if expect is not None:
+            if expect == "begin":
+                if current is None and token in INDEXED:
+                    current = [token, []]
+                    current_depth = len(stack) + 1
+                stack.append(token)
+            else:
+                if stack:
+                    stack.pop()
+                if current is not None and len(stack) < current_depth:
+                    block_type, header = current
+                    if block_type == "CHARACTERISTIC" and len(header) >= 7:
+                        characteristics.append(header[:7])
+                    elif block_type == "COMPU_METHOD" and len(header) >= 5:
+                        units[header[0]] = unquote(header[4])
+                    current = None
+            expect = None
+        elif token == "/begin" or token == "/end":
+            expect = token[1:]
+        elif current is not None:
+            block_type, header = current
+            if len(stack) == current_depth:
+                if len(header) < 7:
+                    header.append(token)
+            elif block_type in ("FUNCTION", "GROUP") and stack[-1] in MEMBER_BLOCKS and header:
+                members.setdefault(token, []).append(header[0])
+    return characteristics, units, members
+
+
+def name_words(name):
+    return " ".join(word for word in WORD_BREAKS.split(name) if word)
+
+
+def address_text(address):
+    """The forms an address is searched by: 0x-prefixed and bare lowercase hex."""
+    try:
+        value = int(address, 0)
+    except ValueError:
+        return address.lower()
+    return f"0x{value:x} {value:x}"
+
+
+def build_index(a2l_path, destination=None):
+    """Writes the search index of an A2L and returns its path.
+
+    The A2L itself is read, never its cleaned copy, which may predate it.
+    """
+    destination = destination or index_path(a2l_path)
+    for encoding in source_encodings(a2l_path):
+        try:
+            with open(a2l_path, encoding=encoding, newline="") as src:
+                characteristics, units, members = read_a2l(src)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        raise ValueError(f"Could not decode {a2l_path}")
+
+    temporary = f"{destination}.tmp"
+    if os.path.exists(temporary):
+        os.remove(temporary)
+    connection = sqlite3.connect(temporary)
+    connection.execute("PRAGMA journal_mode = OFF")  # A fresh file, replaced atomically once complete
+    connection.execute("PRAGMA synchronous = OFF")
+    with connection:
+        connection.executescript(
+            """
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE characteristics (
+                id INTEGER PRIMARY KEY, name TEXT, long_identifier TEXT, type TEXT,
+                address INTEGER, unit TEXT, conversion TEXT, functions TEXT
+            );
+            CREATE INDEX characteristics_name ON characteristics (name);
+            CREATE VIRTUAL TABLE words USING fts5(
+                name, name_words, long_identifier, unit, functions, address,
+                content='', tokenize="unicode61 tokenchars '_'", prefix='2 3'
+            );
+            CREATE VIRTUAL TABLE substrings USING fts5(text, content='', tokenize='trigram');
+            """
+        )
+        rows = []
+        for number, (name, long_identifier, block_type, address, _, _, conversion) in enumerate(characteristics, 1):
+            long_identifier = unquote(long_identifier)
+            try:
+                address_value = int(address, 0)
+            except ValueError:
+                address_value = None
+            rows.append(
+                (number, name, long_identifier, block_type, address_value, units.get(conversion, ""), conversion,
+                 ", ".join(members.get(name, [])))
+            )
+        connection.executemany("INSERT INTO characteristics VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        connection.executemany(
+            "INSERT INTO words (rowid, name, name_words, long_identifier, unit, functions, address) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(row[0], row[1], name_words(row[1]), row[2], row[5], row[7], address_text(address))
+             for row, (_, _, _, address, _, _, _) in zip(rows, characteristics)],
+        )
+        connection.executemany(
+            "INSERT INTO substrings (rowid, text) VALUES (?, ?)", [(row[0], row[1] + row[2]) for row in rows]
+        )
+        stat = os.stat(a2l_path)
+        connection.executemany(
+            "INSERT INTO meta VALUES (?, ?)",
+            [("schema", SCHEMA_VERSION), ("size", str(stat.st_size)), ("mtime", str(stat.st_mtime_ns))],
+        )
+    connection.close()
+    os.replace(temporary, destination)
+    return destination
+
+
+def is_current(a2l_path, destination=None):
+    destination = destination or index_path(a2l_path)
+    if not os.path.exists(destination):
+        return False
+    try:
+        connection = sqlite3.connect(destination)
+        try:
+            meta = dict(connection.execute("SELECT key, value FROM meta"))
+        finally:
+            connection.close()
+    except sqlite3.DatabaseError:
+        return False
+    stat = os.stat(a2l_path)
+    return meta == {"schema": SCHEMA_VERSION, "size": str(stat.st_size), "mtime": str(stat.st_mtime_ns)}
+
+
+def fts_query(text):
+    """Turns search text into an FTS5 query: every term a prefix, all terms required."""
+    terms = []
+    for term in text.split():
+        column = None
+        if ":" in term and term.split(":", 1)[0].lower() in COLUMNS:
+            column, term = term.split(":", 1)
+            column = COLUMNS[column.lower()]
+        elif term.lower().startswith("0x"):
+            column = "address"
+        if not term:
+            continue
+        phrase = '"' + term.lower().replace('"', '""') + '"*'
+        if column == "name":
+            terms.append("{name name_words} : " + phrase)
+        elif column:
+            terms.append(f"{column} : {phrase}")
+        else:
+            terms.append(phrase)
+    return " AND ".join(terms)
+
+
+class SearchIndex:
+    """The search index of one A2L, built or rebuilt on opening if needed."""
+
+    def __init__(self, a2l_path):
+        self.a2l_path = a2l_path
+        if not is_current(a2l_path):
+            build_index(a2l_path)
+        self.connection = sqlite3.connect(index_path(a2l_path))
+
+    def search(self, text, limit=50):
+        """Returns dicts with name, long_identifier, type, address, unit, conversion and functions, best first."""
+        query = fts_query(text)
+        if not query:
+            return []
+        cursor = self.connection.execute(
+            """
+            SELECT c.name, c.long_identifier, c.type, c.address, c.unit, c.conversion, c.functions
+            FROM words JOIN characteristics c ON c.id = words.rowid
+            WHERE words MATCH ? ORDER BY bm25(words, 10.0, 5.0, 2.0, 1.0, 1.0, 1.0) LIMIT ?
+            """,
+            (query, limit),
+        )
+        keys = ("name", "long_identifier", "type", "address", "unit", "conversion", "functions")
+        return [dict(zip(keys, row)) for row in cursor]
+
+    def containing(self, term):
+        """Returns the (name, long identifier) whose concatenation contains term, sorted by name.
+
+        Matches the search_term test of a2lbincompare. Returns None for terms
+        under three characters, which the trigram index cannot look up.
+        """
+        if len(term) < 3:
+            return None
+        cursor = self.connection.execute(
+            """
+            SELECT c.name, c.long_identifier FROM substrings JOIN characteristics c ON c.id = substrings.rowid
+            WHERE substrings MATCH ? ORDER BY c.name
+            """,
+            ('"' + term.replace('"', '""') + '"',),
+        )
+        return [(name, long_identifier) for name, long_identifier in cursor if term in name + long_identifier]
+
+    def close(self):
+        self.connection.close()
+
+
+def csv_rows(results, category=None):
+    """default.csv rows for search results."""
+    return [
+        [category or (result["functions"].split(", ")[0] if result["functions"] else ""), "", "", result["name"], ""]
+        for result in results
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search the characteristics of an A2L.")
+    parser.add_argument("a2l")
+    parser.add_argument("terms", nargs="+", help="Words to search for; each is a prefix, all must match.")
+    parser.add_argument("-n", "--limit", type=int, default=50, help="Most results to show (default: 50).")
+    parser.add_argument("--csv", action="store_true", help="Print the results as default.csv rows.")
+    parser.add_argument("--no-header", action="store_true", help="With --csv, leave out the header row, to append to a CSV.")
+    parser.add_argument("--category", help="With --csv, Category 1 for every row (default: the first function).")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the index even if the A2L is unchanged.")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        build_index(args.a2l)
+    index = SearchIndex(args.a2l)
+    results = index.search(" ".join(args.terms), args.limit)
+    index.close()
+    if args.csv:
+        writer = csv.writer(sys.stdout, lineterminator="\n")
+        if not args.no_header:
+            writer.writerow(CSV_HEADER)
+        writer.writerows(csv_rows(results, args.category))
+        return
+    for result in results:
+        address = hex(result["address"]) if result["address"] is not None else "?"
+        unit = f" [{result['unit']}]" if result["unit"] else ""
+        print(f"{result['name']} : {result['long_identifier']}{unit} @ {address}")
+    if not results:
+        print("No matches")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""An open A2L database and its caches, shared by the converters.
+
+    from a2lsession import A2LSession, read_rows
+
+    a2l = A2LSession("ecu.a2l")
+    a2l.to_xdf(read_rows("default.csv"), "ecu.xdf")
+    a2l.to_xml(read_rows("default.csv"), "ecu.xml")
+    for name, long_identifier in a2l.compare("a.bin", "b.bin"):
+        print(name, long_identifier)
+
+The A2L is imported into `<a2l>db` on first use and reopened from there
+afterwards. A2Ls that need it are first cleaned into `<a2l>.clean.a2l` (see
+a2lclean), whose database is reused the same way. Passing keep (a list of
+characteristic names) imports an A2L pruned to them instead (see a2lprune).
+The sha256 of the A2L a database was imported from is recorded next to it
+in `<database>.source`; a database whose A2L has changed since is imported
+again.
+Characteristic lookups are cached for the life of the session, so running
+many jobs against one session only reads each characteristic once.
+"""
+import csv
+import json
+import os
+from os import path
+
+from pya2l import DB, model
+from pya2l.api import inspect
+
+import a2lclean
+import a2lprune
+import buildcache
+
+COMPARE_OFFSET = 0xA0800000  # Flash address of the first byte of a bin
+
+
+def read_rows(csv_path):
+    """Reads a table CSV (see default.csv) into a list of row dicts."""
+    with open(csv_path, encoding="utf-8-sig") as csvfile:
+        return list(csv.DictReader(csvfile))
+
+
+def source_record_path(source):
+    """The file recording which A2L content the database of source (an A2L or its cleaned or pruned copy) came from."""
+    return f"{source}db.source"
+
+
+def read_source_record(source):
+    try:
+        with open(source_record_path(source), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def a2l_record(a2l_path):
+    """The size, modification time and sha256 of a2l_path, rehashed only when it changed since its import."""
+    previous = read_source_record(a2l_path) or read_source_record(a2lclean.cleaned_path(a2l_path))
+    return buildcache.file_record(a2l_path, previous)
+
+
+def current_database(source, record):
+    """Returns source or its cleaned copy, whichever has a database imported from the A2L in record, or None."""
+    for candidate in (source, a2lclean.cleaned_path(source)):
+        recorded = read_source_record(candidate)
+        if path.exists(f"{candidate}db") and recorded is not None and recorded["sha256"] == record["sha256"]:
+            return candidate
+    return None
+
+
+def remove_source_databases(source):
+    for candidate in (source, a2lclean.cleaned_path(source)):
+        for database_file in (f"{candidate}db", source_record_path(candidate)):
+            if path.exists(database_file):
+                os.remove(database_file)
+
+
+class A2LSession:
+    def __init__(self, a2l_path, clean=True, keep=None):
+        self.a2l_path = a2l_path
+        self.db = DB()
+        record = a2l_record(a2l_path)
+        source = a2lprune.prepare_pruned(a2l_path, keep, record["sha256"]) if keep is not None else a2l_path
+        database = current_database(source, record)
+        if database is not None:
+            self.session = self.db.open_existing(database)
+        else:
+            remove_source_databases(source)  # Imported from an older version of the A2L, if any
+            if clean:
+                # Cleaned or not, the file to import is UTF-8 now; pya2l defaults to latin-1
+                database = a2lclean.prepare_import(source)
+                self.session = self.db.import_a2l(database, encoding="utf-8")
+            else:
+                database = source
+                self.session = self.db.import_a2l(source)
+            with open(source_record_path(database), "w", encoding="utf-8") as f:
+                json.dump(record, f)
+        self.base_offset = (
+            self.session.query(model.MemorySegment)
+            .filter(model.MemorySegment.name == "_ROM")
+            .first()
+            .address
+        )
+        self._characteristics = {}
+        self._names = None
+        self._axis_users = None
+
+    def characteristic(self, name, cache=True):
+        """Returns the inspect.Characteristic called name, or None if the A2L has none."""
+        if name in self._characteristics:
+            return self._characteristics[name]
+        found = (
+            self.session.query(model.Characteristic)
+            .filter(model.Characteristic.name == name)
+            .first()
+        )
+        c_data = inspect.Characteristic(self.session, name) if found is not None else None
+        if cache:
+            self._characteristics[name] = c_data
+        return c_data
+
+    def extract(self, rows, convert, chunk_size=None):
+        """Yields convert(characteristic, row) for each CSV row, printing the rows the A2L lacks.
+
+        convert should return a plain record. With chunk_size, characteristics
+        are not cached and the session's ORM objects are expunged after every
+        chunk_size rows, so memory follows the chunk rather than the A2L.
+        """
+        for position, row in enumerate(rows, 1):
+            tablename = row["Table Name"]
+            c_data = self.characteristic(tablename, cache=chunk_size is None)
+            if c_data is None:
+                print("******** Could not find ! ", tablename)
+            else:
+                yield convert(c_data, row)
+            if chunk_size and position % chunk_size == 0:
+                c_data = None
+                self.release()
+        if chunk_size:
+            self.release()
+
+    def release(self):
+        """Drops the cached characteristics and every ORM object the session holds."""
+        self._characteristics.clear()
+        self.session.expunge_all()
+
+    def characteristic_names(self):
+        """Returns (name, longIdentifier) for every characteristic, sorted by name."""
+        if self._names is None:
+            self._names = [
+                (c.name, c.longIdentifier)
+                for c in self.session.query(model.Characteristic).order_by(model.Characteristic.name).all()
+            ]
+        return self._names
+
+    def matching_names(self, search_term):
+        """Returns (name, longIdentifier) for each characteristic whose name + longIdentifier contains search_term.
+
+        Candidates are looked up in the A2L's search index (see a2lsearch)
+        rather than by scanning every characteristic.
+        """
+        import a2lsearch
+
+        names = self.characteristic_names()
+        candidates = None
+        if path.exists(self.a2l_path):
+            index = a2lsearch.SearchIndex(self.a2l_path)
+            try:
+                candidates = index.containing(search_term)
+            finally:
+                index.close()
+        if candidates is None:
+            return [(name, long_identifier) for name, long_identifier in names if search_term in (name + long_identifier)]
+        known = dict(names)
+        found = sorted({name for name, _ in candidates if name in known})
+        return [(name, known[name]) for name in found if search_term in (name + known[name])]
+
+    def axis_users(self):
+        """Returns {AXIS_PTS name: [characteristic names]} for every axis referenced in the A2L.
+
+        Read in one joined query rather than by inspecting each characteristic.
+        """
+        if self._axis_users is None:
+            self._axis_users = {}
+            query = (
+                self.session.query(model.Characteristic.name, model.AxisPtsRef.axisPoints)
+                .join(model.Characteristic.axis_descr)
+                .join(model.AxisDescr.axis_pts_ref)
+                .order_by(model.Characteristic.name)
+            )
+            for characteristic_name, axis_pts_name in query:
+                users = self._axis_users.setdefault(axis_pts_name, [])
+                if not users or users[-1] != characteristic_name:
+                    users.append(characteristic_name)
+        return self._axis_users
+
+    def to_xdf(self, rows, output=None, title=None, validate=True, chunk_size=None):
+        """Renders the XDF for the table rows; writes it to output when given and returns the text.
+
+        Unless validate is False, overlapping, duplicate and out-of-region
+        tables are printed as warnings. chunk_size bounds memory, see extract.
+        """
+        import a2l2xdf
+        import xdfvalidate
+
+        table_defs = list(a2l2xdf.table_defs_from_rows(self, rows, chunk_size))
+        if validate:
+            xdfvalidate.print_issues(a2l2xdf.validate_table_defs(table_defs))
+        text = a2l2xdf.render_xdf(table_defs, title or self.a2l_path)
+        if output is not None:
+            a2l2xdf.write_xdf(text, output)
+        return text
+
+    def to_xml(self, rows, output=None, title=None, chunk_size=None):
+        """Builds the XML mappack for the table rows; writes it to output when given and returns the root."""
+        import a2l2xml
+
+        root = a2l2xml.build_xml(self, rows, title or self.a2l_path, chunk_size)
+        if output is not None:
+            a2l2xml.write_xml(root, output)
+        return root
+
+    def compare(self, bin_a, bin_b, other=None, search_term=None, offset=COMPARE_OFFSET):
+        """Returns (name, longIdentifier) of each characteristic whose data differs between two bins.
+
+        bin_a is read with this A2L and bin_b with other (default: this A2L).
+        Bins may be paths or bytes.
+        """
+        import a2lbincompare
+
+        return a2lbincompare.compare(self, read_bin(bin_a), other or self, read_bin(bin_b), search_term, offset)
+
+    def close(self):
+        """Closes the database, releasing pya2l's exclusive lock so it can be opened again."""
+        self._characteristics.clear()
+        self._axis_users = None
+        engine = self.session.get_bind()
+        self.session.close()
+        engine.dispose()
+
+
+def read_bin(bin_file):
+    if isinstance(bin_file, (bytes, bytearray, memoryview)):
+        return bin_file
+    with open(bin_file, "rb") as f:
+        return f.read()
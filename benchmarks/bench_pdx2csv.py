@@ -0,0 +1,68 @@
+"""Times the pdx2csv index, DTC and DID passes over synthetic ODX at several sizes.
+
+Each size is generated into a temporary directory with odxgen, then parsed
+and extracted once for timings and once under tracemalloc for peak memory.
+
+    python benchmarks/bench_pdx2csv.py [--sizes 1000,5000,20000] [--repeat 3]
+"""
+import argparse
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pdx2csv  # noqa: E402
+from odxgen import generate  # noqa: E402
+
+
+def run_passes(directory):
+    """Runs the index, DTC and DID passes, returning their durations and counts."""
+    start = time.perf_counter()
+    pdx2csv.open_source(directory)
+    indexes = pdx2csv.index_layers()
+    indexed = time.perf_counter()
+    dtcs = pdx2csv.extract_dtcs(indexes)
+    dtc_done = time.perf_counter()
+    diag_info, routines = pdx2csv.extract_identifiers(indexes)
+    did_done = time.perf_counter()
+    return {
+        "index": indexed - start,
+        "dtc": dtc_done - indexed,
+        "did": did_done - dtc_done,
+        "dtcs": len(dtcs),
+        "dids": len(diag_info) + len(routines),
+    }
+
+
+def peak_memory(directory):
+    tracemalloc.start()
+    run_passes(directory)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def bench(sizes, repeat):
+    print(f"{'IDs':>8} {'DTCs':>8} {'index s':>9} {'DTC s':>9} {'DID s':>9} {'peak MiB':>9}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            generate(directory, dtcs=size, dids=size)
+            runs = [run_passes(directory) for _ in range(repeat)]
+            best = {phase: min(run[phase] for run in runs) for phase in ("index", "dtc", "did")}
+            peak = peak_memory(directory)
+        print(
+            f"{runs[0]['dids']:>8} {runs[0]['dtcs']:>8} {best['index']:>9.3f} {best['dtc']:>9.3f} "
+            f"{best['did']:>9.3f} {peak / 2**20:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark pdx2csv on synthetic ODX.")
+    parser.add_argument("--sizes", default="1000,5000,20000", help="Comma separated DTC/DID counts.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per size; the best is reported.")
+    args = parser.parse_args()
+
+    bench([int(size) for size in args.sizes.split(",")], args.repeat)
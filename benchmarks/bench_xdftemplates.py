@@ -0,0 +1,113 @@
+"""Compares a2l2xdf's element writers with the xdftemplates fragments.
+
+Synthetic table_defs (tables with one or two axes, constants, shared axes,
+custom names with markup characters) are rendered both ways. The encoded
+documents must be identical; the time for each writer is reported.
+
+    python benchmarks/bench_xdftemplates.py [--tables 20000] [--repeat 3]
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import a2l2xdf
+import xmlbackend
+
+DATA_TYPES = ["UBYTE", "SBYTE", "UWORD", "SWORD", "ULONG", "FLOAT32_IEEE"]
+
+
+def synthetic_axis(rng, index):
+    length = rng.choice([4, 8, 12, 16])
+    return {
+        "name": f"AX_{index}",
+        "units": rng.choice(["rpm", "°C", "%", ""]),
+        "min": 0.0,
+        "max": float(rng.choice([100, 6000, 255])),
+        "address": hex(0x10000 + index * 0x40 + 1),
+        "length": length,
+        "dataSize": rng.choice(DATA_TYPES[:4]),
+        "math": rng.choice(["X", "((0.25 * X) - 0.0 ) / (1.0 - (0.0 * X))"]),
+        "users": [f"CHR_{rng.randrange(100000):05d}" for _ in range(rng.randrange(4))],
+    }
+
+
+def synthetic_table_defs(count, seed=0):
+    rng = random.Random(seed)
+    axes = [synthetic_axis(rng, index) for index in range(max(1, count // 8))]
+    table_defs = []
+    address = 0x80000
+    for index in range(count):
+        table_def = {
+            "title": rng.choice([f"Map {index}", f"Limit <{index}> & \"clip\"", ""]),
+            "description": f"CHR_{index:05d}",
+            "category": f"Category {rng.randrange(20)}",
+            "z": {
+                "min": 0.0,
+                "max": 255.0,
+                "address": hex(address),
+                "dataSize": rng.choice(DATA_TYPES),
+                "units": rng.choice(["-", "Nm", "°C", ""]),
+                "math": rng.choice(["X", "((0.75 * X) - 40.0 ) / (1.0 - (0.0 * X))"]),
+            },
+        }
+        if rng.random() < 0.3:
+            table_def["sub_category"] = f"Sub {rng.randrange(5)}"
+        if rng.random() < 0.1:
+            table_def["subsub_category"] = "Deep"
+        kind = rng.random()
+        if kind < 0.1:
+            table_def["constant"] = True
+        elif kind < 0.9:
+            table_def["x"] = rng.choice(axes)
+            table_def["z"]["length"] = table_def["x"]["length"]
+            table_def["description"] += f'\nX: {table_def["x"]["name"]}'
+            if kind > 0.4:
+                table_def["y"] = rng.choice(axes)
+                table_def["z"]["rows"] = table_def["y"]["length"]
+                table_def["description"] += f'\nY: {table_def["y"]["name"]}'
+        table_defs.append(table_def)
+        address += 0x200
+    return table_defs
+
+
+def best_of(repeat, function):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tables", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    table_defs = synthetic_table_defs(args.tables)
+    elements, tree_bytes = best_of(
+        args.repeat, lambda: xmlbackend.tostring(a2l2xdf.build_xdf(table_defs, "synthetic.a2l"))
+    )
+    templates, template_bytes = best_of(
+        args.repeat,
+        lambda: a2l2xdf.render_xdf(table_defs, "synthetic.a2l").encode("us-ascii", "xmlcharrefreplace"),
+    )
+
+    print(f"{args.tables} tables, {len(tree_bytes)} bytes, XML backend: {xmlbackend.BACKEND}")
+    print(f"  elements + write: {elements:.3f}s")
+    print(f"  templates:        {templates:.3f}s ({elements / templates:.1f}x)")
+    if tree_bytes != template_bytes:
+        print("******** Outputs differ")
+        raise SystemExit(1)
+    print("  outputs identical")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Compares the lxml and ElementTree backends of xmlbackend.py.
+
+Synthetic ODX and JSON mappack inputs are generated once; each backend then
+runs in its own interpreter (A2L2XDF_XML_BACKEND selects it) to time the
+pdx2csv passes, json2xdf and plain XDF serialization. The outputs of both
+backends are compared byte for byte.
+
+    python benchmarks/bench_xmlbackend.py [--dids 2000] [--maps 20000]
+"""
+import argparse
+import filecmp
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+BACKENDS = ["etree", "lxml"]
+
+
+def worker(directory):
+    """Runs inside the per-backend interpreter and prints its timings as JSON."""
+    import xml.etree.ElementTree as ET
+
+    import json2xdf
+    import pdx2csv
+    import xmlbackend
+
+    directory = Path(directory)
+    output = directory / xmlbackend.BACKEND
+    output.mkdir(exist_ok=True)
+    timings = {}
+
+    start = time.perf_counter()
+    ecu, dtcs, diag_info, routines = pdx2csv.extract(directory / "odx")
+    timings["pdx2csv"] = time.perf_counter() - start
+    pdx2csv.write_csv(output / "dtc.csv", pdx2csv.dtc_fieldnames, dtcs)
+    pdx2csv.write_csv(output / "diag.csv", pdx2csv.diag_fieldnames, diag_info)
+    pdx2csv.write_csv(output / "routines.csv", pdx2csv.diag_fieldnames, routines)
+
+    start = time.perf_counter()
+    json2xdf.json_to_xdf(str(directory / "mappack.json"), str(output / "mappack.xdf"), "0x200000")
+    timings["json2xdf"] = time.perf_counter() - start
+
+    root = xmlbackend.parse(str(output / "mappack.xdf"))
+    start = time.perf_counter()
+    xmlbackend.tostring(root, encoding="utf-8")
+    timings["serialize"] = time.perf_counter() - start
+    if xmlbackend.BACKEND == "etree":
+        start = time.perf_counter()
+        ET.tostring(root, encoding="utf-8")
+        timings["serialize (ElementTree.write)"] = time.perf_counter() - start
+
+    print(json.dumps({"backend": xmlbackend.BACKEND, "timings": timings}))
+
+
+def run_backend(backend, directory):
+    env = dict(os.environ, A2L2XDF_XML_BACKEND=backend)
+    result = subprocess.run(
+        [sys.executable, __file__, "--worker", directory], env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def bench(dids, maps):
+    from mappackgen import generate as generate_mappack
+    from odxgen import generate as generate_odx
+
+    with tempfile.TemporaryDirectory() as directory:
+        generate_odx(Path(directory) / "odx", dtcs=dids, dids=dids)
+        generate_mappack(Path(directory) / "mappack.json", maps=maps)
+
+        results = {}
+        for backend in BACKENDS:
+            result = run_backend(backend, directory)
+            if result["backend"] != backend:
+                print(f"{backend} is not installed, skipping")
+                continue
+            results[backend] = result["timings"]
+
+        steps = sorted({step for timings in results.values() for step in timings})
+        print(f"{'step':<32}" + "".join(f"{backend:>10}" for backend in results))
+        for step in steps:
+            print(f"{step:<32}" + "".join(
+                f"{timings[step]:>10.3f}" if step in timings else f"{'-':>10}" for timings in results.values()
+            ))
+
+        if len(results) > 1:
+            names = ["dtc.csv", "diag.csv", "routines.csv", "mappack.xdf"]
+            _, mismatch, errors = filecmp.cmpfiles(
+                Path(directory) / BACKENDS[0], Path(directory) / BACKENDS[1], names, shallow=False
+            )
+            if mismatch or errors:
+                print(f"******** Outputs differ between backends: {mismatch + errors}")
+                return False
+            print("Outputs are byte for byte identical")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the XML backends.")
+    parser.add_argument("--dids", type=int, default=2000, help="DTCs and identifiers in the synthetic ODX.")
+    parser.add_argument("--maps", type=int, default=20000, help="Maps in the synthetic mappack.")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker)
+    else:
+        raise SystemExit(0 if bench(args.dids, args.maps) else 1)
@@ -0,0 +1,71 @@
+"""Generates a synthetic JSON mappack in the shape json2xdf.py reads.
+
+    python benchmarks/mappackgen.py <file.json> [--groups N] [--maps N]
+"""
+import argparse
+import json
+import random
+
+
+def synthetic_map(index, address, rng):
+    width = rng.choice([1, 4, 8, 12, 16])
+    height = rng.choice([1, 1, 6, 8, 16]) if width > 1 else 1
+    lohi = rng.random() < 0.7
+    element_bytes = 2 if lohi else 1
+    json_map = {
+        "name": f"Synthetic map {index}",
+        "map_id": f"SYN_{index:06d}",
+        "address": address,
+        "width": width,
+        "height": height,
+        "data_organization": "LOHI" if lohi else "BYTE",
+        "factor": rng.choice([1.0, 0.1, 0.0234375, 0.75]),
+        "addition": rng.choice([0.0, -40.0, -48.0]),
+        "precision": rng.choice([0, 1, 2]),
+        "z_units": rng.choice(["°C", "%", "mg/stroke", "Nm", ""]),
+    }
+    next_address = address + width * height * element_bytes
+    if width > 1:
+        json_map["x"] = {
+            "address": next_address,
+            "size": width,
+            "data_organization": "LOHI",
+            "units": "1/min",
+            "axis_id": f"X axis {index}",
+        }
+        next_address += width * 2
+    if height > 1:
+        json_map["y"] = {
+            "address": next_address,
+            "size": height,
+            "data_organization": "LOHI",
+            "factor": 0.01,
+            "units": "mg/stroke",
+        }
+        next_address += height * 2
+    return json_map, next_address
+
+
+def generate(path, groups=50, maps=5000, base_offset=0x200000, seed=0):
+    """Writes a mappack of maps spread across groups to path."""
+    rng = random.Random(seed)
+    address = base_offset + 0x1000
+    map_groups = [{"name": f"Group {index}", "maps": []} for index in range(groups)]
+    for index in range(maps):
+        json_map, address = synthetic_map(index, address, rng)
+        map_groups[rng.randrange(groups)]["maps"].append(json_map)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"filename": "Synthetic mappack", "maps": map_groups}, f, ensure_ascii=False)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic JSON mappack for json2xdf.")
+    parser.add_argument("json_file", help="Output JSON file.")
+    parser.add_argument("--groups", type=int, default=50)
+    parser.add_argument("--maps", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    generate(args.json_file, args.groups, args.maps, seed=args.seed)
+    print(f"Synthetic mappack written to {args.json_file}")
@@ -0,0 +1,225 @@
+"""Generates synthetic ODX layers shaped like a real engine PDX.
+
+The EV layer carries the DTCs, the DOP_TEXTTABLERecorDataIdentMeasuValue
+identifier table and $22/$31 DIAG-SERVICEs with constant identifiers.
+BL_LIBEnginContrModulUDS holds the identifier and routine TABLE-ROWs, whose
+STRUCTURE-REFs point (via DOCREF) at a shared BV layer of STRUCTUREs and DOPs,
+whose UNIT-REFs in turn point at a BL layer of UNITs.
+
+    python benchmarks/odxgen.py <directory> [--dtcs N] [--dids N] [--routines N] [--services N]
+"""
+import argparse
+import random
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+ODX_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n<ODX MODEL-VERSION="2.2.0" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\n'
+ODX_FOOTER = '</ODX>\n'
+
+SHARED_LAYER = "BV_SynthShared"
+UNITS_LAYER = "BL_LIBSynthUnits"
+
+UNITS = ["1/min", "km/h", "°C", "hPa", "%", "V", "mg/stroke", "Nm", "ms", "lambda"]
+BASE_DATA_TYPES = [("A_UINT32", 8), ("A_UINT32", 16), ("A_INT32", 16), ("A_UINT32", 32)]
+
+
+def layer(tag, layer_id, body, services=""):
+    container = tag + "S"
+    return (
+        f'{ODX_HEADER}<DIAG-LAYER-CONTAINER ID="DLC_{layer_id}"><SHORT-NAME>{layer_id}</SHORT-NAME>\n'
+        f'<{container}><{tag} ID="{layer_id}"><SHORT-NAME>{layer_id}</SHORT-NAME>\n'
+        f'{services}<DIAG-DATA-DICTIONARY-SPEC>\n{body}</DIAG-DATA-DICTIONARY-SPEC>\n'
+        f'</{tag}></{container}></DIAG-LAYER-CONTAINER>\n{ODX_FOOTER}'
+    )
+
+
+def coded_const(name, semantic, position, value, bits=8):
+    return (
+        f'<PARAM SEMANTIC="{semantic}" xsi:type="CODED-CONST"><SHORT-NAME>{name}</SHORT-NAME>'
+        f'<BYTE-POSITION>{position}</BYTE-POSITION><CODED-VALUE>{value}</CODED-VALUE>'
+        f'<DIAG-CODED-TYPE BASE-DATA-TYPE="A_UINT32" xsi:type="STANDARD-LENGTH-TYPE"><BIT-LENGTH>{bits}</BIT-LENGTH></DIAG-CODED-TYPE></PARAM>'
+    )
+
+
+def diag_services(services, structures, dops, rng):
+    """$22 reads and $31 routine starts with constant identifiers, split evenly."""
+    comms, requests, responses = [], [], []
+    for index in range(services):
+        if index % 2:
+            name, params = f"RoutiStart{index}", [
+                coded_const("SID", "SERVICE-ID", 0, 0x31),
+                coded_const("RoutiContrType", "SUBFUNCTION", 1, 1),
+                coded_const("RoutiIdent", "ID", 2, 0x0200 + index, 16),
+            ]
+        else:
+            name, params = f"ReadDataByIdent{index}", [
+                coded_const("SID", "SERVICE-ID", 0, 0x22),
+                coded_const("DataIdent", "ID", 1, 0x8000 + index, 16),
+            ]
+        comms.append(
+            f'<DIAG-SERVICE ID="DS_{name}"><SHORT-NAME>{name}</SHORT-NAME><LONG-NAME>Synthetic service {index}</LONG-NAME>'
+            f'<REQUEST-REF ID-REF="RQ_{name}"/><POS-RESPONSE-REFS><POS-RESPONSE-REF ID-REF="PR_{name}"/></POS-RESPONSE-REFS>'
+            '</DIAG-SERVICE>\n'
+        )
+        requests.append(f'<REQUEST ID="RQ_{name}"><SHORT-NAME>RQ_{name}</SHORT-NAME><PARAMS>{"".join(params)}</PARAMS></REQUEST>\n')
+        responses.append(
+            f'<POS-RESPONSE ID="PR_{name}"><SHORT-NAME>PR_{name}</SHORT-NAME><PARAMS>'
+            f'<PARAM SEMANTIC="DATA" xsi:type="VALUE"><SHORT-NAME>Value</SHORT-NAME><BYTE-POSITION>3</BYTE-POSITION>'
+            f'<DOP-REF ID-REF="DOP_Synth{rng.randrange(dops)}" DOCREF="{SHARED_LAYER}" DOCTYPE="LAYER"/></PARAM>'
+            '</PARAMS></POS-RESPONSE>\n'
+        )
+    return (
+        f'<DIAG-COMMS>\n{"".join(comms)}</DIAG-COMMS>\n<REQUESTS>\n{"".join(requests)}</REQUESTS>\n'
+        f'<POS-RESPONSES>\n{"".join(responses)}</POS-RESPONSES>\n'
+    )
+
+
+def did_key(index):
+    return f"SynthMeasuValue{index:05d}"
+
+
+def ev_layer(dtcs, dids, services, structures, dops, rng):
+    parts = ['<DTC-DOPS><DTC-DOP ID="DTCDOP_Synth"><SHORT-NAME>DTCDOP_Synth</SHORT-NAME><DTCS>\n']
+    for index in range(dtcs):
+        code = 0x010000 + index
+        parts.append(
+            f'<DTC ID="DTC_{index}" OID="DTC_Synth_{index:05d}"><SHORT-NAME>DTC_{index}</SHORT-NAME>'
+            f'<TROUBLE-CODE>{code}</TROUBLE-CODE><DISPLAY-TROUBLE-CODE>P{code & 0xFFFF:04X}</DISPLAY-TROUBLE-CODE>'
+            f'<TEXT>Synthetic fault {index}</TEXT><LEVEL>{rng.randint(0, 3)}</LEVEL></DTC>\n'
+        )
+    parts.append('</DTCS></DTC-DOP></DTC-DOPS>\n')
+    parts.append(
+        '<DATA-OBJECT-PROPS><DATA-OBJECT-PROP ID="DOP_TEXTTABLERecorDataIdentMeasuValue">'
+        '<SHORT-NAME>DOP_TEXTTABLERecorDataIdentMeasuValue</SHORT-NAME>'
+        '<COMPU-METHOD><CATEGORY>TEXTTABLE</CATEGORY><COMPU-INTERNAL-TO-PHYS><COMPU-SCALES>\n'
+    )
+    for index in range(dids):
+        identifier = 0x1000 + index
+        parts.append(
+            f'<COMPU-SCALE><LOWER-LIMIT>{identifier}</LOWER-LIMIT><UPPER-LIMIT>{identifier}</UPPER-LIMIT>'
+            f'<COMPU-CONST><VT>{did_key(index)}</VT></COMPU-CONST></COMPU-SCALE>\n'
+        )
+    parts.append(
+        '</COMPU-SCALES></COMPU-INTERNAL-TO-PHYS></COMPU-METHOD>'
+        '<DIAG-CODED-TYPE BASE-DATA-TYPE="A_UINT32" xsi:type="STANDARD-LENGTH-TYPE"><BIT-LENGTH>16</BIT-LENGTH></DIAG-CODED-TYPE>'
+        '</DATA-OBJECT-PROP></DATA-OBJECT-PROPS>\n'
+    )
+    return layer("ECU-VARIANT", "EV_SynthEngine", "".join(parts), diag_services(services, structures, dops, rng))
+
+
+def table_layer(dids, routines, structures, missing_ratio, rng):
+    parts = ['<TABLES><TABLE ID="TAB_RecorDataIdentMeasuValue"><SHORT-NAME>TAB_RecorDataIdentMeasuValue</SHORT-NAME>\n']
+    for index in range(dids):
+        if rng.random() < missing_ratio:
+            continue  # Identifier without a row, reported by key only
+        structure = rng.randrange(structures)
+        parts.append(
+            f'<TABLE-ROW ID="TABROW_{index}"><SHORT-NAME>{did_key(index)}</SHORT-NAME>'
+            f'<LONG-NAME>Synthetic measurement {index}</LONG-NAME>'
+            f'<DESC><p>Synthetic measurement {index}\nshared structure {structure}</p></DESC>'
+            f'<KEY>{did_key(index)}</KEY>'
+            f'<STRUCTURE-REF ID-REF="STRUC_{structure}" DOCREF="{SHARED_LAYER}" DOCTYPE="LAYER"/></TABLE-ROW>\n'
+        )
+    parts.append('</TABLE>\n')
+    parts.append(
+        '<TABLE ID="TAB_RoutiContrIdent"><SHORT-NAME>TAB_RoutiContrIdent</SHORT-NAME>'
+        '<KEY-DOP-REF ID-REF="DOP_TEXTTABLERoutiContrIdent"/>\n'
+    )
+    scales = []
+    for index in range(routines):
+        key = f"SynthRoutine{index:04d}"
+        scales.append(
+            f'<COMPU-SCALE><LOWER-LIMIT>{0x0100 + index}</LOWER-LIMIT><UPPER-LIMIT>{0x0100 + index}</UPPER-LIMIT>'
+            f'<COMPU-CONST><VT>{key}</VT></COMPU-CONST></COMPU-SCALE>\n'
+        )
+        parts.append(
+            f'<TABLE-ROW ID="TABROW_Routi{index}"><SHORT-NAME>{key}</SHORT-NAME>'
+            f'<LONG-NAME>Synthetic routine {index}</LONG-NAME><KEY>{key}</KEY>'
+            f'<STRUCTURE-REF ID-REF="STRUC_{rng.randrange(structures)}" DOCREF="{SHARED_LAYER}" DOCTYPE="LAYER"/></TABLE-ROW>\n'
+        )
+    parts.append('</TABLE></TABLES>\n')
+    parts.append(
+        '<DATA-OBJECT-PROPS><DATA-OBJECT-PROP ID="DOP_TEXTTABLERoutiContrIdent"><SHORT-NAME>DOP_TEXTTABLERoutiContrIdent</SHORT-NAME>'
+        f'<COMPU-METHOD><CATEGORY>TEXTTABLE</CATEGORY><COMPU-INTERNAL-TO-PHYS><COMPU-SCALES>\n{"".join(scales)}'
+        '</COMPU-SCALES></COMPU-INTERNAL-TO-PHYS></COMPU-METHOD>'
+        '<DIAG-CODED-TYPE BASE-DATA-TYPE="A_UINT32" xsi:type="STANDARD-LENGTH-TYPE"><BIT-LENGTH>16</BIT-LENGTH></DIAG-CODED-TYPE>'
+        '</DATA-OBJECT-PROP></DATA-OBJECT-PROPS>\n'
+    )
+    return layer("BASE-VARIANT", "BL_LIBEnginContrModulUDS", "".join(parts))
+
+
+def shared_layer(structures, dops, rng):
+    parts = ['<DATA-OBJECT-PROPS>\n']
+    for index in range(dops):
+        base_data_type, bit_length = BASE_DATA_TYPES[index % len(BASE_DATA_TYPES)]
+        unit = index % len(UNITS)
+        factor = rng.choice(["0.1", "0.25", "0.5", "1", "0.0078125", "0.01"])
+        offset = rng.choice(["0", "-40", "-273.14", "100"])
+        parts.append(
+            f'<DATA-OBJECT-PROP ID="DOP_Synth{index}"><SHORT-NAME>DOP_Synth{index}</SHORT-NAME>'
+            '<COMPU-METHOD><CATEGORY>LINEAR</CATEGORY><COMPU-INTERNAL-TO-PHYS><COMPU-SCALES><COMPU-SCALE>'
+            f'<COMPU-RATIONAL-COEFFS><COMPU-NUMERATOR><V>{offset}</V><V>{factor}</V></COMPU-NUMERATOR>'
+            '<COMPU-DENOMINATOR><V>1</V></COMPU-DENOMINATOR></COMPU-RATIONAL-COEFFS>'
+            '</COMPU-SCALE></COMPU-SCALES></COMPU-INTERNAL-TO-PHYS></COMPU-METHOD>'
+            f'<DIAG-CODED-TYPE BASE-DATA-TYPE="{base_data_type}" xsi:type="STANDARD-LENGTH-TYPE"><BIT-LENGTH>{bit_length}</BIT-LENGTH></DIAG-CODED-TYPE>'
+            '<PHYSICAL-TYPE BASE-DATA-TYPE="A_FLOAT64"/>'
+            f'<UNIT-REF ID-REF="UNIT_Synth{unit}" DOCREF="{UNITS_LAYER}" DOCTYPE="LAYER"/></DATA-OBJECT-PROP>\n'
+        )
+    parts.append('</DATA-OBJECT-PROPS>\n<STRUCTURES>\n')
+    for index in range(structures):
+        parts.append(
+            f'<STRUCTURE ID="STRUC_{index}"><SHORT-NAME>STRUC_{index}</SHORT-NAME><PARAMS>'
+            f'<PARAM SEMANTIC="DATA" xsi:type="VALUE"><SHORT-NAME>Param_{index}</SHORT-NAME><BYTE-POSITION>0</BYTE-POSITION>'
+            f'<DOP-REF ID-REF="DOP_Synth{rng.randrange(dops)}"/></PARAM></PARAMS></STRUCTURE>\n'
+        )
+    parts.append('</STRUCTURES>\n')
+    return layer("BASE-VARIANT", SHARED_LAYER, "".join(parts))
+
+
+def units_layer():
+    parts = ['<UNIT-SPEC><UNITS>\n']
+    for index, unit in enumerate(UNITS):
+        parts.append(
+            f'<UNIT ID="UNIT_Synth{index}"><SHORT-NAME>Unit{index}</SHORT-NAME>'
+            f'<DISPLAY-NAME>{escape(unit)}</DISPLAY-NAME></UNIT>\n'
+        )
+    parts.append('</UNITS></UNIT-SPEC>\n')
+    return layer("BASE-VARIANT", UNITS_LAYER, "".join(parts))
+
+
+def generate(directory, dtcs=2000, dids=2000, structures=None, dops=None, routines=None, services=None,
+             missing_ratio=0.02, seed=0):
+    """Writes a synthetic unzipped PDX into directory and returns its path."""
+    rng = random.Random(seed)
+    structures = structures or max(1, dids // 10)
+    dops = dops or max(1, structures // 2)
+    routines = routines if routines is not None else dids // 20
+    services = services if services is not None else dids // 10
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    layers = {
+        "EV_SynthEngine_001.odx": ev_layer(dtcs, dids, services, structures, dops, rng),
+        "BL_LIBEnginContrModulUDS_001.odx": table_layer(dids, routines, structures, missing_ratio, rng),
+        f"{SHARED_LAYER}_001.odx": shared_layer(structures, dops, rng),
+        f"{UNITS_LAYER}_001.odx": units_layer(),
+    }
+    for filename, text in layers.items():
+        (directory / filename).write_text(text, encoding="utf-8")
+    return directory
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic unzipped PDX for benchmarking pdx2csv.")
+    parser.add_argument("directory", help="Output directory.")
+    parser.add_argument("--dtcs", type=int, default=2000)
+    parser.add_argument("--dids", type=int, default=2000)
+    parser.add_argument("--structures", type=int, default=None, help="Shared STRUCTUREs (default: dids / 10).")
+    parser.add_argument("--dops", type=int, default=None, help="Shared DATA-OBJECT-PROPs (default: structures / 2).")
+    parser.add_argument("--routines", type=int, default=None, help="Routine TABLE-ROWs (default: dids / 20).")
+    parser.add_argument("--services", type=int, default=None, help="$22/$31 DIAG-SERVICEs (default: dids / 10).")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    generate(args.directory, args.dtcs, args.dids, args.structures, args.dops, args.routines, args.services,
+             seed=args.seed)
+    print(f"Synthetic PDX written to {args.directory}")
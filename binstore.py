@@ -0,0 +1,254 @@
+"""Content-addressed store for calibration bins.
+
+    python3 binstore.py put store/ stock.bin tuned.bin [--chunk-size 4096]
+    python3 binstore.py get store/ tuned.bin restored.bin
+    python3 binstore.py list store/
+    python3 binstore.py diff store/ stock.bin tuned.bin
+    python3 binstore.py compare store/ ecu.a2l stock.bin tuned.bin [search_term]
+
+Bins are cut into fixed-size chunks, which are stored once each, compressed,
+under the hash of their content. Each bin is a small manifest listing its
+chunk hashes, so near-identical bins cost little more than their differing
+chunks. Two stored bins are diffed from their manifests alone, and compare
+only reads the chunks under characteristics that lie in a differing range.
+
+Layout: <store>/chunks/<2 hex>/<hash> and <store>/bins/<name>.json.
+"""
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import zlib
+from bisect import bisect_right
+
+DEFAULT_CHUNK_SIZE = 4096
+
+
+def chunk_hash(chunk):
+    return hashlib.blake2b(chunk, digest_size=20).hexdigest()
+
+
+def write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temporary = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.unlink(temporary)
+        raise
+
+
+class BinStore:
+    def __init__(self, root):
+        self.root = root
+
+    def chunk_path(self, digest):
+        return os.path.join(self.root, "chunks", digest[:2], digest)
+
+    def manifest_path(self, name):
+        return os.path.join(self.root, "bins", f"{name}.json")
+
+    def put(self, name, data, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Stores data (bytes or a path) as name and returns its manifest; only new chunks are written."""
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            with open(data, "rb") as f:
+                data = f.read()
+        chunks = []
+        for start in range(0, len(data), chunk_size):
+            chunk = bytes(data[start:start + chunk_size])
+            digest = chunk_hash(chunk)
+            if not os.path.exists(self.chunk_path(digest)):
+                write_atomic(self.chunk_path(digest), zlib.compress(chunk))
+            chunks.append(digest)
+        manifest = {
+            "size": len(data),
+            "chunk_size": chunk_size,
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "chunks": chunks,
+        }
+        write_atomic(self.manifest_path(name), json.dumps(manifest).encode("utf-8"))
+        return manifest
+
+    def manifest(self, name):
+        with open(self.manifest_path(name), encoding="utf-8") as f:
+            return json.load(f)
+
+    def names(self):
+        directory = os.path.join(self.root, "bins")
+        if not os.path.isdir(directory):
+            return []
+        return sorted(entry[:-len(".json")] for entry in os.listdir(directory) if entry.endswith(".json"))
+
+    def chunk(self, digest):
+        with open(self.chunk_path(digest), "rb") as f:
+            return zlib.decompress(f.read())
+
+    def get(self, name):
+        return b"".join(self.chunk(digest) for digest in self.manifest(name)["chunks"])
+
+    def diff(self, name_a, name_b):
+        """Returns the (start, end) byte ranges in which two stored bins may differ, from their manifests alone.
+
+        Ranges cover whole chunks; adjacent ones are merged.
+        """
+        manifest_a, manifest_b = self.manifest(name_a), self.manifest(name_b)
+        if manifest_a["chunk_size"] != manifest_b["chunk_size"]:
+            raise ValueError(f"{name_a} and {name_b} were stored with different chunk sizes")
+        chunk_size = manifest_a["chunk_size"]
+        size_a, size_b = manifest_a["size"], manifest_b["size"]
+        ranges = []
+        for index, (digest_a, digest_b) in enumerate(zip(manifest_a["chunks"], manifest_b["chunks"])):
+            if digest_a != digest_b:
+                start, end = index * chunk_size, min((index + 1) * chunk_size, max(size_a, size_b))
+                if ranges and ranges[-1][1] == start:
+                    ranges[-1] = (ranges[-1][0], end)
+                else:
+                    ranges.append((start, end))
+        if size_a != size_b:
+            start = min(len(manifest_a["chunks"]), len(manifest_b["chunks"])) * chunk_size
+            start = min(start, min(size_a, size_b))
+            if ranges and ranges[-1][1] >= start:
+                ranges[-1] = (ranges[-1][0], max(size_a, size_b))
+            else:
+                ranges.append((start, max(size_a, size_b)))
+        return ranges
+
+    def stats(self):
+        """Returns (bins, logical bytes, unique chunks, stored bytes)."""
+        names = self.names()
+        logical = sum(self.manifest(name)["size"] for name in names)
+        chunks = 0
+        stored = 0
+        for directory, _, files in os.walk(os.path.join(self.root, "chunks")):
+            for entry in files:
+                if not entry.endswith(".tmp"):
+                    chunks += 1
+                    stored += os.path.getsize(os.path.join(directory, entry))
+        return len(names), logical, chunks, stored
+
+
+class StoredBin:
+    """A stored bin that can be sliced like bytes; chunks are read on first use."""
+
+    def __init__(self, store, name):
+        self.store = store
+        self.manifest = store.manifest(name)
+        self.chunk_size = self.manifest["chunk_size"]
+        self.chunks = {}
+
+    def __len__(self):
+        return self.manifest["size"]
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0] if index >= 0 else self[len(self) + index]
+        start, stop, step = index.indices(len(self))
+        if step != 1:
+            raise ValueError("StoredBin only supports contiguous slices")
+        if stop <= start:
+            return b""
+        first, last = start // self.chunk_size, (stop - 1) // self.chunk_size
+        for number in range(first, last + 1):
+            if number not in self.chunks:
+                self.chunks[number] = self.store.chunk(self.manifest["chunks"][number])
+        data = b"".join(self.chunks[number] for number in range(first, last + 1))
+        offset = first * self.chunk_size
+        return data[start - offset:stop - offset]
+
+
+def compare_stored(store, a2l, name_a, name_b, other=None, search_term=None, offset=None):
+    """Like A2LSession.compare for two stored bins.
+
+    With one A2L for both bins, only characteristics overlapping a range
+    where the manifests differ are read; with two A2Ls every characteristic
+    is compared, still reading chunks lazily.
+    """
+    import a2lbincompare
+    from a2lsession import COMPARE_OFFSET
+
+    offset = COMPARE_OFFSET if offset is None else offset
+    bin_a, bin_b = StoredBin(store, name_a), StoredBin(store, name_b)
+    if other is not None and other is not a2l:
+        return a2lbincompare.compare(a2l, bin_a, other, bin_b, search_term, offset)
+
+    ranges = store.diff(name_a, name_b)
+    ends = [end for _, end in ranges]
+    differences = []
+    if not ranges:
+        return differences
+    names = a2l.matching_names(search_term) if search_term else a2l.characteristic_names()
+    for name, long_identifier in names:
+        characteristic = a2l.characteristic(name)
+        start = characteristic.address - offset
+        end = start + a2lbincompare.calc_map_size(characteristic)
+        position = bisect_right(ends, start)
+        if position == len(ranges) or ranges[position][0] >= end:
+            continue  # Every chunk under this characteristic is identical
+        if bin_a[start:end] != bin_b[start:end]:
+            differences.append((characteristic.name, characteristic.longIdentifier))
+    return differences
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Store calibration bins as deduplicated chunks and compare them.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    put_parser = commands.add_parser("put", help="Add bins to the store, named after their file names.")
+    put_parser.add_argument("store")
+    put_parser.add_argument("bins", nargs="+")
+    put_parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help=f"Bytes per chunk (default: {DEFAULT_CHUNK_SIZE}).")
+
+    get_parser = commands.add_parser("get", help="Write a stored bin back out.")
+    get_parser.add_argument("store")
+    get_parser.add_argument("name")
+    get_parser.add_argument("output")
+
+    list_parser = commands.add_parser("list", help="List the stored bins and the space they use.")
+    list_parser.add_argument("store")
+
+    diff_parser = commands.add_parser("diff", help="Print the byte ranges where two stored bins differ.")
+    diff_parser.add_argument("store")
+    diff_parser.add_argument("name_a")
+    diff_parser.add_argument("name_b")
+
+    compare_parser = commands.add_parser("compare", help="List characteristics that differ between two stored bins.")
+    compare_parser.add_argument("store")
+    compare_parser.add_argument("a2l")
+    compare_parser.add_argument("name_a")
+    compare_parser.add_argument("name_b")
+    compare_parser.add_argument("search_term", nargs="?")
+    compare_parser.add_argument("--a2l2", help="A2L for the second bin (default: the same A2L).")
+    args = parser.parse_args()
+
+    store = BinStore(args.store)
+    if args.command == "put":
+        for bin_file in args.bins:
+            name = os.path.basename(bin_file)
+            manifest = store.put(name, bin_file, args.chunk_size)
+            print(f"Stored {name}: {len(manifest['chunks'])} chunks")
+    elif args.command == "get":
+        with open(args.output, "wb") as f:
+            f.write(store.get(args.name))
+    elif args.command == "list":
+        for name in store.names():
+            print(f"{name} : {store.manifest(name)['size']} bytes")
+        bins, logical, chunks, stored = store.stats()
+        print(f"{bins} bins, {logical} bytes in {chunks} unique chunks taking {stored} bytes")
+    elif args.command == "diff":
+        for start, end in store.diff(args.name_a, args.name_b):
+            print(f"{hex(start)}-{hex(end)}")
+    else:
+        from a2lsession import A2LSession
+
+        a2l = A2LSession(args.a2l)
+        other = A2LSession(args.a2l2) if args.a2l2 else None
+        for name, long_identifier in compare_stored(store, a2l, args.name_a, args.name_b, other, args.search_term):
+            print(name + " : " + long_identifier)
+
+
+if __name__ == "__main__":
+    main()
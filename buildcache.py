@@ -0,0 +1,136 @@
+"""Skips conversions whose inputs have not changed, and writes outputs only when they differ.
+
+Next to each output a `<output>.deps` file records the content hashes of
+its inputs, a hash of the converter's own sources and options, and the hash
+of the output itself. A rerun with the same inputs is skipped before
+anything is imported. When the converter does run, an output whose content
+is unchanged is left untouched; otherwise it is replaced atomically, so
+readers and file syncs never see a half-written file.
+
+File hashes are reused from the .deps file while a file's size and
+modification time are unchanged, so checking is cheap even for big A2Ls.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+HASH_BLOCK = 1 << 20
+PARSER_DISTRIBUTION = "pya2ldb"  # The distribution that provides the pya2l package
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(HASH_BLOCK):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def tool_digest(*sources):
+    """Hashes the source files of a converter, plus the installed pya2l version.
+
+    pya2l is distributed as pya2ldb. If its version cannot be read, a
+    warning is printed, since outputs then stay cached across pya2l upgrades.
+    """
+    from importlib.metadata import PackageNotFoundError, version
+
+    digest = hashlib.sha256()
+    for source in sources:
+        with open(source, "rb") as f:
+            digest.update(f.read())
+    try:
+        digest.update(version(PARSER_DISTRIBUTION).encode("utf-8"))
+    except PackageNotFoundError:
+        print(f"******** Could not find the {PARSER_DISTRIBUTION} version; pya2l upgrades will not invalidate cached outputs")
+        digest.update(b"unknown")
+    return digest.hexdigest()
+
+
+def deps_path(output):
+    return f"{output}.deps"
+
+
+def read_deps(output):
+    try:
+        with open(deps_path(output), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def file_record(path, previous=None):
+    """Returns {"size", "mtime", "sha256"} for path, reusing previous's hash while the file is unmodified."""
+    stat = os.stat(path)
+    if previous is not None and previous["size"] == stat.st_size and previous["mtime"] == stat.st_mtime_ns:
+        return previous
+    return {"size": stat.st_size, "mtime": stat.st_mtime_ns, "sha256": file_digest(path)}
+
+
+def input_records(paths, previous=None):
+    """Returns {absolute path: {"size", "mtime", "sha256"}}, reusing previous hashes of unmodified files."""
+    previous = previous or {}
+    return {os.path.abspath(path): file_record(path, previous.get(os.path.abspath(path))) for path in paths}
+
+
+def digests(records):
+    return {key: record["sha256"] for key, record in records.items()}
+
+
+def up_to_date(output, inputs, tool, options=None):
+    """True when output was built from these inputs, tool and options and has not been modified since."""
+    deps = read_deps(output)
+    if deps is None or not os.path.exists(output):
+        return False
+    if deps.get("tool") != tool or deps.get("options") != (options or {}):
+        return False
+    if digests(input_records(inputs, deps.get("inputs"))) != digests(deps.get("inputs", {})):
+        return False
+    return digests(input_records([output], deps.get("output"))) == digests(deps.get("output", {}))
+
+
+def record(output, inputs, tool, options=None):
+    """Writes the .deps file for an output that was just built."""
+    deps = read_deps(output) or {}
+    replace_if_changed(
+        deps_path(output),
+        json.dumps(
+            {
+                "tool": tool,
+                "options": options or {},
+                "inputs": input_records(inputs, deps.get("inputs")),
+                "output": input_records([output]),
+            },
+            indent=1,
+        ),
+        encoding="utf-8",
+    )
+
+
+def replace_if_changed(path, text, encoding="utf-8", errors="strict"):
+    """Writes text to path as open(path, "w", encoding=encoding, errors=errors) would.
+
+    Nothing is written when path already holds exactly those bytes; otherwise
+    a temporary file next to it replaces it. Returns True if path was written.
+    """
+    data = text.replace("\n", os.linesep).encode(encoding, errors)
+    if os.path.exists(path) and os.path.getsize(path) == len(data):
+        if file_digest(path) == hashlib.sha256(data).hexdigest():
+            return False
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temporary = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        if os.path.exists(path):
+            os.chmod(temporary, os.stat(path).st_mode & 0o777)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(temporary, 0o666 & ~umask)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.unlink(temporary)
+        raise
+    return True
@@ -1,8 +1,16 @@
-import shutil
+import io
+import queue
+import threading
 import tkinter as tk
-from tkinter import filedialog, messagebox
-import subprocess
-import os
+from contextlib import redirect_stdout
+from tkinter import filedialog, messagebox, ttk
+
+import json2xdf
+
+# Messages from the conversion worker, polled by the Tk loop
+events = queue.Queue()
+cancel_event = threading.Event()
+POLL_MS = 100
 
 def browse_json_file():
     """Opens a file dialog to select a JSON file."""
@@ -25,8 +33,64 @@ def browse_xdf_file():
         xdf_file_entry.delete(0, tk.END)
         xdf_file_entry.insert(0, filename)
 
+def conversion_worker(json_file, xdf_file, base_offset):
+    """Runs json_to_xdf on a worker thread, reporting back through the events queue."""
+    def progress(done, total):
+        events.put(("progress", done, total))
+
+    output = io.StringIO()
+    try:
+        with redirect_stdout(output):
+            ok = json2xdf.json_to_xdf(json_file, xdf_file, base_offset, progress=progress, cancel_event=cancel_event)
+    except Exception as e:
+        events.put(("error", f"An unexpected error occurred: {e}", output.getvalue()))
+        return
+    events.put(("done", ok, output.getvalue()))
+
+def poll_events():
+    """Applies worker messages to the window; reschedules itself until the worker finishes."""
+    last_progress = None
+    finished = None
+    while True:
+        try:
+            event = events.get_nowait()
+        except queue.Empty:
+            break
+        if event[0] == "progress":
+            last_progress = event
+        else:
+            finished = event
+
+    if last_progress is not None:
+        _, done, total = last_progress
+        if total:
+            progress_bar.config(maximum=total, value=done)
+            status_label.config(text=f"Converting... {done}/{total} maps")
+        else:
+            status_label.config(text=f"Converting... {done} maps")
+
+    if finished is None:
+        root.after(POLL_MS, poll_events)
+        return
+
+    run_button.config(state=tk.NORMAL)
+    cancel_button.config(state=tk.DISABLED)
+    xdf_file = xdf_file_entry.get()
+    if finished[0] == "error":
+        messagebox.showerror("Error", f"{finished[1]}\n\nOutput:\n{finished[2]}")
+        status_label.config(text="Conversion failed.")
+    elif finished[1]:
+        messagebox.showinfo("Success", f"Conversion complete! XDF file saved to: {xdf_file}\n\nOutput:\n{finished[2]}")
+        status_label.config(text="Conversion successful!")
+    elif cancel_event.is_set():
+        progress_bar.config(value=0)
+        status_label.config(text="Conversion cancelled.")
+    else:
+        messagebox.showerror("Error", f"Conversion failed.\n\nOutput:\n{finished[2]}")
+        status_label.config(text="Conversion failed.")
+
 def run_conversion():
-    """Gets the input values and runs the json2xdf.py script."""
+    """Gets the input values and starts json_to_xdf on a background thread."""
     json_file = json_file_entry.get()
     xdf_file = xdf_file_entry.get()
     base_offset = base_offset_entry.get()
@@ -52,52 +116,19 @@ def run_conversion():
         # Default baseoffset if not provided, as per json2xdf.py
         base_offset = "0x0"
 
+    cancel_event.clear()
+    run_button.config(state=tk.DISABLED)
+    cancel_button.config(state=tk.NORMAL)
+    progress_bar.config(value=0)
+    status_label.config(text="Running conversion...")
+    threading.Thread(target=conversion_worker, args=(json_file, xdf_file, base_offset), daemon=True).start()
+    root.after(POLL_MS, poll_events)
 
-    # Assuming json2xdf.py is in the same directory as this GUI script
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    json2xdf_script_path = os.path.join(script_dir, "json2xdf.py")
-
-    if not os.path.exists(json2xdf_script_path):
-        # Fallback if json2xdf.py is not found in the same directory
-        # Try to find it in the directory of aldee/a2l2xdf/
-        # This path is based on the uploaded file structure
-        # Modify this path if your actual structure is different
-        base_project_dir = os.path.join(script_dir, "aldee", "a2l2xdf")
-        specific_subdir_name = next((d for d in os.listdir(base_project_dir) if os.path.isdir(os.path.join(base_project_dir, d)) and "a2l2xdf-" in d), None)
-
-        if specific_subdir_name:
-            json2xdf_script_path = os.path.join(base_project_dir, specific_subdir_name, "json2xdf.py")
-        else: # Final fallback if not found by guessing the path
-            json2xdf_script_path = "json2xdf.py" # Assumes it's in PATH or current working dir
-
-
-    if not os.path.exists(json2xdf_script_path) and not shutil.which("json2xdf.py"):
-         messagebox.showerror("Error", f"json2xdf.py script not found at {json2xdf_script_path} or in system PATH. Please ensure it's accessible.")
-         return
-
-    command = ["python", json2xdf_script_path, json_file, xdf_file, "--baseoffset", base_offset]
-
-    try:
-        status_label.config(text="Running conversion...")
-        root.update_idletasks() # Update GUI before blocking subprocess call
-
-        # Run the script
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        stdout, stderr = process.communicate()
-
-        if process.returncode == 0:
-            messagebox.showinfo("Success", f"Conversion complete! XDF file saved to: {xdf_file}\n\nOutput:\n{stdout}")
-            status_label.config(text="Conversion successful!")
-        else:
-            messagebox.showerror("Error", f"Conversion failed.\n\nError:\n{stderr}\n\nOutput:\n{stdout}")
-            status_label.config(text="Conversion failed.")
-
-    except FileNotFoundError:
-        messagebox.showerror("Error", "Python interpreter not found. Please ensure Python is installed and in your PATH.")
-        status_label.config(text="Error: Python not found.")
-    except Exception as e:
-        messagebox.showerror("Error", f"An unexpected error occurred: {e}")
-        status_label.config(text=f"Error: {e}")
+def cancel_conversion():
+    """Asks the worker to stop before its next map."""
+    cancel_event.set()
+    cancel_button.config(state=tk.DISABLED)
+    status_label.config(text="Cancelling...")
 
 # --- Create the main window ---
 root = tk.Tk()
@@ -121,13 +152,19 @@ base_offset_entry = tk.Entry(root, width=20)
 base_offset_entry.grid(row=2, column=1, padx=5, pady=5, sticky="w")
 base_offset_entry.insert(0, "0x0") # Default value
 
-# --- Run Button ---
+# --- Run / Cancel Buttons ---
 run_button = tk.Button(root, text="Run Conversion", command=run_conversion)
-run_button.grid(row=3, column=0, columnspan=3, pady=10)
+run_button.grid(row=3, column=0, columnspan=2, pady=10, sticky="e")
+cancel_button = tk.Button(root, text="Cancel", command=cancel_conversion, state=tk.DISABLED)
+cancel_button.grid(row=3, column=2, padx=5, pady=10, sticky="w")
+
+# --- Progress ---
+progress_bar = ttk.Progressbar(root, mode="determinate", length=400)
+progress_bar.grid(row=4, column=0, columnspan=3, padx=5, pady=5)
 
 # --- Status Label ---
 status_label = tk.Label(root, text="")
-status_label.grid(row=4, column=0, columnspan=3, pady=5)
+status_label.grid(row=5, column=0, columnspan=3, pady=5)
 
 # Start the GUI event loop
 root.mainloop()
\ No newline at end of file
@@ -1,6 +1,21 @@
+import csv
+import glob
+import io
 import json
-import xml.etree.ElementTree as ET
 import argparse
+import os
+import re
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+
+import xdfvalidate
+import xmlbackend
+from xdfreader import read_table
+
+REGION_SIZE = 0x800000
 
 def create_xdf_element(parent, tag, text=None, attributes=None):
     """Helper function to create an XML element.
@@ -8,7 +23,10 @@ def create_xdf_element(parent, tag, text=None, attributes=None):
     Ensures all attribute values are strings and converts None to empty string.
     """
     attributes_to_use = {}
-    if attributes:
+    if attributes and all(type(v) is str for v in attributes.values()):
+        # Common case: nothing to normalize, and Element copies the dict anyway
+        attributes_to_use = attributes
+    elif attributes:
         processed_attributes = {}
         for k, v in attributes.items():
             if v is None:
@@ -21,9 +39,9 @@ def create_xdf_element(parent, tag, text=None, attributes=None):
         attributes_to_use = processed_attributes
     
     if parent is None:
-        element = ET.Element(tag, attributes_to_use)
+        element = xmlbackend.Element(tag, attributes_to_use)
     else:
-        element = ET.SubElement(parent, tag, attributes_to_use)
+        element = xmlbackend.SubElement(parent, tag, attributes_to_use)
     
     if text is not None:
         element.text = str(text)
@@ -34,42 +52,90 @@ def create_text_element(parent, tag, text, attributes=None):
     element = create_xdf_element(parent, tag, text=str(text), attributes=attributes)
     return element
 
-def json_to_xdf(json_file, xdf_file, base_offset_hex):
+def create_xdf_header(xdfformat, deftitle, base_offset_int):
+    """Creates the XDFHEADER and REGION elements under XDFFORMAT."""
+    xdfheader = create_xdf_element(xdfformat, "XDFHEADER")
+    create_text_element(xdfheader, "flags", "0x1")
+    create_text_element(xdfheader, "deftitle", str(deftitle))
+    create_text_element(xdfheader, "description", f"Mappack for {deftitle} generated from JSON")
+    create_xdf_element(xdfheader, "BASEOFFSET", attributes={"offset": str(base_offset_int), "subtract": "0"})
+    create_xdf_element(xdfheader, "DEFAULTS",
+                       attributes={"datasizeinbits": "8", "sigdigits": "4", "outputtype": "1", "signed": "0",
+                                   "lsbfirst": "1", "float": "0"})
+    create_xdf_element(xdfformat, "REGION",
+                       attributes={"type": "0xFFFFFFFF", "startaddress": "0x0", "size": hex(REGION_SIZE),
+                                   "regioncolor": "0x0", "regionflags": "0x0", "name": "Binary",
+                                   "desc": "Full Binary Region"})
+    return xdfheader
+
+def default_title(json_file):
+    return json_file.split('/')[-1].split('\\')[-1].split('.')[0]
+
+def category_name(group_name_val, group_idx):
+    """Normalizes a map group name into its category name."""
+    processed_category_name = str(group_name_val).strip() if group_name_val is not None else ""
+    if not processed_category_name:
+        processed_category_name = f"Unnamed Category {group_idx + 1}"
+    return processed_category_name
+
+def create_xdf_table(parent, json_map, category_attr_for_table, base_offset_int):
+    """Creates the XDFTABLE element for one JSON map."""
+    address = json_map.get("address")
+    mmedaddress_hex = hex(address - base_offset_int) if address is not None else "0x0"
+
+    xdftable = create_xdf_element(parent, "XDFTABLE", attributes={"flags": "0x0", "uniqueid": mmedaddress_hex})
+    
+    map_name = json_map.get("name", "Unknown Map")
+    create_text_element(xdftable, "title", str(map_name))
+
+    table_description_val = json_map.get("map_id", map_name) 
+    create_text_element(xdftable, "description", str(table_description_val))
+    
+    create_xdf_element(xdftable, "CATEGORYMEM", 
+                       attributes={"index": "0", 
+                                   "category": category_attr_for_table}) # Use 1-based decimal string
+
+    create_xdf_axis(xdftable, "x", json_map.get("x", {}), base_offset_int, mmedaddress_hex)
+    create_xdf_axis(xdftable, "y", json_map.get("y", {}), base_offset_int, mmedaddress_hex)
+    create_xdf_axis_z(xdftable, "z", json_map, base_offset_int)
+    return xdftable
+
+def json_to_xdf(json_file, xdf_file, base_offset_hex, stream=False, progress=None, cancel_event=None, validate=True):
     """
     Converts a JSON file to an XDF file based on the defined mappings.
+    Returns True when the XDF was written.
+
+    With stream=True the mappack is parsed incrementally and tables are
+    written as they are read, so memory stays bounded for huge mappacks.
+
+    progress(done, total) is called after each map (total is None when
+    streaming). Setting cancel_event (a threading.Event) stops the
+    conversion before the next map; nothing is written and False is returned.
+
+    Unless validate is False, overlapping, duplicate and out-of-region
+    tables are printed as warnings.
     """
+    if stream:
+        return json_to_xdf_streaming(json_file, xdf_file, base_offset_hex, progress, cancel_event, validate)
     try:
         with open(json_file, 'r') as f:
             data = json.load(f)
     except FileNotFoundError:
         print(f"Error: JSON file not found: {json_file}")
-        return
+        return False
     except json.JSONDecodeError:
         print(f"Error: Invalid JSON format in: {json_file}")
-        return
+        return False
 
     try:
         base_offset_int = int(base_offset_hex, 16)
     except ValueError:
         print(f"Error: Invalid hexadecimal format for BASEOFFSET: {base_offset_hex}")
-        return
+        return False
 
     xdfformat = create_xdf_element(None, "XDFFORMAT", attributes={"version": "1.80"})
-    xdfheader = create_xdf_element(xdfformat, "XDFHEADER")
-    create_text_element(xdfheader, "flags", "0x1")
-    
-    default_title_name = json_file.split('/')[-1].split('\\')[-1].split('.')[0]
-    deftitle_from_json = data.get("filename", default_title_name) 
-    create_text_element(xdfheader, "deftitle", str(deftitle_from_json))
-    create_text_element(xdfheader, "description", f"Mappack for {deftitle_from_json} generated from JSON")
-    create_xdf_element(xdfheader, "BASEOFFSET", attributes={"offset": str(base_offset_int), "subtract": "0"})
-    create_xdf_element(xdfheader, "DEFAULTS",
-                       attributes={"datasizeinbits": "8", "sigdigits": "4", "outputtype": "1", "signed": "0",
-                                   "lsbfirst": "1", "float": "0"})
-    create_xdf_element(xdfformat, "REGION",
-                       attributes={"type": "0xFFFFFFFF", "startaddress": "0x0", "size": "0x800000",
-                                   "regioncolor": "0x0", "regionflags": "0x0", "name": "Binary",
-                                   "desc": "Full Binary Region"})
+    deftitle_from_json = data.get("filename", default_title(json_file)) 
+    create_xdf_header(xdfformat, deftitle_from_json, base_offset_int)
 
     # --- Category Handling ---
     categories_map = {}
@@ -83,11 +149,7 @@ def json_to_xdf(json_file, xdf_file, base_offset_hex):
         create_xdf_element(xdfformat, "CATEGORY", attributes={"index": hex_cat_idx_str, "name": default_cat_name})
     else:
         for i, group in enumerate(map_groups_from_json):
-            category_name_val = group.get("name")
-            processed_category_name = str(category_name_val).strip() if category_name_val is not None else ""
-            
-            if not processed_category_name:
-                processed_category_name = f"Unnamed Category {i + 1}"
+            processed_category_name = category_name(group.get("name"), i)
             
             if processed_category_name not in categories_map:
                 hex_category_index_str = hex(category_index_counter) # Convert decimal counter to hex string
@@ -99,12 +161,10 @@ def json_to_xdf(json_file, xdf_file, base_offset_hex):
                 category_index_counter += 1
     # --- End Category Handling ---
     
+    total_maps = sum(len(maps_group.get("maps", [])) for maps_group in map_groups_from_json)
+    done_maps = 0
     for group_idx, maps_group in enumerate(map_groups_from_json):
-        current_group_name_val = maps_group.get("name")
-        processed_group_name_for_lookup = str(current_group_name_val).strip() if current_group_name_val is not None else ""
-
-        if not processed_group_name_for_lookup:
-            processed_group_name_for_lookup = f"Unnamed Category {group_idx + 1}"
+        processed_group_name_for_lookup = category_name(maps_group.get("name"), group_idx)
         
         # Get the 0-based HEXADECIMAL category index string
         zero_based_hex_idx_str = categories_map.get(processed_group_name_for_lookup, "0x0") 
@@ -119,28 +179,299 @@ def json_to_xdf(json_file, xdf_file, base_offset_hex):
             category_attr_for_table = "1" 
 
         for json_map in maps_group.get("maps", []):
-            address = json_map.get("address")
-            mmedaddress_hex = hex(address - base_offset_int) if address is not None else "0x0"
+            if cancel_event is not None and cancel_event.is_set():
+                print("Conversion cancelled.")
+                return False
+            create_xdf_table(xdfformat, json_map, category_attr_for_table, base_offset_int)
+            done_maps += 1
+            if progress is not None:
+                progress(done_maps, total_maps)
 
-            xdftable = create_xdf_element(xdfformat, "XDFTABLE", attributes={"flags": "0x0", "uniqueid": mmedaddress_hex})
-            
-            map_name = json_map.get("name", "Unknown Map")
-            create_text_element(xdftable, "title", str(map_name))
+    if validate:
+        xdfvalidate.print_issues(xdfvalidate.validate_tables(
+            [read_table(element) for element in xdfformat.iter("XDFTABLE")], [(0, REGION_SIZE)]))
 
-            table_description_val = json_map.get("map_id", map_name) 
-            create_text_element(xdftable, "description", str(table_description_val))
-            
-            create_xdf_element(xdftable, "CATEGORYMEM", 
-                               attributes={"index": "0", 
-                                           "category": category_attr_for_table}) # Use 1-based decimal string
+    xmlbackend.indent(xdfformat, space="\t", level=0)
+    xmlbackend.write(xdfformat, xdf_file, encoding='utf-8', xml_declaration=True)
+    return True
+
+# --- Streaming ingestion ---
 
-            create_xdf_axis(xdftable, "x", json_map.get("x", {}), base_offset_int, mmedaddress_hex)
-            create_xdf_axis(xdftable, "y", json_map.get("y", {}), base_offset_int, mmedaddress_hex)
-            create_xdf_axis_z(xdftable, "z", json_map, base_offset_int)
+class JsonStream:
+    """Pull parser that decodes one JSON value at a time from a file.
 
-    tree = ET.ElementTree(xdfformat)
-    ET.indent(tree, space="\t", level=0)
-    tree.write(xdf_file, encoding='utf-8', xml_declaration=True)
+    Only the containers being walked are tokenized by hand; every value the
+    caller asks for is decoded by json's C scanner from a sliding buffer.
+    """
+
+    _whitespace = re.compile(r"[ \t\r\n]*")
+
+    def __init__(self, f, chunk_size=1 << 16):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        # Read at least as much as is buffered so a value spanning many chunks
+        # is re-scanned a logarithmic number of times.
+        chunk = self.f.read(max(self.chunk_size, len(self.buf) - self.pos))
+        if not chunk:
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            self.pos = self._whitespace.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise json.JSONDecodeError(f"Expecting '{char}'", self.buf, self.pos)
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            if end == len(self.buf) and self._fill():
+                continue  # A number may continue in the next chunk
+            self.pos = end
+            return value
+
+    def _items(self, close):
+        first = True
+        while True:
+            char = self.peek()
+            if char == close:
+                self.pos += 1
+                return
+            if not first:
+                self.expect(",")
+            first = False
+            yield
+
+    def object_keys(self):
+        """Yields the keys of the object whose '{' was just consumed.
+
+        The caller must consume each key's value before asking for the next.
+        """
+        for _ in self._items("}"):
+            key = self.value()
+            self.expect(":")
+            yield key
+
+    def array_items(self):
+        """Yields the index of each item of the array whose '[' was just consumed."""
+        for index, _ in enumerate(self._items("]")):
+            yield index
+
+
+def iter_mappack(f):
+    """Yields mappack events as the JSON is read.
+
+    Events are ("filename", value), ("group_start", index),
+    ("group_name", index, name), ("map", index, json_map) and
+    ("group_end", index).
+    """
+    stream = JsonStream(f)
+    stream.expect("{")
+    for key in stream.object_keys():
+        if key != "maps" or stream.peek() != "[":
+            value = stream.value()
+            if key == "filename":
+                yield ("filename", value)
+            continue
+        stream.expect("[")
+        for group_idx in stream.array_items():
+            if stream.peek() != "{":
+                stream.value()
+                continue
+            stream.expect("{")
+            yield ("group_start", group_idx)
+            for group_key in stream.object_keys():
+                if group_key == "maps" and stream.peek() == "[":
+                    stream.expect("[")
+                    for _ in stream.array_items():
+                        yield ("map", group_idx, stream.value())
+                    continue
+                value = stream.value()
+                if group_key == "name":
+                    yield ("group_name", group_idx, value)
+            yield ("group_end", group_idx)
+
+
+def write_root_child(out, element):
+    """Writes a direct XDFFORMAT child exactly as indent() + write() place it."""
+    element.tail = None
+    xmlbackend.indent(element, space="\t", level=1)
+    out.write("\n\t" + xmlbackend.tounicode(element))
+
+
+def json_to_xdf_streaming(json_file, xdf_file, base_offset_hex, progress=None, cancel_event=None, validate=True):
+    """
+    Converts a JSON file to an XDF file without loading the whole mappack.
+
+    Tables are spooled to a temporary file as their maps are parsed; the
+    header and categories are written once the whole mappack has been seen.
+    A group whose "name" comes after its "maps" is held back until the name
+    arrives. The output is identical to json_to_xdf.
+    """
+    try:
+        base_offset_int = int(base_offset_hex, 16)
+    except ValueError:
+        print(f"Error: Invalid hexadecimal format for BASEOFFSET: {base_offset_hex}")
+        return False
+
+    deftitle_from_json = default_title(json_file)
+    categories_map = {}
+    group_names = {}
+    pending_maps = []
+    done_maps = 0
+    layouts = []  # Only the address ranges are kept for validation
+
+    with tempfile.TemporaryFile("w+", encoding="utf-8", newline="") as spool:
+        def category_attr(group_idx):
+            processed_category_name = category_name(group_names.get(group_idx), group_idx)
+            if processed_category_name not in categories_map:
+                categories_map[processed_category_name] = len(categories_map)
+            return str(categories_map[processed_category_name] + 1)
+
+        def write_table(json_map, category_attr_for_table):
+            nonlocal done_maps
+            xdftable = create_xdf_table(None, json_map, category_attr_for_table, base_offset_int)
+            if validate:
+                layouts.append(read_table(xdftable))
+            write_root_child(spool, xdftable)
+            done_maps += 1
+            if progress is not None:
+                progress(done_maps, None)
+
+        try:
+            with open(json_file, 'r') as f:
+                for event in iter_mappack(f):
+                    kind = event[0]
+                    if kind == "filename":
+                        deftitle_from_json = event[1]
+                    elif kind == "group_name":
+                        group_names[event[1]] = event[2]
+                        attr = category_attr(event[1])
+                        for json_map in pending_maps:
+                            write_table(json_map, attr)
+                        pending_maps.clear()
+                    elif kind == "map":
+                        if cancel_event is not None and cancel_event.is_set():
+                            print("Conversion cancelled.")
+                            return False
+                        if event[1] in group_names:
+                            write_table(event[2], category_attr(event[1]))
+                        else:
+                            pending_maps.append(event[2])
+                    elif kind == "group_end":
+                        attr = category_attr(event[1])
+                        for json_map in pending_maps:
+                            write_table(json_map, attr)
+                        pending_maps.clear()
+        except FileNotFoundError:
+            print(f"Error: JSON file not found: {json_file}")
+            return False
+        except json.JSONDecodeError:
+            print(f"Error: Invalid JSON format in: {json_file}")
+            return False
+
+        if validate:
+            xdfvalidate.print_issues(xdfvalidate.validate_tables(layouts, [(0, REGION_SIZE)]))
+
+        xdfformat = create_xdf_element(None, "XDFFORMAT", attributes={"version": "1.80"})
+        create_xdf_header(xdfformat, deftitle_from_json, base_offset_int)
+        if not categories_map:
+            categories_map["Generic"] = 0
+        for processed_category_name, index in categories_map.items():
+            create_xdf_element(xdfformat, "CATEGORY", attributes={"index": hex(index), "name": processed_category_name})
+
+        with open(xdf_file, "w", encoding="utf-8", errors="xmlcharrefreplace") as out:
+            out.write("<?xml version='1.0' encoding='utf-8'?>\n")
+            out.write('<XDFFORMAT version="1.80">')
+            for element in xdfformat:
+                write_root_child(out, element)
+            spool.seek(0)
+            shutil.copyfileobj(spool, out)
+            out.write("\n</XDFFORMAT>")
+    return True
+
+# --- Batch conversion ---
+
+def batch_sources(pattern):
+    """Expands a directory or glob into the JSON mappacks to convert."""
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "*.json")
+    return sorted(glob.glob(pattern))
+
+def load_offsets(offsets_file):
+    """Reads a CSV with "file" and "baseoffset" columns into {file name: offset}."""
+    with open(offsets_file, newline="", encoding="utf-8-sig") as f:
+        return {os.path.basename(row["file"]): row["baseoffset"].strip() for row in csv.DictReader(f)}
+
+def convert_for_batch(json_file, xdf_file, base_offset_hex, stream, validate=True):
+    start = time.perf_counter()
+    output = io.StringIO()
+    with redirect_stdout(output):
+        ok = json_to_xdf(json_file, xdf_file, base_offset_hex, stream=stream, validate=validate)
+    return ok, output.getvalue().strip(), time.perf_counter() - start
+
+def run_batch(pattern, output_dir=None, offsets=None, default_offset="0x0", jobs=None, stream=False, validate=True):
+    """Converts every mappack matching pattern across a pool of worker processes.
+
+    Each file uses its entry in offsets (keyed by file name) or default_offset.
+    XDFs are written to output_dir, or next to their JSON when it is None.
+    """
+    json_files = batch_sources(pattern)
+    if not json_files:
+        print(f"Error: No JSON files match: {pattern}")
+        return False
+    offsets = offsets or {}
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    failures = []
+    total = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {}
+        for json_file in json_files:
+            stem = os.path.splitext(os.path.basename(json_file))[0]
+            xdf_file = os.path.join(output_dir or os.path.dirname(json_file), stem + ".xdf")
+            base_offset_hex = offsets.get(os.path.basename(json_file), default_offset)
+            futures[pool.submit(convert_for_batch, json_file, xdf_file, base_offset_hex, stream, validate)] = (json_file, xdf_file)
+        for future in as_completed(futures):
+            json_file, xdf_file = futures[future]
+            try:
+                ok, output, elapsed = future.result()
+            except Exception as e:
+                ok, output, elapsed = False, str(e), 0.0
+            if ok:
+                print(f"{json_file} -> {xdf_file} in {elapsed:.2f}s")
+                for line in output.splitlines():
+                    if line.startswith("Warning: "):
+                        print(f"  {line}")
+            else:
+                failures.append(json_file)
+                print(f"******** Failed {json_file}: {output}")
+
+    print(f"Converted {len(json_files) - len(failures)}/{len(json_files)} mappacks in {time.perf_counter() - total:.2f}s")
+    for json_file in failures:
+        print(f"  failed: {json_file}")
+    return not failures
 
 def create_xdf_axis(axis_parent, axis_id_param, json_axis, base_offset_int, table_unique_id_hex):
     """Creates an XDFAXIS element for x or y axis."""
@@ -290,10 +621,22 @@ def create_xdf_axis_z(axis_parent, axis_id_param, json_map, base_offset_int):
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Convert JSON to XDF for ECU mappacks.")
-    parser.add_argument("json_file", help="Path to the input JSON file.")
-    parser.add_argument("xdf_file", help="Path to the output XDF file.")
+    parser.add_argument("json_file", help="Path to the input JSON file, or with --batch a directory or glob of JSON files.")
+    parser.add_argument("xdf_file", nargs="?", help="Path to the output XDF file, or with --batch the output directory (default: next to each JSON).")
     parser.add_argument("--baseoffset", help="Hexadecimal value for the BASEOFFSET (e.g., 0x200000)", default="0x0")
-    args = parser.parse_args()
-
-    json_to_xdf(args.json_file, args.xdf_file, args.baseoffset)
-    print(f"Conversion complete. XDF file created: {args.xdf_file}")
\ No newline at end of file
+    parser.add_argument("--stream", action="store_true", help="Parse the mappack incrementally to keep memory bounded.")
+    parser.add_argument("--batch", action="store_true", help="Convert every matching JSON file in parallel.")
+    parser.add_argument("--offsets", help="CSV with file,baseoffset columns giving per-file base offsets for --batch.")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Worker processes for --batch (default: CPU count).")
+    parser.add_argument("--no-validate", action="store_true", help="Skip the overlap and region checks.")
+    args = parser.parse_intermixed_args()
+
+    if args.batch:
+        offsets = load_offsets(args.offsets) if args.offsets else None
+        raise SystemExit(0 if run_batch(args.json_file, args.xdf_file, offsets, args.baseoffset, args.jobs, args.stream, not args.no_validate) else 1)
+    if args.xdf_file is None:
+        parser.error("the output XDF file is required without --batch")
+
+    if not json_to_xdf(args.json_file, args.xdf_file, args.baseoffset, stream=args.stream, validate=not args.no_validate):
+        raise SystemExit(1)
+    print(f"Conversion complete. XDF file created: {args.xdf_file}")
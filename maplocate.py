@@ -0,0 +1,196 @@
+"""Finds the tables of a known A2L in a bin from a software version without one.
+
+    python3 maplocate.py ecu.a2l reference.bin default.csv unknown.bin [-o unknown.xdf] [--report moved.csv]
+
+reference.bin must match ecu.a2l. For every table in the CSV its axes (with
+their point count) and its data are read from reference.bin and searched for
+in unknown.bin. Axis values rarely change between nearby versions, so:
+
+* data found unchanged gives the table's new address directly;
+* otherwise the table moves by the same amount as its x (or y) axis, when
+  the axes were found and agree.
+
+All windows of the unknown bin are indexed once by their first 4 and 8
+bytes (NumPy, sorted keys), so looking up tens of thousands of signatures
+takes a few seconds for an 8 MB bin. When a signature occurs more than once
+the occurrence nearest the table's old address is taken.
+
+The relocated tables are written as an XDF (default: <unknown>.xdf); the
+report CSV lists every table with its old and new address and how it was
+found. Tables that could not be placed are left out of the XDF.
+"""
+import argparse
+import csv
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+import a2l2xdf
+
+MIN_SIGNATURE = 4  # Shorter byte strings match almost anywhere
+MAX_CANDIDATES = 64  # Prefixes more common than this are not verified
+PREFIX_WIDTHS = (4, 8)
+
+
+class BinIndex:
+    """Every position of a bin, sorted by the 4 and 8 bytes starting there."""
+
+    def __init__(self, data):
+        self.array = np.frombuffer(data, dtype=np.uint8)
+        self.sorted = {}
+        for width in PREFIX_WIDTHS:
+            keys = prefix_keys(self.array, width)
+            order = np.argsort(keys)
+            self.sorted[width] = (keys[order], order)
+
+    def find(self, signatures, near):
+        """Returns, for each signature (bytes), the position of its occurrence nearest near[i], or None.
+
+        Also returns how many occurrences were found (-1 when the prefix was
+        too common to check).
+        """
+        positions = [None] * len(signatures)
+        counts = [0] * len(signatures)
+        for width in PREFIX_WIDTHS:
+            batch = [
+                index for index, signature in enumerate(signatures)
+                if len(signature) >= MIN_SIGNATURE and prefix_width(signature) == width
+            ]
+            if not batch or len(self.array) < width:
+                continue
+            keys, order = self.sorted[width]
+            wanted = prefix_keys(
+                np.frombuffer(b"".join(signatures[index][:width] for index in batch), dtype=np.uint8), width
+            )[::width]
+            lows = np.searchsorted(keys, wanted, side="left")
+            highs = np.searchsorted(keys, wanted, side="right")
+            for index, low, high in zip(batch, lows, highs):
+                if high - low > MAX_CANDIDATES:
+                    counts[index] = -1
+                    continue
+                signature = signatures[index]
+                candidates = order[low:high]
+                candidates = candidates[candidates + len(signature) <= len(self.array)]
+                if len(candidates) == 0:
+                    continue
+                windows = sliding_window_view(self.array, len(signature))[candidates]
+                matches = candidates[np.all(windows == np.frombuffer(signature, dtype=np.uint8), axis=1)]
+                counts[index] = len(matches)
+                if len(matches):
+                    positions[index] = int(matches[np.argmin(np.abs(matches - near[index]))])
+        return positions, counts
+
+
+def prefix_width(signature):
+    """The longest indexed prefix width that fits in the signature."""
+    return max(width for width in PREFIX_WIDTHS if width <= max(len(signature), PREFIX_WIDTHS[0]))
+
+
+def prefix_keys(array, width):
+    """The little-endian integer formed by the width bytes at each position of array."""
+    key_type = np.uint32 if width <= 4 else np.uint64
+    count = len(array) - width + 1
+    keys = np.zeros(max(count, 0), dtype=key_type)
+    for shift in range(width):
+        keys |= array[shift:shift + count].astype(key_type) << key_type(8 * shift)
+    return keys
+
+
+def axis_signature(reference, axis_def):
+    """The axis point count followed by the axis values, as a2l2xdf addresses axes one value in."""
+    size = a2l2xdf.data_sizes[axis_def["dataSize"]]
+    start = int(axis_def["address"], 16) - size
+    return start, reference[max(start, 0):start + size * (axis_def["length"] + 1)]
+
+
+def data_signature(reference, table_def):
+    z = table_def["z"]
+    start = int(z["address"], 16)
+    length = a2l2xdf.data_sizes[z["dataSize"]] * z.get("length", 1) * z.get("rows", 1)
+    return start, reference[start:start + length]
+
+
+def locate(table_defs, reference, unknown):
+    """Moves each table_def to its place in unknown. Returns (located table_defs, report rows)."""
+    index = BinIndex(unknown)
+
+    # Every distinct axis and data block is searched once, all in one batch
+    lookups = {}
+    for table_def in table_defs:
+        lookups.setdefault(("z", table_def["z"]["address"]), data_signature(reference, table_def))
+        for axis_name in ("x", "y"):
+            if axis_name in table_def:
+                lookups.setdefault(("axis", table_def[axis_name]["address"]), axis_signature(reference, table_def[axis_name]))
+    keys = list(lookups)
+    positions, counts = index.find([lookups[key][1] for key in keys], [lookups[key][0] for key in keys])
+    shifts = {}
+    for key, position, count in zip(keys, positions, counts):
+        if position is not None:
+            shifts[key] = (position - lookups[key][0], count)
+
+    located = []
+    report = []
+    for table_def in table_defs:
+        old = int(table_def["z"]["address"], 16)
+        axis_shifts = {
+            axis_name: shifts.get(("axis", table_def[axis_name]["address"]))
+            for axis_name in ("x", "y") if axis_name in table_def
+        }
+        if ("z", table_def["z"]["address"]) in shifts:
+            shift, count = shifts[("z", table_def["z"]["address"])]
+            method = "data" if count == 1 else f"data ({count} matches)"
+        elif axis_shifts and all(axis_shifts.values()) and len({shift for shift, _ in axis_shifts.values()}) == 1:
+            shift = next(iter(axis_shifts.values()))[0]
+            method = "axis"
+        else:
+            short = not axis_shifts and len(lookups[("z", table_def["z"]["address"])][1]) < MIN_SIGNATURE
+            reason = "too short to match" if short else "not found"
+            report.append([table_def["description"].split("\n")[0], table_def["title"], hex(old), "", reason])
+            continue
+        if any(value is None for value in axis_shifts.values()):
+            report.append([table_def["description"].split("\n")[0], table_def["title"], hex(old), "", "axis not found"])
+            continue
+
+        moved = dict(table_def)
+        moved["z"] = dict(table_def["z"], address=hex(old + shift))
+        for axis_name, (axis_shift, _) in axis_shifts.items():
+            moved[axis_name] = dict(table_def[axis_name], address=hex(int(table_def[axis_name]["address"], 16) + axis_shift))
+        located.append(moved)
+        report.append([table_def["description"].split("\n")[0], table_def["title"], hex(old), hex(old + shift), method])
+    return located, report
+
+
+def main():
+    from a2lsession import A2LSession, read_rows
+
+    parser = argparse.ArgumentParser(description="Locate a known A2L's tables in a bin from another software version.")
+    parser.add_argument("a2l", help="A2L for the reference bin.")
+    parser.add_argument("reference", help="Bin that matches the A2L.")
+    parser.add_argument("csv", help="Tables to locate, see default.csv.")
+    parser.add_argument("unknown", help="Bin to search.")
+    parser.add_argument("-o", "--output", help="XDF to write (default: <unknown>.xdf).")
+    parser.add_argument("--report", help="Write old and new addresses of every table to this CSV.")
+    args = parser.parse_args()
+
+    with open(args.reference, "rb") as f:
+        reference = f.read()
+    with open(args.unknown, "rb") as f:
+        unknown = f.read()
+
+    a2l = A2LSession(args.a2l)
+    table_defs = list(a2l2xdf.table_defs_from_rows(a2l, read_rows(args.csv)))
+    located, report = locate(table_defs, reference, unknown)
+
+    output = args.output or f"{args.unknown}.xdf"
+    a2l2xdf.write_xdf(a2l2xdf.render_xdf(located, args.unknown), output)
+    if args.report:
+        with open(args.report, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Name", "Title", "Old Address", "New Address", "Found By"])
+            writer.writerows(report)
+    moved = sum(1 for row in report if row[3] and row[2] != row[3])
+    print(f"Located {len(located)} of {len(table_defs)} tables ({moved} moved); wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""Copies characteristics, with their axes, from one bin into bins of other software versions.
+
+    python3 maptransplant.py source.a2l source.bin tables.csv --target ecu101.a2l a.bin b.bin [--target ecu102.a2l c.bin] [--in-place]
+
+Characteristics are matched by name, as in a2lbincompare, so each A2L may
+place them anywhere. The CSV is in default.csv format; only "Table Name" is
+used. Each layout (data address, datatype and axis point counts, and the
+AXIS_PTS of each axis) is resolved once per A2L; a characteristic is only
+copied when the target's datatypes and dimensions match the source's.
+
+Every copy into a bin is applied in one vectorized write into the bin
+memory-mapped with NumPy. Targets are patched into <bin>.transplant<ext>, or
+in place with --in-place. Each map is reported as copied, unchanged or
+skipped with the reason.
+"""
+import argparse
+import csv
+import os
+import shutil
+
+import numpy as np
+
+from a2l2xdf import data_sizes
+from a2lsession import COMPARE_OFFSET
+
+
+def resolve_layout(a2l, name, offset=COMPARE_OFFSET):
+    """Returns where characteristic name and its axes lie in a bin, or None if the A2L has no such characteristic.
+
+    Axes include their leading point count, as a2l2xdf reads them.
+    """
+    characteristic = a2l.characteristic(name)
+    if characteristic is None:
+        return None
+    datatype = characteristic.deposit.fncValues["datatype"]
+    shape = [axis_ref.maxAxisPoints for axis_ref in characteristic.axisDescriptions]
+    size = data_sizes[datatype]
+    for points in shape:
+        size *= points
+    layout = {
+        "data": {"start": characteristic.address - offset, "size": size, "datatype": datatype, "shape": shape},
+        "axes": [],
+    }
+    for axis_ref in characteristic.axisDescriptions:
+        axis_pts = axis_ref.axisPtsRef
+        if axis_pts is None:
+            layout["axes"].append(None)  # Fixed or internal axis, nothing to copy
+            continue
+        axis_datatype = axis_pts.depositAttr.axisPts["x"]["datatype"]
+        layout["axes"].append(
+            {
+                "name": axis_pts.name,
+                "start": axis_pts.address - offset,
+                "size": data_sizes[axis_datatype] * (axis_ref.maxAxisPoints + 1),
+                "datatype": axis_datatype,
+            }
+        )
+    return layout
+
+
+def resolve_layouts(a2l, names, offset=COMPARE_OFFSET):
+    return {name: resolve_layout(a2l, name, offset) for name in names}
+
+
+def layout_mismatch(source, target):
+    """Returns why the target layout cannot take the source's data, or None when it can."""
+    if target is None:
+        return "not in target A2L"
+    if source["data"]["datatype"] != target["data"]["datatype"]:
+        return f"datatype {source['data']['datatype']} != {target['data']['datatype']}"
+    if source["data"]["shape"] != target["data"]["shape"]:
+        return f"shape {source['data']['shape']} != {target['data']['shape']}"
+    for number, (source_axis, target_axis) in enumerate(zip(source["axes"], target["axes"])):
+        if (source_axis is None) != (target_axis is None):
+            return f"axis {number} is fixed in only one A2L"
+        if source_axis is not None and source_axis["datatype"] != target_axis["datatype"]:
+            return f"axis {source_axis['name']} datatype {source_axis['datatype']} != {target_axis['datatype']}"
+    return None
+
+
+def layout_ranges(layout):
+    return [layout["data"]] + [axis for axis in layout["axes"] if axis is not None]
+
+
+def range_indices(starts, sizes):
+    """The byte positions covered by each (start, size) range, concatenated."""
+    starts = np.asarray(starts, dtype=np.int64)
+    sizes = np.asarray(sizes, dtype=np.int64)
+    ends = np.cumsum(sizes)
+    return np.repeat(starts - (ends - sizes), sizes) + np.arange(ends[-1] if len(ends) else 0, dtype=np.int64)
+
+
+def plan(source_layouts, target_layouts, source_size, target_size):
+    """Pairs up the source and target ranges of every map that can be copied.
+
+    Returns (copies, skipped): copies is a list of (name, source ranges,
+    target ranges), skipped a list of (name, reason).
+    """
+    copies = []
+    skipped = []
+    for name, source in source_layouts.items():
+        if source is None:
+            skipped.append((name, "not in source A2L"))
+            continue
+        target = target_layouts.get(name)
+        reason = layout_mismatch(source, target)
+        if reason is None:
+            source_ranges, target_ranges = layout_ranges(source), layout_ranges(target)
+            if any(part["start"] < 0 or part["start"] + part["size"] > source_size for part in source_ranges):
+                reason = "outside source bin"
+            elif any(part["start"] < 0 or part["start"] + part["size"] > target_size for part in target_ranges):
+                reason = "outside target bin"
+        if reason is not None:
+            skipped.append((name, reason))
+            continue
+        copies.append((name, source_ranges, target_ranges))
+    return copies, skipped
+
+
+def apply_copies(source, target_path, copies):
+    """Writes the copies from the source array into the bin at target_path in one vectorized write.
+
+    Returns the names of the maps whose bytes were already identical.
+    """
+    if not copies:
+        return []
+    source_starts, target_starts, sizes, owners = [], [], [], []
+    for number, (_, source_ranges, target_ranges) in enumerate(copies):
+        for source_part, target_part in zip(source_ranges, target_ranges):
+            source_starts.append(source_part["start"])
+            target_starts.append(target_part["start"])
+            sizes.append(source_part["size"])
+            owners.append(number)
+    source_indices = range_indices(source_starts, sizes)
+    target_indices = range_indices(target_starts, sizes)
+
+    target = np.memmap(target_path, dtype=np.uint8, mode="r+")
+    values = source[source_indices]
+    differs = values != target[target_indices]
+    changed = np.zeros(len(copies), dtype=bool)
+    np.logical_or.at(changed, np.asarray(owners), np.logical_or.reduceat(differs, np.cumsum([0] + sizes[:-1])))
+    target[target_indices] = values
+    target.flush()
+    del target
+    return [name for (name, _, _), was_changed in zip(copies, changed) if not was_changed]
+
+
+def transplanted_path(bin_path):
+    root, ext = os.path.splitext(bin_path)
+    return f"{root}.transplant{ext or '.bin'}"
+
+
+def transplant(source_a2l, source_bin, names, targets, in_place=False, offset=COMPARE_OFFSET):
+    """Copies the named maps from source_bin into each target bin.
+
+    targets is a list of (A2LSession, [bin paths]). Returns report rows of
+    (output bin, name, status, source address, target address).
+    """
+    source = np.memmap(source_bin, dtype=np.uint8, mode="r")
+    source_layouts = resolve_layouts(source_a2l, names, offset)
+    report = []
+    for a2l, bins in targets:
+        target_layouts = resolve_layouts(a2l, names, offset)
+        axis_users = a2l.axis_users()
+        warned = set()
+        for bin_path in bins:
+            output = bin_path if in_place else transplanted_path(bin_path)
+            if not in_place:
+                shutil.copyfile(bin_path, output)
+            copies, skipped = plan(source_layouts, target_layouts, len(source), os.path.getsize(output))
+            unchanged = set(apply_copies(source, output, copies))
+
+            copied_names = {name for name, _, _ in copies}
+            for name, _, _ in copies:
+                for axis in target_layouts[name]["axes"]:
+                    if axis is None or axis["name"] in warned:
+                        continue
+                    others = [user for user in axis_users.get(axis["name"], []) if user not in copied_names]
+                    if others:
+                        warned.add(axis["name"])
+                        print(f"******** Axis {axis['name']} is also used by {', '.join(others)}, which were not copied")
+            for name, source_ranges, target_ranges in copies:
+                status = "unchanged" if name in unchanged else "copied"
+                report.append((output, name, status, hex(source_ranges[0]["start"]), hex(target_ranges[0]["start"])))
+            for name, reason in skipped:
+                layout = target_layouts.get(name)
+                target_address = hex(layout["data"]["start"]) if layout is not None else ""
+                source_address = hex(source_layouts[name]["data"]["start"]) if source_layouts[name] is not None else ""
+                report.append((output, name, f"skipped: {reason}", source_address, target_address))
+    return report
+
+
+def main():
+    from a2lsession import A2LSession, read_rows
+
+    parser = argparse.ArgumentParser(description="Copy maps and their axes from one bin into bins with other A2Ls.")
+    parser.add_argument("a2l", help="A2L of the source bin.")
+    parser.add_argument("bin", help="Bin to copy from.")
+    parser.add_argument("csv", help="Tables to copy, see default.csv.")
+    parser.add_argument(
+        "--target", nargs="+", action="append", required=True, metavar=("A2L", "BIN"),
+        help="A target A2L followed by the bins that use it; may be repeated.",
+    )
+    parser.add_argument("--in-place", action="store_true", help="Patch the target bins instead of writing <bin>.transplant.bin.")
+    parser.add_argument("--report", help="Also write the per-map results to this CSV.")
+    args = parser.parse_args()
+
+    for target in args.target:
+        if len(target) < 2:
+            parser.error("--target needs an A2L and at least one bin")
+    names = [row["Table Name"] for row in read_rows(args.csv)]
+    source_a2l = A2LSession(args.a2l)
+    sessions = {}
+    targets = []
+    for a2l_path, *bins in args.target:
+        if a2l_path not in sessions:
+            sessions[a2l_path] = source_a2l if a2l_path == args.a2l else A2LSession(a2l_path)
+        targets.append((sessions[a2l_path], bins))
+
+    report = transplant(source_a2l, args.bin, names, targets, args.in_place)
+    for output, name, status, _, _ in report:
+        print(f"{output} : {name} : {status}")
+    outputs = sorted({row[0] for row in report})
+    for output in outputs:
+        rows = [row for row in report if row[0] == output]
+        copied = sum(1 for row in rows if row[2] == "copied")
+        unchanged = sum(1 for row in rows if row[2] == "unchanged")
+        print(f"{output}: {copied} copied, {unchanged} unchanged, {len(rows) - copied - unchanged} skipped")
+    if args.report:
+        with open(args.report, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Bin", "Name", "Status", "Source Address", "Target Address"])
+            writer.writerows(report)
+
+
+if __name__ == "__main__":
+    main()
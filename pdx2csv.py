@@ -1,52 +1,165 @@
+import argparse
 import csv
-from pathlib import Path
-from sys import argv
-import xml.etree.ElementTree as ET
+import sqlite3
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from fnmatch import fnmatch
+from functools import lru_cache
+from pathlib import Path, PurePosixPath
 from xml.etree.ElementTree import Element
 
-ecm_odx = list(Path(argv[1]).glob("EV_*"))[0].read_text(encoding='utf8')
-ecm_layer = ET.fromstring(ecm_odx)
+from xmlbackend import fromstring
 
-controlmodule_file = list(Path(argv[1]).glob("BL_LIBEnginContrModulUDS_*.odx"))
-if len(controlmodule_file) > 0:
-    controlmoduleuds_odx = list(Path(argv[1]).glob("BL_LIBEnginContrModulUDS_*.odx"))[0].read_text(encoding='utf8')
-else:
-    controlmoduleuds_odx = list(Path(argv[1]).glob("BV_Engin*.odx"))[0].read_text(encoding='utf8')
 
-control_module_layer = ET.fromstring(controlmoduleuds_odx)
+class PdxSource:
+    """An unzipped PDX directory or a .pdx archive."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        if self.path.is_dir():
+            self.archive = None
+            self.names = sorted(p.name for p in self.path.iterdir() if p.is_file())
+        else:
+            self.archive = zipfile.ZipFile(self.path)
+            self.names = sorted(self.archive.namelist())
+
+    def glob(self, pattern):
+        return [name for name in self.names if fnmatch(PurePosixPath(name).name, pattern)]
+
+    def parse(self, name):
+        if self.archive is not None:
+            return fromstring(self.archive.read(name))
+        return fromstring((self.path / name).read_bytes())
 
-layers = [control_module_layer, ecm_layer]
 
+source = None
 layers_by_name = {}
 
+EMPTY_CONVERSION = ("", 0, "", "")
+
+# UDS services whose requests carry a constant identifier, and the byte
+# position of that identifier in the request.
+SERVICE_KINDS = {0x22: ("did", 1), 0x31: ("routine", 2)}
+
+
+class LayerIndex:
+    """One ODX layer, indexed in a single traversal.
+
+    Every element with an ID is indexed for reference resolution, and the
+    DTCs, TABLEs and DIAG-SERVICEs are collected for extraction.
+    """
+
+    def __init__(self, filename, root):
+        self.filename = filename
+        self.root = root
+        self.by_id = {}
+        self.dops_by_short_name = {}
+        self.dtcs = []
+        self.tables = []
+        self.services = []
+        for element in root.iter():
+            tag = element.tag
+            if tag == "DTC":
+                self.dtcs.append(element)
+            elif tag == "TABLE":
+                self.tables.append(element)
+            elif tag == "DIAG-SERVICE":
+                self.services.append(element)
+            element_id = element.get("ID")
+            if element_id is not None:
+                self.by_id[element_id] = element
+                if tag == "DATA-OBJECT-PROP":
+                    self.dops_by_short_name.setdefault(element.findtext("SHORT-NAME"), element)
+
+
+def open_source(path):
+    global source
+    source = PdxSource(path)
+    layers_by_name.clear()
+    structure_conversion.cache_clear()
+    dop_conversion.cache_clear()
+    return source
+
+def index_layers():
+    """Indexes every layer of the source, control module and EV layers first.
+
+    Earlier layers win when the same identifier or DTC is defined twice.
+    """
+    ecm_file = source.glob("EV_*")[0]
+    controlmodule_file = source.glob("BL_LIBEnginContrModulUDS_*.odx")
+    if len(controlmodule_file) == 0:
+        controlmodule_file = source.glob("BV_Engin*.odx")
+    filenames = controlmodule_file[:1] + [ecm_file]
+    filenames += [name for name in source.glob("*.odx") if name not in filenames]
+    indexes = {filename: LayerIndex(filename, source.parse(filename)) for filename in filenames}
+    layers_by_name.update(indexes)
+    return list(indexes.values())
+
 def load_layer_by_name(layer_name):
     if layer_name in layers_by_name:
         return layers_by_name[layer_name]
-    filepath = list(Path(argv[1]).glob(layer_name + "*.odx"))[0]
-    layers_by_name[layer_name] = ET.fromstring(filepath.read_text(encoding='utf-8'))
+    filename = source.glob(layer_name + "*.odx")[0]
+    if filename not in layers_by_name:
+        layers_by_name[filename] = LayerIndex(filename, source.parse(filename))
+    layers_by_name[layer_name] = layers_by_name[filename]
     return layers_by_name[layer_name]
 
+def ecu_name(indexes):
+    for index in indexes:
+        short_name = index.root.find(".//ECU-VARIANT/SHORT-NAME")
+        if short_name is not None and short_name.text:
+            return short_name.text
+    return PurePosixPath(source.glob("EV_*")[0]).stem
+
 def layer_ref(layer, element):
     doc_name = element.get("DOCREF")
     if doc_name:
         layer = load_layer_by_name(doc_name)
     return layer
 
-def table_row_to_conversion(layer: Element, table_row: Element):
+def resolve(layer, ref):
+    """Follows an ID-REF (and its DOCREF), returning (layer, element)."""
+    layer = layer_ref(layer, ref)
+    return layer, layer.by_id.get(ref.get("ID-REF"))
+
+def table_row_to_conversion(layer: LayerIndex, table_row: Element):
     structure_ref = table_row.find("STRUCTURE-REF")
+    if structure_ref is None:
+        return EMPTY_CONVERSION
     structure_id = structure_ref.get("ID-REF")
     layer = layer_ref(layer, structure_ref)
-    structure = layer.find(f".//STRUCTURE[@ID='{structure_id}']")
-    dop_ref = structure.find('.//PARAM/DOP-REF')
+    return structure_conversion(layer, structure_id)
+
+def params_conversion(layer: LayerIndex, element: Element):
+    """Conversion of the first PARAM below element that references a DOP."""
+    dop_ref = element.find('.//PARAM/DOP-REF')
     if dop_ref is None:
-        dop_ref = structure.find('.//PARAM/DOP-SNREF')
-        dop_shortname = dop_ref.get("SHORT-NAME")
-        layer = layer_ref(layer, dop_ref)
-        data_format = layer.find(f".//DATA-OBJECT-PROP[@ID='{dop_shortname}']")
+        dop_ref = element.find('.//PARAM/DOP-SNREF')
+        if dop_ref is None:
+            return EMPTY_CONVERSION
+        dop_id = dop_ref.get("SHORT-NAME")
     else: 
         dop_id = dop_ref.get("ID-REF")
-        layer = layer_ref(layer, dop_ref)
-        data_format = layer.find(f".//DATA-OBJECT-PROP[@ID='{dop_id}']")
+    layer = layer_ref(layer, dop_ref)
+    return dop_conversion(layer, dop_id)
+
+# Many identifiers share the same STRUCTUREs and DOPs, so resolution is memoized
+# per (layer, ID). Layers are indexed once per source and open_source clears
+# the caches, which makes the LayerIndex itself a usable cache key.
+
+@lru_cache(maxsize=None)
+def structure_conversion(layer: LayerIndex, structure_id):
+    structure = layer.by_id.get(structure_id)
+    if structure is None:
+        return EMPTY_CONVERSION
+    return params_conversion(layer, structure)
+
+@lru_cache(maxsize=None)
+def dop_conversion(layer: LayerIndex, dop_id):
+    data_format = layer.by_id.get(dop_id)
+    if data_format is None:
+        data_format = layer.dops_by_short_name.get(dop_id)
     equation = ""
     byte_length = 0
     diag_type = ""
@@ -54,9 +167,7 @@ def table_row_to_conversion(layer: Element, table_row: Element):
     if data_format:
         unit_ref = data_format.find("UNIT-REF")
         if unit_ref is not None:
-            unit_id = unit_ref.get("ID-REF")
-            layer = layer_ref(layer, unit_ref)
-            unit = layer.find(f".//UNIT[@ID='{unit_id}']")
+            _, unit = resolve(layer, unit_ref)
             unit_display_name = unit.find("DISPLAY-NAME").text
         diag_type = data_format.find("DIAG-CODED-TYPE").get("BASE-DATA-TYPE")
         byte_length_val = data_format.find("DIAG-CODED-TYPE/BIT-LENGTH")
@@ -68,84 +179,323 @@ def table_row_to_conversion(layer: Element, table_row: Element):
             equation = f"( {numer_factors[1].text} * X + {numer_factors[0].text} ) / {denom_factors[0].text}"
     return (diag_type, byte_length, equation, unit_display_name)
 
-dtcs = []
-
-for dtc in ecm_layer.findall(".//DTC"):
-    dtc_code = dtc.find("TROUBLE-CODE").text
-    dtc_pcode = dtc.find("DISPLAY-TROUBLE-CODE").text
-    dtc_name = dtc.find("TEXT").text
-    dtc_symbol = dtc.get("OID")
-    dtcs.append(
-        {
-            'code': dtc_code,
-            'pcode': dtc_pcode,
-            'name': dtc_name,
-            'symbol': dtc_symbol
-        }
-    )
+def print_cache_stats():
+    for name, cached in (("STRUCTURE", structure_conversion), ("DATA-OBJECT-PROP", dop_conversion)):
+        info = cached.cache_info()
+        lookups = info.hits + info.misses
+        hit_rate = 100 * info.hits / lookups if lookups else 0
+        print(f"{name} cache: {info.hits}/{lookups} hits ({hit_rate:.1f}%), {info.currsize} resolved")
+
+# Extraction
+
+def extract_dtcs(indexes):
+    dtcs = {}
+    for index in indexes:
+        for dtc in index.dtcs:
+            dtc_code = dtc.find("TROUBLE-CODE").text
+            if dtc_code in dtcs:
+                continue
+            dtc_pcode = dtc.find("DISPLAY-TROUBLE-CODE").text
+            dtc_name = dtc.find("TEXT").text
+            dtc_symbol = dtc.get("OID")
+            dtcs[dtc_code] = {
+                'code': dtc_code,
+                'pcode': dtc_pcode,
+                'name': dtc_name,
+                'symbol': dtc_symbol
+            }
+    return list(dtcs.values())
+
+def format_identifier(value):
+    return f"{value:04x}"
+
+def table_kind(table):
+    name = (table.get("ID") or "") + (table.findtext("SHORT-NAME") or "")
+    if "Routi" in name:
+        return "routine"
+    if "DataIdent" in name:
+        return "did"
+    return None
+
+def key_identifiers(layer, table):
+    """Maps the KEYs of a table to numeric identifiers through its key DOP.
+
+    Tables without a KEY-DOP-REF use the DOP_TEXTTABLE<name> naming convention,
+    looked up across all layers.
+    """
+    key_dop_ref = table.find("KEY-DOP-REF")
+    if key_dop_ref is not None:
+        _, key_dop = resolve(layer, key_dop_ref)
+    else:
+        key_dop_id = "DOP_TEXTTABLE" + table.get("ID", "").removeprefix("TAB_")
+        key_dop = next(
+            (index.by_id[key_dop_id] for index in dict.fromkeys(layers_by_name.values()) if key_dop_id in index.by_id),
+            None,
+        )
+    keys = {}
+    if key_dop is not None:
+        for measurement_value in key_dop.iter("COMPU-SCALE"):
+            key = measurement_value.findtext(".//VT")
+            lower_limit = measurement_value.findtext(".//LOWER-LIMIT")
+            if key is not None and lower_limit is not None:
+                keys.setdefault(key, int(lower_limit))
+    return keys
 
-diag_info = []
-
-
-with open("dtc.csv", "w", newline="") as csvfile:
-    fieldnames = [
-        "code", "pcode", "name", "symbol"
-    ]
-    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-    writer.writeheader()
-    for info in dtcs:
-        writer.writerow(info)   
-
-for ident_table in ecm_layer.findall(".//DATA-OBJECT-PROP[@ID='DOP_TEXTTABLERecorDataIdentMeasuValue']"):
-    for measurement_value in ident_table.findall(".//COMPU-SCALE"):
-        identifier = int(measurement_value.find(".//LOWER-LIMIT").text).to_bytes(2, 'big').hex()
-        key = measurement_value.find(".//VT").text
-        for layer in layers:
-            table_row_ref = layer.find(f".//TABLE[@ID='TAB_RecorDataIdentMeasuValue']/TABLE-ROW/KEY[. = '{key}']/..")
-            if table_row_ref is not None:
-                row_layer = layer
-                break
-        if table_row_ref:
-            name = table_row_ref.find("LONG-NAME").text
-            description = table_row_ref.find("DESC")
-            if description:
-                description_text = ''.join(description.itertext()).replace("\n","").strip()
+def table_row_record(layer, table_row, identifier):
+    name = table_row.findtext("LONG-NAME") or table_row.findtext("SHORT-NAME")
+    description = table_row.find("DESC")
+    if description:
+        description_text = ''.join(description.itertext()).replace("\n","").strip()
+    else:
+        description_text = name
+    (diag_type, byte_length, equation, unit_display_name) = table_row_to_conversion(layer, table_row)
+    return {
+        'identifier': format_identifier(identifier),
+        'name': name,
+        'description': description_text,
+        'unit': unit_display_name,
+        'type': diag_type,
+        'bytes': int(byte_length),
+        'equation': equation
+    }
+
+def key_record(key, identifier):
+    return {
+        'identifier': format_identifier(identifier),
+        'name': key,
+        'description': key,
+        'unit': "",
+        'type': "",
+        'bytes': "",
+        'equation': ""
+    }
+
+def collect_tables(indexes, found):
+    tables = {}
+    for index in indexes:
+        for table in index.tables:
+            kind = table_kind(table)
+            if kind is not None:
+                tables.setdefault((kind, table.get("ID")), []).append((index, table))
+
+    for (kind, _), occurrences in tables.items():
+        rows = {}
+        keys = {}
+        for index, table in occurrences:
+            for table_row in table.findall("TABLE-ROW"):
+                rows.setdefault(table_row.findtext("KEY"), (index, table_row))
+            for key, identifier in key_identifiers(index, table).items():
+                keys.setdefault(key, identifier)
+        # Key DOP order first, then rows whose KEY is the identifier itself
+        for key, identifier in keys.items():
+            if key in rows:
+                record = table_row_record(*rows[key], identifier)
             else:
-                description_text = name
-            (diag_type, byte_length, equation, unit_display_name) = table_row_to_conversion(row_layer, table_row_ref)
-            diag_info.append(
-                {
-                    'identifier': identifier,
-                    'name': name,
-                    'description': description_text,
-                    'unit': unit_display_name,
-                    'type': diag_type,
-                    'bytes': int(byte_length),
-                    'equation': equation
-                }
-            )
-        else:
-            name = key
-            description_text = key
-            diag_info.append(
-                {
-                    'identifier': identifier,
-                    'name': key,
-                    'description': key,
-                    'unit': "",
-                    'type': "",
-                    'bytes': "",
-                    'equation': ""
-                }
+                record = key_record(key, identifier)
+            found[kind].setdefault(identifier, record)
+        for key, (index, table_row) in rows.items():
+            if key not in keys and key is not None and key.strip().isdigit():
+                found[kind].setdefault(int(key), table_row_record(index, table_row, int(key)))
+
+def coded_value(param):
+    value = param.findtext("CODED-VALUE")
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return int(value, 0)
+
+def collect_services(indexes, found):
+    for index in indexes:
+        for service in index.services:
+            request_ref = service.find("REQUEST-REF")
+            if request_ref is None:
+                continue
+            _, request = resolve(index, request_ref)
+            if request is None:
+                continue
+            coded_params = {
+                param.findtext("BYTE-POSITION"): coded_value(param)
+                for param in request.iter("PARAM")
+                if param.find("CODED-VALUE") is not None
+            }
+            kind, identifier_position = SERVICE_KINDS.get(coded_params.get("0"), (None, None))
+            identifier = coded_params.get(str(identifier_position))
+            if kind is None or identifier is None or identifier in found[kind]:
+                continue
+            conversion = EMPTY_CONVERSION
+            response_ref = service.find(".//POS-RESPONSE-REF")
+            if response_ref is not None:
+                response_layer, response = resolve(index, response_ref)
+                if response is not None:
+                    conversion = params_conversion(response_layer, response)
+            (diag_type, byte_length, equation, unit_display_name) = conversion
+            name = service.findtext("LONG-NAME") or service.findtext("SHORT-NAME")
+            found[kind][identifier] = {
+                'identifier': format_identifier(identifier),
+                'name': name,
+                'description': name,
+                'unit': unit_display_name,
+                'type': diag_type,
+                'bytes': int(byte_length),
+                'equation': equation
+            }
+
+def extract_identifiers(indexes):
+    """Collects every DID and routine of every layer: identifier tables first, then services."""
+    found = {"did": {}, "routine": {}}
+    collect_tables(indexes, found)
+    collect_services(indexes, found)
+    return list(found["did"].values()), list(found["routine"].values())
+
+def extract(path):
+    """Reads DTCs, $22 identifiers and $31 routines from one PDX source."""
+    open_source(path)
+    indexes = index_layers()
+    dtcs = extract_dtcs(indexes)
+    diag_info, routines = extract_identifiers(indexes)
+    return ecu_name(indexes), dtcs, diag_info, routines
+
+# CSV output
+
+dtc_fieldnames = ["code", "pcode", "name", "symbol"]
+diag_fieldnames = ["identifier", "name", "unit", "description", "type", "bytes", "equation"]
+
+def write_csv(filename, fieldnames, rows):
+    with open(filename, "w", newline="") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+
+        writer.writeheader()
+        for info in rows:
+            writer.writerow(info)
+
+# Batch mode: many sources, one SQLite database
+
+def batch_sources(paths):
+    """Expands the command line into PDX sources.
+
+    A directory holding an EV_* layer is an unzipped PDX; any other directory
+    contributes its .pdx files and unzipped PDX subdirectories.
+    """
+    sources = []
+    for path in map(Path, paths):
+        if not path.is_dir() or any(path.glob("EV_*")):
+            sources.append(path)
+            continue
+        for child in sorted(path.iterdir()):
+            if child.suffix.lower() == ".pdx" or (child.is_dir() and any(child.glob("EV_*"))):
+                sources.append(child)
+    return sources
+
+def create_schema(db):
+    db.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS ecus (
+            id INTEGER PRIMARY KEY,
+            ecu TEXT NOT NULL,
+            source TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS dtcs (
+            ecu_id INTEGER NOT NULL REFERENCES ecus(id),
+            ecu TEXT NOT NULL,
+            code TEXT, pcode TEXT, name TEXT, symbol TEXT
+        );
+        CREATE TABLE IF NOT EXISTS dids (
+            ecu_id INTEGER NOT NULL REFERENCES ecus(id),
+            ecu TEXT NOT NULL,
+            identifier TEXT, name TEXT, unit TEXT, description TEXT,
+            type TEXT, bytes INTEGER, equation TEXT
+        );
+        CREATE TABLE IF NOT EXISTS routines (
+            ecu_id INTEGER NOT NULL REFERENCES ecus(id),
+            ecu TEXT NOT NULL,
+            identifier TEXT, name TEXT, unit TEXT, description TEXT,
+            type TEXT, bytes INTEGER, equation TEXT
+        );
+        """
+    )
+
+def create_indexes(db):
+    db.executescript(
+        """
+        CREATE INDEX IF NOT EXISTS ecus_ecu ON ecus(ecu);
+        CREATE INDEX IF NOT EXISTS dtcs_ecu ON dtcs(ecu);
+        CREATE INDEX IF NOT EXISTS dtcs_code ON dtcs(code);
+        CREATE INDEX IF NOT EXISTS dtcs_pcode ON dtcs(pcode);
+        CREATE INDEX IF NOT EXISTS dids_ecu ON dids(ecu);
+        CREATE INDEX IF NOT EXISTS dids_identifier ON dids(identifier);
+        CREATE INDEX IF NOT EXISTS routines_ecu ON routines(ecu);
+        CREATE INDEX IF NOT EXISTS routines_identifier ON routines(identifier);
+        """
+    )
+
+def store_source(db, source_path, ecu, dtcs, diag_info, routines):
+    previous = db.execute("SELECT id FROM ecus WHERE source = ?", (source_path,)).fetchone()
+    if previous is not None:
+        for table in ("dtcs", "dids", "routines", "ecus"):
+            column = "id" if table == "ecus" else "ecu_id"
+            db.execute(f"DELETE FROM {table} WHERE {column} = ?", previous)
+    ecu_id = db.execute("INSERT INTO ecus (ecu, source) VALUES (?, ?)", (ecu, source_path)).lastrowid
+    db.executemany(
+        "INSERT INTO dtcs VALUES (:ecu_id, :ecu, :code, :pcode, :name, :symbol)",
+        ({**dtc, "ecu_id": ecu_id, "ecu": ecu} for dtc in dtcs),
+    )
+    for table, rows in (("dids", diag_info), ("routines", routines)):
+        db.executemany(
+            f"INSERT INTO {table} VALUES (:ecu_id, :ecu, :identifier, :name, :unit, :description, :type, :bytes, :equation)",
+            ({**info, "ecu_id": ecu_id, "ecu": ecu} for info in rows),
+        )
+
+def extract_for_batch(path):
+    start = time.perf_counter()
+    ecu, dtcs, diag_info, routines = extract(path)
+    return ecu, dtcs, diag_info, routines, time.perf_counter() - start
+
+def run_batch(paths, database, jobs=None):
+    sources = batch_sources(paths)
+    failures = 0
+    db = sqlite3.connect(database)
+    create_schema(db)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(extract_for_batch, str(path)): str(path.resolve()) for path in sources}
+        for future in as_completed(futures):
+            source_path = futures[future]
+            try:
+                ecu, dtcs, diag_info, routines, elapsed = future.result()
+            except Exception as e:
+                failures += 1
+                print(f"******** Failed {source_path}: {e}")
+                continue
+            with db:
+                store_source(db, source_path, ecu, dtcs, diag_info, routines)
+            print(
+                f"{ecu}: {len(dtcs)} DTCs, {len(diag_info)} identifiers, {len(routines)} routines"
+                f" in {elapsed:.2f}s ({source_path})"
             )
+    create_indexes(db)
+    db.close()
+    print(f"Processed {len(sources) - failures}/{len(sources)} sources into {database}")
+    return failures == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract DTCs, $22 identifiers and $31 routines from PDX files.")
+    parser.add_argument("sources", nargs="+", help="Unzipped PDX directories or .pdx files.")
+    parser.add_argument("--output-dir", default=".", help="Where dtc.csv, diag.csv and routines.csv are written.")
+    parser.add_argument("--batch", metavar="DATABASE", help="Process every source in parallel into one SQLite database.")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Worker processes for --batch (default: CPU count).")
+    args = parser.parse_args()
 
-with open("diag.csv", "w", newline="") as csvfile:
-    fieldnames = [
-        "identifier","name","unit","description","type","bytes","equation"
-    ]
-    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+    if args.batch:
+        raise SystemExit(0 if run_batch(args.sources, args.batch, args.jobs) else 1)
+    if len(args.sources) > 1:
+        parser.error("pass --batch to process more than one source")
 
-    writer.writeheader()
-    for info in diag_info:
-        writer.writerow(info)   
\ No newline at end of file
+    ecu, dtcs, diag_info, routines = extract(args.sources[0])
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    write_csv(output_dir / "dtc.csv", dtc_fieldnames, dtcs)
+    write_csv(output_dir / "diag.csv", diag_fieldnames, diag_info)
+    write_csv(output_dir / "routines.csv", diag_fieldnames, routines)
+    print_cache_stats()
@@ -0,0 +1,79 @@
+import io
+
+import pytest
+
+import a2lclean
+from a2lclean import LineCleaner, clean_a2l, read_blocks
+
+
+def clean(text):
+    cleaner = LineCleaner()
+    return "".join(cleaner.clean(line) for line in text.splitlines(keepends=True)), cleaner
+
+
+@pytest.mark.parametrize(
+    "line, expected, markers",
+    [
+        ('"a //= b"\n', '"a = b"\n', 1),
+        ('"a // b"\n', '"a / / b"\n', 1),
+        ('"a //= b // c"\n', '"a = b / / c"\n', 2),
+        ('x //= y "a // b"\n', 'x //= y "a // b"\n', 0),  # After a line comment nothing is a string
+        ('"a" //= b\n', '"a" //= b\n', 0),
+        ('"a \\" //= b"\n', '"a \\" = b"\n', 1),  # Escaped quote keeps the string open
+        ('/* "a //= b" */ "c //= d"\n', '/* "a //= b" */ "c = d"\n', 1),
+    ],
+)
+def test_comment_markers_only_in_strings(line, expected, markers):
+    cleaned, cleaner = clean(line)
+    assert cleaned == expected
+    assert cleaner.comment_markers == markers
+
+
+def test_state_carries_across_lines():
+    text = '/begin X "first line\n  still //= in the string"\n/* "not //= a string\n */ "a //= b" // "c //= d"\n'
+    cleaned, _ = clean(text)
+    assert cleaned == (
+        '/begin X "first line\n  still = in the string"\n/* "not //= a string\n */ "a = b" // "c //= d"\n'
+    )
+
+
+def test_control_characters_are_dropped():
+    cleaned, cleaner = clean('"a\x01b"\tc\x7f\n')
+    assert cleaned == '"ab"\tc\n'
+    assert cleaner.control_characters == 2
+
+
+def test_clean_block_matches_line_by_line():
+    text = 'plain line\n"open //= string\nclosed" // tail\n"x//y"\n'
+    assert LineCleaner().clean_block(text) == clean(text)[0]
+
+
+def test_read_blocks_end_on_line_breaks(monkeypatch):
+    monkeypatch.setattr(a2lclean, "BLOCK_SIZE", 4)
+    text = "one\ntwo three\n\nfour"
+    blocks = list(read_blocks(io.StringIO(text)))
+    assert "".join(blocks) == text
+    assert all(block.endswith("\n") for block in blocks[:-1])
+
+
+@pytest.mark.parametrize("block_size", [1, 3, 7, 16, 1 << 20])
+def test_clean_a2l_does_not_depend_on_block_size(tmp_path, monkeypatch, block_size):
+    source = tmp_path / "in.a2l"
+    source.write_bytes(
+        '/begin CHARACTERISTIC C "a //= multi\nline // string"\n/* comment "/*\n //= */\n"b //= c" °C\n'.encode("cp1252")
+    )
+    monkeypatch.setattr(a2lclean, "BLOCK_SIZE", block_size)
+    encoding, changed, cleaner = clean_a2l(source, tmp_path / "out.a2l")
+    assert encoding == "cp1252"
+    assert changed
+    assert cleaner.comment_markers == 3
+    assert (tmp_path / "out.a2l").read_text(encoding="utf-8") == (
+        '/begin CHARACTERISTIC C "a = multi\nline / / string"\n/* comment "/*\n //= */\n"b = c" °C\n'
+    )
+
+
+def test_prepare_import_keeps_clean_files(tmp_path):
+    source = tmp_path / "clean.a2l"
+    source.write_text('/begin PROJECT P "no markers"\n/end PROJECT\n', encoding="utf-8")
+    assert a2lclean.prepare_import(str(source)) == str(source)
+    assert not (tmp_path / "clean.clean.a2l").exists()
@@ -0,0 +1,138 @@
+import io
+
+import pytest
+
+import a2lclean
+from a2lprune import index_a2l, prune_a2l
+
+A2L = """ASAP2_VERSION 1 61
+/begin PROJECT P ""
+/begin MODULE M "module with \\"/*\\" in its name"
+/begin MOD_PAR ""
+/begin MEMORY_SEGMENT _ROM "" DATA FLASH INTERN 0xA0800000 0x400000 -1 -1 -1 -1 -1
+/end MEMORY_SEGMENT
+/end MOD_PAR
+/begin RECORD_LAYOUT RL_UBYTE
+  FNC_VALUES 1 UBYTE COLUMN_DIR DIRECT
+/end RECORD_LAYOUT
+/begin RECORD_LAYOUT RL_UWORD
+  FNC_VALUES 1 UWORD COLUMN_DIR DIRECT
+/end RECORD_LAYOUT
+/begin RECORD_LAYOUT AX_UWORD
+  NO_AXIS_PTS_X 1 UBYTE
+  AXIS_PTS_X 2 UWORD INDEX_INCR DIRECT
+/end RECORD_LAYOUT
+/begin COMPU_METHOD CM_RPM "" RAT_FUNC "%6.2" "rpm"
+  COEFFS 0 1 0 0 0 0.25
+/end COMPU_METHOD
+/begin COMPU_METHOD CM_T "temperature /* not a comment" RAT_FUNC "%6.2" "degC"
+  COEFFS 0 1 40 0 0 0.75
+/end COMPU_METHOD
+/* /begin CHARACTERISTIC COMMENTED "" VALUE 0xA0810000 RL_UBYTE 0 CM_T 0 255
+/end CHARACTERISTIC */
+/begin AXIS_PTS AX_RPM "rpm axis" 0xA0810000 NO_INPUT_QUANTITY AX_UWORD 0 CM_RPM 8 0 6000
+/end AXIS_PTS
+/begin AXIS_PTS AX_T "temperature axis" 0xA0810020 NO_INPUT_QUANTITY AX_UWORD 0 CM_T 4 -40 150
+/end AXIS_PTS
+/begin AXIS_PTS AX_UNUSED "" 0xA0810040 NO_INPUT_QUANTITY AX_UWORD 0 CM_T 4 -40 150
+/end AXIS_PTS
+/begin
+  CHARACTERISTIC MAP_A "split /begin, and a
+  string running over /* two lines" MAP 0xA0810100 RL_UWORD 0 CM_T 0 255
+  DISPLAY_IDENTIFIER map_a
+  /begin AXIS_DESCR COM_AXIS NO_INPUT_QUANTITY CM_RPM 8 0 6000
+    AXIS_PTS_REF AX_RPM
+  /end AXIS_DESCR
+  /begin AXIS_DESCR COM_AXIS NO_INPUT_QUANTITY CM_T 4 -40 150
+    AXIS_PTS_REF AX_T
+  /end AXIS_DESCR
+/end CHARACTERISTIC
+/begin CHARACTERISTIC CURVE_B "shares the rpm axis" CURVE 0xA0810200 RL_UBYTE 0 CM_RPM 0 255
+  DISPLAY_IDENTIFIER curve_b
+  /begin AXIS_DESCR COM_AXIS NO_INPUT_QUANTITY CM_RPM 8 0 6000
+    AXIS_PTS_REF AX_RPM
+  /end AXIS_DESCR
+/end CHARACTERISTIC
+/begin CHARACTERISTIC VALUE_C "unrelated // text" VALUE 0xA0810300 RL_UBYTE 0 CM_T 0 255
+/end CHARACTERISTIC
+/end MODULE
+/end PROJECT
+"""
+
+
+def blocks(block_size, monkeypatch):
+    monkeypatch.setattr(a2lclean, "BLOCK_SIZE", block_size)
+    return index_a2l(io.StringIO(A2L)).blocks
+
+
+def test_index_finds_every_block():
+    names = [(block_type, name) for block_type, name, _, _ in index_a2l(io.StringIO(A2L)).blocks]
+    assert names == [
+        ("RECORD_LAYOUT", "RL_UBYTE"),
+        ("RECORD_LAYOUT", "RL_UWORD"),
+        ("RECORD_LAYOUT", "AX_UWORD"),
+        ("COMPU_METHOD", "CM_RPM"),
+        ("COMPU_METHOD", "CM_T"),
+        ("AXIS_PTS", "AX_RPM"),
+        ("AXIS_PTS", "AX_T"),
+        ("AXIS_PTS", "AX_UNUSED"),
+        ("CHARACTERISTIC", "MAP_A"),
+        ("CHARACTERISTIC", "CURVE_B"),
+        ("CHARACTERISTIC", "VALUE_C"),
+    ]
+
+
+@pytest.mark.parametrize("block_size", [1, 2, 5, 13, 64])
+def test_index_does_not_depend_on_block_size(monkeypatch, block_size):
+    assert blocks(block_size, monkeypatch) == blocks(1 << 20, monkeypatch)
+
+
+def test_block_spans_cover_their_text():
+    for block_type, name, start, end in index_a2l(io.StringIO(A2L)).blocks:
+        text = A2L[start:end]
+        assert text.lstrip().startswith("/begin")
+        assert text.rstrip().endswith(f"/end {block_type}")
+        assert name in text
+
+
+def test_keep_follows_references_and_shared_axes():
+    index = index_a2l(io.StringIO(A2L))
+    kept, missing = index.keep(["MAP_A", "NOT_THERE"])
+    assert missing == ["NOT_THERE"]
+    assert {name for _, name, _, _ in index.blocks} & kept == {"MAP_A", "CURVE_B", "AX_RPM", "AX_T", "RL_UWORD", "RL_UBYTE", "AX_UWORD", "CM_RPM", "CM_T"}
+
+
+def test_prune_drops_only_unneeded_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(a2lclean, "BLOCK_SIZE", 7)
+    source = tmp_path / "ecu.a2l"
+    source.write_text(A2L, encoding="utf-8")
+    kept, total, missing = prune_a2l(source, tmp_path / "pruned.a2l", ["MAP_A"])
+    assert (kept, total, missing) == (9, 11, [])
+    pruned = (tmp_path / "pruned.a2l").read_text(encoding="utf-8")
+    assert "VALUE_C" not in pruned and "AX_UNUSED" not in pruned
+    assert "/* /begin CHARACTERISTIC COMMENTED" in pruned
+    assert pruned == A2L.replace(
+        '/begin AXIS_PTS AX_UNUSED "" 0xA0810040 NO_INPUT_QUANTITY AX_UWORD 0 CM_T 4 -40 150\n/end AXIS_PTS\n', ""
+    ).replace('/begin CHARACTERISTIC VALUE_C "unrelated // text" VALUE 0xA0810300 RL_UBYTE 0 CM_T 0 255\n/end CHARACTERISTIC\n', "")
+
+
+def test_pruned_a2l_imports_the_same_characteristics(tmp_path):
+    pytest.importorskip("pya2l")
+    import a2l2xdf
+    from a2lsession import A2LSession
+
+    source = tmp_path / "ecu.a2l"
+    source.write_text(A2L, encoding="utf-8")
+    rows = [
+        {"Category 1": "Maps", "Category 2": "", "Category 3": "", "Table Name": "MAP_A", "Custom Name": ""},
+        {"Category 1": "Maps", "Category 2": "", "Category 3": "", "Table Name": "CURVE_B", "Custom Name": ""},
+    ]
+    full = A2LSession(str(source))
+    pruned = A2LSession(str(source), keep=["MAP_A", "CURVE_B"])
+    try:
+        assert pruned.characteristic("VALUE_C") is None
+        assert pruned.axis_users() == {"AX_RPM": ["CURVE_B", "MAP_A"], "AX_T": ["MAP_A"]}
+        assert list(a2l2xdf.table_defs_from_rows(pruned, rows)) == list(a2l2xdf.table_defs_from_rows(full, rows))
+    finally:
+        full.close()
+        pruned.close()
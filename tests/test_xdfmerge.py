@@ -0,0 +1,98 @@
+import io
+
+from xdfmerge import merge_xdf
+from xdfreader import index_xdf
+
+MANUAL_TABLE = """<XDFTABLE uniqueid="0x9" flags="0x30">
+    <title>Manual table</title>
+    <description>Kept by hand &amp; not generated</description>
+    <CATEGORYMEM index="0" category="2" />
+    <XDFAXIS id="z">
+      <EMBEDDEDDATA mmedaddress="0x9000" mmedelementsizebits="8" />
+      <MATH equation="X*2">
+        <VAR id="X" />
+      </MATH>
+    </XDFAXIS>
+  </XDFTABLE>"""
+
+EXISTING = f"""<?xml version='1.0' encoding='utf-8'?>
+<XDFFORMAT version="1.70">
+  <XDFHEADER>
+    <deftitle>curated</deftitle>
+    <CATEGORY index="0x0" name="Fuel" />
+    <CATEGORY index="0x1" name="Manual" />
+  </XDFHEADER>
+  <XDFTABLE uniqueid="0x1" flags="0x30">
+    <title>Old title</title>
+    <CATEGORYMEM index="0" category="1" />
+    <XDFAXIS id="z">
+      <EMBEDDEDDATA mmedaddress="0x1000" mmedelementsizebits="8" />
+    </XDFAXIS>
+  </XDFTABLE>
+  {MANUAL_TABLE}
+  <XDFPATCH uniqueid="0x20">
+    <title>Patch</title>
+  </XDFPATCH>
+</XDFFORMAT>"""
+
+GENERATED = """<?xml version='1.0' encoding='utf-8'?>
+<XDFFORMAT version="1.70">
+  <XDFHEADER>
+    <deftitle>generated</deftitle>
+    <CATEGORY index="0x0" name="Ignition" />
+    <CATEGORY index="0x1" name="Fuel" />
+  </XDFHEADER>
+  <XDFTABLE uniqueid="0x0" flags="0x30">
+    <title>Fuel map</title>
+    <CATEGORYMEM index="0" category="2" />
+    <XDFAXIS id="z">
+      <EMBEDDEDDATA mmedaddress="0x1000" mmedelementsizebits="16" />
+    </XDFAXIS>
+  </XDFTABLE>
+  <XDFTABLE uniqueid="0x0" flags="0x30">
+    <title>Ignition map</title>
+    <CATEGORYMEM index="0" category="1" />
+    <XDFAXIS id="z">
+      <EMBEDDEDDATA mmedaddress="0x2000" mmedelementsizebits="8" />
+    </XDFAXIS>
+  </XDFTABLE>
+</XDFFORMAT>"""
+
+
+def merge(tmp_path, keep_existing=False):
+    output = tmp_path / "merged.xdf"
+    stats = merge_xdf(io.BytesIO(EXISTING.encode()), io.BytesIO(GENERATED.encode()), output, keep_existing)
+    return stats, output.read_text(encoding="utf-8")
+
+
+def test_merge_updates_matching_tables_and_appends_new_ones(tmp_path):
+    stats, merged = merge(tmp_path)
+    assert stats == {"updated": 1, "kept": 0, "inserted": 1, "categories_added": 1}
+    index = index_xdf(io.BytesIO(merged.encode()))
+    assert index.title == "curated"
+    assert [table["title"] for table in index.tables] == ["Fuel map", "Manual table", "Ignition map"]
+    assert index.by_address[0x1000][0]["axes"]["z"]["bits"] == 16
+
+
+def test_merge_preserves_manual_tables_and_patches(tmp_path):
+    _, merged = merge(tmp_path)
+    assert MANUAL_TABLE in merged
+    assert '<XDFPATCH uniqueid="0x20">' in merged
+    assert merged.endswith("</XDFFORMAT>")
+
+
+def test_merge_remaps_categorymem(tmp_path):
+    _, merged = merge(tmp_path)
+    index = index_xdf(io.BytesIO(merged.encode()))
+    assert index.categories == {0: "Fuel", 1: "Manual", 2: "Ignition"}
+    # CATEGORYMEM numbers are 1-based: Fuel was generated as 2 and is 1 here, Ignition moves from 1 to 3
+    assert index.by_title["Fuel map"][0]["categories"] == [1]
+    assert index.by_title["Ignition map"][0]["categories"] == [3]
+    assert index.by_title["Manual table"][0]["categories"] == [2]
+
+
+def test_keep_existing_only_adds(tmp_path):
+    stats, merged = merge(tmp_path, keep_existing=True)
+    assert stats == {"updated": 0, "kept": 1, "inserted": 1, "categories_added": 1}
+    index = index_xdf(io.BytesIO(merged.encode()))
+    assert [table["title"] for table in index.tables] == ["Old title", "Manual table", "Ignition map"]
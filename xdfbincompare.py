@@ -0,0 +1,221 @@
+"""Compares two bins table by table using only an XDF, with no A2L import.
+
+    python3 xdfbincompare.py tables.xdf a.bin b.bin [search_term] [--values]
+
+The XDF (from a2l2xdf, json2xdf or made by hand) is read once into an
+address table: the byte range of every XDFTABLE / XDFCONSTANT's data and
+axes, from the EMBEDDEDDATA address, element size, row and column counts
+and strides. Both bins are memory-mapped with NumPy; the positions where
+they differ are counted once into a running sum, so whether any range
+changed is two lookups per range, whatever the number of tables.
+
+Tables that differ are printed as "title : changed/total cells", plus
+which axes changed. With --values, their changed cells are decoded through
+the XDF's MATH equations and printed before and after. Equations that are
+not plain arithmetic in X are left undecoded. Numbers in equations are
+evaluated as floats, so a huge constant power overflows rather than hangs.
+"""
+import argparse
+import ast
+
+import numpy as np
+
+from xdfreader import data_size, index_xdf
+
+FLAG_SIGNED = 0x01
+FLAG_LSB_FIRST = 0x02
+FLAG_COLUMN_MAJOR = 0x04
+FLAG_FLOAT = 0x10000
+PARTS = ("z", "x", "y")
+EQUATION_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Constant, ast.Name, ast.Load,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.Mod, ast.USub, ast.UAdd,
+)
+
+
+class AddressTable:
+    """The byte range of every table part in an XDF, as parallel NumPy arrays."""
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.owners = []  # (table number, part) of each range
+        starts = []
+        sizes = []
+        for number, table in enumerate(tables):
+            for part in PARTS:
+                layout = table["axes"].get(part)
+                if layout is None or layout["address"] is None:
+                    continue
+                self.owners.append((number, part))
+                starts.append(layout["address"])
+                sizes.append(data_size(layout))
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = self.starts + np.asarray(sizes, dtype=np.int64)
+
+
+def address_table(xdf, search_term=None):
+    """Reads the XDF into an AddressTable, keeping only tables whose title contains search_term."""
+    tables = [
+        table for table in index_xdf(xdf).tables
+        if not search_term or search_term in table["title"]
+    ]
+    return AddressTable(tables)
+
+
+def changed_ranges(table, data_a, data_b):
+    """Returns a boolean array: whether each range of the AddressTable differs between the two bins.
+
+    Ranges past the end of either bin count as changed.
+    """
+    length = min(len(data_a), len(data_b))
+    differs = np.asarray(data_a[:length]) != np.asarray(data_b[:length])
+    counts = np.zeros(length + 1, dtype=np.int64)
+    np.cumsum(differs, out=counts[1:])
+    outside = (table.starts < 0) | (table.ends > length)
+    starts = np.clip(table.starts, 0, length)
+    ends = np.clip(table.ends, 0, length)
+    return outside | (counts[ends] - counts[starts] > 0)
+
+
+def element_type(layout):
+    """The NumPy dtype of one element of an EMBEDDEDDATA layout."""
+    flags = layout["flags"]
+    size = max(layout["bits"] // 8, 1)
+    kind = "f" if flags & FLAG_FLOAT else ("i" if flags & FLAG_SIGNED else "u")
+    return np.dtype(f"{'<' if flags & FLAG_LSB_FIRST else '>'}{kind}{size}")
+
+
+def element_offsets(layout):
+    """Byte offset of each cell from the layout's address, shaped (rows, cols)."""
+    element = max(layout["bits"] // 8, 1)
+    cols = max(layout["cols"], 1)
+    rows = max(layout["rows"], 1)
+    if layout["flags"] & FLAG_COLUMN_MAJOR:
+        row_step = max(layout["minor_stride_bits"] // 8, element)
+        column_step = max(layout["major_stride_bits"] // 8, rows * row_step)
+    else:
+        column_step = max(layout["minor_stride_bits"] // 8, element)
+        row_step = max(layout["major_stride_bits"] // 8, cols * column_step)
+    return np.arange(rows)[:, None] * row_step + np.arange(cols)[None, :] * column_step
+
+
+def read_cells(data, layout):
+    """The raw values of a layout's cells in a bin, shaped (rows, cols)."""
+    dtype = element_type(layout)
+    positions = layout["address"] + element_offsets(layout)
+    raw = np.asarray(data)[positions[..., None] + np.arange(dtype.itemsize)]
+    return np.ascontiguousarray(raw).view(dtype)[..., 0]
+
+
+_equations = {}
+
+
+class FloatConstants(ast.NodeTransformer):
+    """Makes every number in an equation a float, so huge powers overflow instead of growing without bound."""
+
+    def visit_Constant(self, node):
+        return ast.copy_location(ast.Constant(float(node.value)), node)
+
+
+def compile_equation(equation):
+    """Compiles an XDF MATH equation in X, or returns None when it is not plain arithmetic."""
+    if equation not in _equations:
+        try:
+            tree = ast.parse(equation.strip(), mode="eval")
+            plain = all(
+                isinstance(node, EQUATION_NODES)
+                and (not isinstance(node, ast.Name) or node.id == "X")
+                and (not isinstance(node, ast.Constant) or type(node.value) in (int, float))
+                for node in ast.walk(tree)
+            )
+            if plain:
+                tree = ast.fix_missing_locations(FloatConstants().visit(tree))
+            _equations[equation] = compile(tree, "<equation>", "eval") if plain else None
+        except SyntaxError:
+            _equations[equation] = None
+    return _equations[equation]
+
+
+def decode(values, equation):
+    """Applies an XDF MATH equation to an array of raw values; returns the raw values if it cannot."""
+    code = compile_equation(equation)
+    if code is None:
+        return values
+    with np.errstate(all="ignore"):
+        try:
+            return eval(code, {"__builtins__": {}}, {"X": values.astype(np.float64)})
+        except ArithmeticError:  # Constant parts that overflow or divide by zero
+            return values
+
+
+def compare_bins(table, data_a, data_b):
+    """Returns a dict for each table of the AddressTable that differs between two bins (bytes or arrays).
+
+    Each has the table summary, the parts ("z", "x", "y") that changed, and
+    for z data, the cell count and the number of changed cells.
+    """
+    changed = changed_ranges(table, data_a, data_b)
+    length = min(len(data_a), len(data_b))
+    differences = {}
+    for (number, part), is_changed, end in zip(table.owners, changed, table.ends):
+        if not is_changed:
+            continue
+        difference = differences.setdefault(number, {"table": table.tables[number], "parts": [], "cells": 0, "changed": 0})
+        difference["parts"].append(part)
+        if part == "z":
+            layout = table.tables[number]["axes"]["z"]
+            difference["cells"] = max(layout["rows"], 1) * max(layout["cols"], 1)
+            if end <= length and layout["address"] >= 0:
+                difference["changed"] = int(np.count_nonzero(read_cells(data_a, layout) != read_cells(data_b, layout)))
+            else:
+                difference["changed"] = difference["cells"]  # Past the end of a bin
+    return [differences[number] for number in sorted(differences)]
+
+
+def compare_xdf(xdf, bin_a, bin_b, search_term=None):
+    """Like A2LSession.compare, but reads the tables from an XDF; bins may be paths or bytes."""
+    return compare_bins(address_table(xdf, search_term), open_bin(bin_a), open_bin(bin_b))
+
+
+def open_bin(bin_file):
+    if isinstance(bin_file, (bytes, bytearray, memoryview)):
+        return np.frombuffer(bin_file, dtype=np.uint8)
+    return np.memmap(bin_file, dtype=np.uint8, mode="r")
+
+
+def print_values(difference, data_a, data_b):
+    layout = difference["table"]["axes"]["z"]
+    before = decode(read_cells(data_a, layout), layout["equation"])
+    after = decode(read_cells(data_b, layout), layout["equation"])
+    for row, col in zip(*np.nonzero(before != after)):
+        print(f"    [{row}, {col}] {before[row, col]:g} -> {after[row, col]:g}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List the XDF tables whose data differs between two bins.")
+    parser.add_argument("xdf")
+    parser.add_argument("bin_a")
+    parser.add_argument("bin_b")
+    parser.add_argument("search_term", nargs="?", help="Only compare tables whose title contains this.")
+    parser.add_argument("--values", action="store_true", help="Print the changed cells, decoded through the XDF MATH.")
+    args = parser.parse_args()
+
+    table = address_table(args.xdf, args.search_term)
+    data_a, data_b = open_bin(args.bin_a), open_bin(args.bin_b)
+    for difference in compare_bins(table, data_a, data_b):
+        title = difference["table"]["title"]
+        axes = [part for part in difference["parts"] if part != "z"]
+        line = title + " : "
+        if "z" in difference["parts"]:
+            line += f"{difference['changed']}/{difference['cells']} cells"
+        else:
+            line += "data unchanged" if "z" in difference["table"]["axes"] else "no data"
+        if axes:
+            line += f", {' and '.join(axes)} axis changed"
+        print(line)
+        if args.values and "z" in difference["parts"]:
+            print_values(difference, data_a, data_b)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""Merges a generated XDF into an existing, hand-curated one.
+
+    python3 xdfmerge.py curated.xdf generated.xdf [-o merged.xdf] [--keep-existing]
+
+Generated tables replace the existing table with the same data address, or
+failing that the same title; the rest of the existing file (manual tables,
+flags, patches, header) is kept as it is. Generated tables with no match are
+appended. Categories are matched by name: generated ones the existing file
+lacks are added next to its own and every CATEGORYMEM is renumbered to fit.
+
+The existing file is streamed, so only the generated tables are held in
+memory.
+"""
+import argparse
+import os
+import tempfile
+
+import xmlbackend
+from xdfreader import TABLE_TAGS, iter_xdf, read_categories, read_table
+
+
+class GeneratedTables:
+    """The tables of the generated XDF, looked up by data address and title."""
+
+    def __init__(self, source):
+        self.tables = []
+        self.categories = {}
+        self.by_address = {}
+        self.by_title = {}
+        for _, element in iter_xdf(source):
+            if element.tag in ("XDFHEADER", "CATEGORY"):
+                self.categories.update(read_categories(element))
+            elif element.tag in TABLE_TAGS:
+                table = read_table(element)
+                entry = {"element": element, "table": table, "written": False}
+                self.tables.append(entry)
+                if table["address"] is not None:
+                    self.by_address.setdefault(table["address"], entry)
+                self.by_title.setdefault(table["title"], entry)
+
+    def match(self, table):
+        """Returns the unwritten generated entry matching an existing table, if any."""
+        for entry in (self.by_address.get(table["address"]), self.by_title.get(table["title"])):
+            if entry is not None and not entry["written"]:
+                return entry
+        return None
+
+    def unwritten(self):
+        return [entry for entry in self.tables if not entry["written"]]
+
+
+def category_remap(existing_categories, generated_categories):
+    """Maps generated CATEGORYMEM numbers (1-based) to the existing file's, and lists categories to add."""
+    index_by_name = {name: index for index, name in existing_categories.items()}
+    next_index = max(existing_categories, default=-1) + 1
+    remap = {}
+    added = []
+    for index, name in sorted(generated_categories.items()):
+        if name not in index_by_name:
+            index_by_name[name] = next_index
+            added.append((next_index, name))
+            next_index += 1
+        remap[index + 1] = index_by_name[name] + 1
+    return remap, added
+
+
+def remap_categories(element, remap):
+    for member in element.iter("CATEGORYMEM"):
+        category = member.get("category")
+        if category is not None and category.isdigit() and int(category) in remap:
+            member.set("category", str(remap[int(category)]))
+
+
+def add_categories(preamble, added):
+    """Adds the new categories next to the existing ones: in the XDFHEADER, or at the top level like json2xdf."""
+    if not added:
+        return
+    header = next((element for element in preamble if element.tag == "XDFHEADER"), None)
+    top_level = [position for position, element in enumerate(preamble) if element.tag == "CATEGORY"]
+    if top_level or header is None:
+        position = top_level[-1] + 1 if top_level else len(preamble)
+        tail = preamble[position - 1].tail if position else "\n"
+        for index, name in reversed(added):
+            category = xmlbackend.Element("CATEGORY", {"index": hex(index), "name": name})
+            category.tail = tail
+            preamble.insert(position, category)
+        return
+
+    children = list(header)
+    for index, name in added:
+        xmlbackend.SubElement(header, "CATEGORY", {"index": hex(index), "name": name})
+    if children:
+        # Indent like the header's existing children
+        inner_tail = children[-2].tail if len(children) > 1 else header.text
+        closing_tail = children[-1].tail
+        for category in header[len(children) - 1:-1]:
+            category.tail = inner_tail
+        header[-1].tail = closing_tail
+
+
+def merge_xdf(existing, generated, output, keep_existing=False):
+    """Merges generated into existing and writes output; both inputs may be paths or file objects.
+
+    With keep_existing, tables that match a generated one are left alone and
+    only new tables are added. Returns counts of what happened.
+    """
+    generated_tables = GeneratedTables(generated)
+    stats = {"updated": 0, "kept": 0, "inserted": 0, "categories_added": 0}
+    preamble = []  # Header and anything else before the first table, held until the categories are known
+    existing_categories = {}
+    remap = None
+    document = None
+    last = None  # Written once the next element shows it is not the final one
+    between_tail = "\n"
+
+    with open(output, "w", encoding="utf-8", errors="xmlcharrefreplace") as out:
+        out.write("<?xml version='1.0' encoding='utf-8'?>\n")
+
+        def flush_preamble():
+            nonlocal remap, last, between_tail
+            remap, added = category_remap(existing_categories, generated_tables.categories)
+            stats["categories_added"] = len(added)
+            add_categories(preamble, added)
+            out.write(xmlbackend.start_tag(document) + (document.text or ""))
+            for element in preamble[:-1]:
+                between_tail = element.tail or between_tail
+                out.write(xmlbackend.tounicode(element))
+            last = preamble[-1] if preamble else None
+
+        for document, element in iter_xdf(existing):
+            if remap is None:
+                if element.tag not in TABLE_TAGS:
+                    if element.tag in ("XDFHEADER", "CATEGORY"):
+                        existing_categories.update(read_categories(element))
+                    preamble.append(element)
+                    continue
+                flush_preamble()
+            if last is not None:
+                between_tail = last.tail or between_tail
+                out.write(xmlbackend.tounicode(last))
+            last = element
+            if element.tag not in TABLE_TAGS:
+                continue
+            entry = generated_tables.match(read_table(element))
+            if entry is None:
+                continue
+            entry["written"] = True
+            if keep_existing:
+                stats["kept"] += 1
+                continue
+            remap_categories(entry["element"], remap)
+            entry["element"].tail = element.tail
+            last = entry["element"]
+            stats["updated"] += 1
+
+        if document is None:
+            raise ValueError("The existing XDF is empty")
+        if remap is None:
+            flush_preamble()
+
+        inserted = generated_tables.unwritten()
+        final_tail = last.tail if last is not None else "\n"
+        if last is not None:
+            last.tail = between_tail if inserted else final_tail
+            out.write(xmlbackend.tounicode(last))
+        for position, entry in enumerate(inserted):
+            remap_categories(entry["element"], remap)
+            entry["element"].tail = final_tail if position == len(inserted) - 1 else between_tail
+            out.write(xmlbackend.tounicode(entry["element"]))
+        stats["inserted"] = len(inserted)
+        out.write(f"</{document.tag}>")
+    return stats
+
+
+def merge_xdf_in_place(existing, generated, keep_existing=False):
+    """Merges into existing through a temporary file that replaces it when done."""
+    directory = os.path.dirname(os.path.abspath(existing))
+    fd, temporary = tempfile.mkstemp(suffix=".xdf", dir=directory)
+    os.close(fd)
+    try:
+        stats = merge_xdf(existing, generated, temporary, keep_existing)
+        os.replace(temporary, existing)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    return stats
+
+
+def print_stats(stats, output):
+    print(
+        f"Merged into {output}: {stats['updated']} tables updated, {stats['inserted']} added,"
+        f" {stats['kept']} kept as they were, {stats['categories_added']} categories added"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge a generated XDF into an existing one.")
+    parser.add_argument("existing", help="Hand-curated XDF to merge into.")
+    parser.add_argument("generated", help="XDF written by a2l2xdf or json2xdf.")
+    parser.add_argument("-o", "--output", help="Where to write the merged XDF (default: replace the existing file).")
+    parser.add_argument("--keep-existing", action="store_true", help="Only add new tables; leave matching ones untouched.")
+    args = parser.parse_args()
+
+    if args.output:
+        stats = merge_xdf(args.existing, args.generated, args.output, args.keep_existing)
+    else:
+        stats = merge_xdf_in_place(args.existing, args.generated, args.keep_existing)
+    print_stats(stats, args.output or args.existing)
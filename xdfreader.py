@@ -0,0 +1,160 @@
+"""Streaming reader for existing XDF files.
+
+iter_xdf yields the top-level elements of an XDF one at a time and drops
+each one once the caller is done with it, so memory does not grow with the
+file. index_xdf builds lookup tables from it without keeping any elements:
+
+    index = index_xdf("curated.xdf")
+    index.by_address[0x1234]   # tables whose data starts at mmedaddress 0x1234
+    index.by_title["Ignition timing"]
+    index.categories           # {index: name}
+"""
+import xmlbackend
+
+TABLE_TAGS = ("XDFTABLE", "XDFCONSTANT")
+
+
+def iter_xdf(source):
+    """Yields (root, element) for each child of XDFFORMAT once it is complete.
+
+    An element is handed out when the next one starts, so its tail text is
+    already parsed; it is removed from the root after the caller resumes.
+    """
+    root = None
+    pending = None
+    depth = 0
+    for event, element in xmlbackend.iterparse(source, events=("start", "end")):
+        if event == "start":
+            depth += 1
+            if depth == 1:
+                root = element
+            elif depth == 2 and pending is not None:
+                yield root, pending
+                root.remove(pending)
+                pending = None
+        else:
+            depth -= 1
+            if depth == 1:
+                pending = element
+    if pending is not None:
+        yield root, pending
+        root.remove(pending)
+
+
+def parse_int(value, default=None):
+    """Reads an XDF number attribute, which may be decimal or 0x-prefixed hex."""
+    if value is None or value == "":
+        return default
+    try:
+        return int(value, 0)
+    except ValueError:
+        return default
+
+
+def read_embeddeddata(parent):
+    """Returns the data layout of an XDFAXIS or XDFCONSTANT, or None when it has no EMBEDDEDDATA."""
+    embedded = parent.find("EMBEDDEDDATA")
+    if embedded is None:
+        return None
+    math = parent.find("MATH")
+    return {
+        "address": parse_int(embedded.get("mmedaddress")),
+        "flags": parse_int(embedded.get("mmedtypeflags"), 0),
+        "bits": parse_int(embedded.get("mmedelementsizebits"), 8),
+        "cols": parse_int(embedded.get("mmedcolcount"), 1),
+        "rows": parse_int(embedded.get("mmedrowcount"), 1),
+        "major_stride_bits": parse_int(embedded.get("mmedmajorstridebits"), 0),
+        "minor_stride_bits": parse_int(embedded.get("mmedminorstridebits"), 0),
+        "equation": math.get("equation", "X") if math is not None else "X",
+    }
+
+
+def data_size(layout):
+    """Bytes spanned by an EMBEDDEDDATA layout, from its first element to the end of its last.
+
+    Strides shorter than the natural spacing are ignored, as TunerPro does.
+    """
+    element = max(layout["bits"] // 8, 1)
+    cols = max(layout["cols"], 1)
+    rows = max(layout["rows"], 1)
+    column_step = max(layout["minor_stride_bits"] // 8, element)
+    row_step = max(layout["major_stride_bits"] // 8, cols * column_step)
+    return (rows - 1) * row_step + (cols - 1) * column_step + element
+
+
+def read_table(element):
+    """Summarizes an XDFTABLE or XDFCONSTANT as a plain dict.
+
+    "axes" maps the axis id ("x", "y", "z") to its layout; constants have
+    only "z". "address" is the address of the z data.
+    """
+    axes = {}
+    if element.tag == "XDFCONSTANT":
+        layout = read_embeddeddata(element)
+        if layout is not None:
+            axes["z"] = layout
+    else:
+        for axis in element.iter("XDFAXIS"):
+            layout = read_embeddeddata(axis)
+            if layout is not None:
+                axes[axis.get("id")] = layout
+    z = axes.get("z")
+    return {
+        "tag": element.tag,
+        "uniqueid": element.get("uniqueid"),
+        "title": element.findtext("title") or "",
+        "description": element.findtext("description") or "",
+        "categories": [parse_int(member.get("category")) for member in element.iter("CATEGORYMEM")],
+        "address": z["address"] if z is not None else None,
+        "axes": axes,
+    }
+
+
+def read_categories(element):
+    """Returns {index: name} for the CATEGORY elements in element (an XDFHEADER or a CATEGORY)."""
+    return {parse_int(category.get("index")): category.get("name", "") for category in element.iter("CATEGORY")}
+
+
+def read_regions(element):
+    """Returns (start, size) for each REGION in element (an XDFHEADER or a REGION)."""
+    return [
+        (parse_int(region.get("startaddress"), 0), parse_int(region.get("size"), 0))
+        for region in element.iter("REGION")
+    ]
+
+
+class XdfIndex:
+    def __init__(self):
+        self.tables = []
+        self.by_uniqueid = {}
+        self.by_address = {}
+        self.by_title = {}
+        self.categories = {}
+        self.regions = []
+        self.title = ""
+
+    def add(self, table):
+        self.tables.append(table)
+        self.by_uniqueid.setdefault(table["uniqueid"], []).append(table)
+        if table["address"] is not None:
+            self.by_address.setdefault(table["address"], []).append(table)
+        self.by_title.setdefault(table["title"], []).append(table)
+
+
+def index_xdf(source):
+    """Reads an XDF into an XdfIndex, keeping only the table summaries."""
+    index = XdfIndex()
+    for _, element in iter_xdf(source):
+        if element.tag == "XDFHEADER":
+            index.title = element.findtext("deftitle") or ""
+            index.categories = read_categories(element)
+            # a2l2xdf puts REGION in the header, json2xdf next to it
+            index.regions += read_regions(element)
+        elif element.tag == "REGION":
+            index.regions += read_regions(element)
+        elif element.tag == "CATEGORY":
+            # json2xdf writes its categories at the top level
+            index.categories.update(read_categories(element))
+        elif element.tag in TABLE_TAGS:
+            index.add(read_table(element))
+    return index
@@ -0,0 +1,171 @@
+"""Precompiled XDF fragments for a2l2xdf.
+
+Fills fixed string templates with escaped values instead of building an
+element per node. The text is exactly what a2l2xdf's element writers produce
+through xmlbackend.write, which bench_xdftemplates.py checks.
+"""
+from functools import lru_cache
+from xmlbackend import escape_attrib, escape_cdata
+
+data_sizes = {
+    "UWORD": 2,
+    "UBYTE": 1,
+    "SBYTE": 1,
+    "SWORD": 2,
+    "ULONG": 4,
+    "SLONG": 4,
+    "FLOAT32_IEEE": 4,
+}
+
+HEADER = (
+    '<XDFFORMAT version="1.60"><XDFHEADER><flags>0x1</flags>{deftitle}'
+    "<description>Auto-generated by A2L2XDF</description>"
+    '<BASEOFFSET offset="0" subtract="0" />'
+    '<DEFAULTS datasizeinbits="8" sigdigits="4" outputtype="1" signed="0" lsbfirst="1" float="0" />'
+    '<REGION type="0xFFFFFFFF" startaddress="0x0" size="{region_size}" regionflags="0x0" name="Binary" desc="BIN for the XDF" />'
+    "{categories}</XDFHEADER>"
+)
+FOOTER = "</XDFFORMAT>"
+CATEGORY = '<CATEGORY index="{index}" name="{name}" />'
+CATEGORYMEM = '<CATEGORYMEM index="{index}" category="{category}" />'
+EMBEDDEDDATA = (
+    '<EMBEDDEDDATA mmedtypeflags="{typeflags}" mmedaddress="{address}" mmedelementsizebits="{bits}"'
+    ' mmedcolcount="{cols}"{rows} mmedmajorstridebits="{bits}" mmedminorstridebits="0" />'
+)
+XDFAXIS = (
+    '<XDFAXIS uniqueid="0x0" id="{id}">{embeddeddata}<indexcount>{indexcount}</indexcount>{min}{max}{units}'
+    '<embedinfo type="3" linkobjid="{address}" /><DALINK index="0" />'
+    '<MATH equation="{math}"><VAR id="X" /></MATH></XDFAXIS>'
+)
+FAKE_XDFAXIS = (
+    '<XDFAXIS uniqueid="0x0" id="{id}"><indexcount>{size}</indexcount><outputtype>4</outputtype>'
+    '<DALINK index="0" /><MATH equation="X"><VAR id="X" /></MATH>{labels}</XDFAXIS>'
+)
+LABEL = '<LABEL index="{index}" value="-" />'
+XDFTABLE = '<XDFTABLE uniqueid="{uniqueid}" flags="0x30">{title}{description}{categories}{axes}</XDFTABLE>'
+XDFCONSTANT = (
+    '<XDFCONSTANT uniqueid="{uniqueid}">{title}{description}{categories}{embeddeddata}'
+    '<MATH equation="{math}"><VAR id="X" /></MATH></XDFCONSTANT>'
+)
+
+
+def text_element(tag, text):
+    text = str(text) if text is not None else ""
+    if text:
+        return f"<{tag}>{escape_cdata(text)}</{tag}>"
+    return f"<{tag} />"
+
+
+def attribute(value):
+    return escape_attrib(str(value))
+
+
+def header(title, categories, region_size):
+    return HEADER.format(
+        deftitle=text_element("deftitle", title),
+        region_size=hex(region_size),
+        categories="".join(
+            CATEGORY.format(index=hex(index), name=attribute(name)) for index, name in enumerate(categories)
+        ),
+    )
+
+
+def category_members(categories, table_categories):
+    return "".join(
+        CATEGORYMEM.format(index=index, category=categories.index(category) + 1)
+        for index, category in enumerate(table_categories)
+    )
+
+
+def table_categories(table_def):
+    names = [table_def["category"]]
+    if "sub_category" in table_def:
+        names.append(table_def["sub_category"])
+    if "subsub_category" in table_def:
+        names.append(table_def["subsub_category"])
+    return names
+
+
+def embeddeddata(id, axis_def):
+    mmedtypeflags = 0x02 if id != "z" else 0x06
+    if axis_def["dataSize"] == "FLOAT32_IEEE":
+        mmedtypeflags += 0x10000
+    rows = ""
+    if id == "z":
+        rows = f' mmedrowcount="{axis_def["rows"] if "rows" in axis_def else 1}"'
+    return EMBEDDEDDATA.format(
+        typeflags=hex(mmedtypeflags),
+        address=attribute(axis_def["address"]),
+        bits=data_sizes[axis_def["dataSize"]] * 8,
+        cols=axis_def["length"] if "length" in axis_def else 1,
+        rows=rows,
+    )
+
+
+def axis(id, axis_def):
+    return XDFAXIS.format(
+        id=id,
+        embeddeddata=embeddeddata(id, axis_def),
+        indexcount=axis_def["length"] if "length" in axis_def else 1,
+        min=text_element("min", axis_def["min"]),
+        max=text_element("max", axis_def["max"]),
+        units=text_element("units", axis_def["units"]),
+        address=attribute(axis_def["address"]),
+        math=attribute(axis_def["math"]),
+    )
+
+
+@lru_cache(maxsize=None)
+def fake_axis(id, size):
+    """Label-only axis; the same few sizes recur across every table, so each is rendered once."""
+    return FAKE_XDFAXIS.format(
+        id=id, size=size, labels="".join(LABEL.format(index=index) for index in range(size))
+    )
+
+
+def table(table_def, categories):
+    axes = [
+        axis(axis_name, table_def[axis_name]) if axis_name in table_def else fake_axis(axis_name, 1)
+        for axis_name in ("x", "y")
+    ]
+    axes.append(axis("z", table_def["z"]))
+    return XDFTABLE.format(
+        uniqueid=attribute(table_def["z"]["address"]),
+        title=text_element("title", table_def["title"]),
+        description=text_element("description", table_def["description"]),
+        categories=category_members(categories, table_categories(table_def)),
+        axes="".join(axes),
+    )
+
+
+def constant(table_def, categories):
+    return XDFCONSTANT.format(
+        uniqueid=attribute(table_def["z"]["address"]),
+        title=text_element("title", table_def["title"]),
+        description=text_element("description", table_def["description"]),
+        categories=category_members(categories, table_categories(table_def)),
+        embeddeddata=embeddeddata("z", table_def["z"]),
+        math=attribute(table_def["z"]["math"]),
+    )
+
+
+def axis_description(axis_def):
+    """The axis name, followed by the characteristics sharing the axis when they are known."""
+    if not axis_def.get("users"):
+        return axis_def["name"]
+    return f'{axis_def["name"]}\nUsed by: {", ".join(axis_def["users"])}'
+
+
+def axis_table(table_def, axis_name, categories):
+    axis_def = table_def[axis_name]
+    return XDFTABLE.format(
+        uniqueid=attribute(axis_def["address"]),
+        title=text_element("title", f'{table_def["title"]} : {axis_name} axis : {axis_def["name"]}'),
+        description=text_element("description", axis_description(axis_def)),
+        categories=category_members(categories, ["Axis"]),
+        axes=fake_axis("x", axis_def["length"]) + fake_axis("y", 1) + axis("z", axis_def),
+    )
+
+
+def document(title, categories, fragments, region_size):
+    return header(title, categories, region_size) + "".join(fragments) + FOOTER
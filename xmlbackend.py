@@ -0,0 +1,165 @@
+"""XML backend shared by the converters.
+
+Uses lxml when it is installed and falls back to xml.etree.ElementTree
+otherwise. Set A2L2XDF_XML_BACKEND=etree to force the standard library.
+
+Both backends build trees through the same Element/SubElement calls. lxml
+trees are serialized by lxml and ElementTree trees by the writer below; both
+reproduce ElementTree.write byte for byte, so the output does not depend on
+which backend is in use.
+"""
+import os
+import xml.etree.ElementTree as ET
+
+etree = None
+if os.environ.get("A2L2XDF_XML_BACKEND", "lxml") != "etree":
+    try:
+        from lxml import etree
+    except ImportError:
+        pass
+
+BACKEND = "lxml" if etree is not None else "etree"
+
+if etree is not None:
+    Element = etree.Element
+    SubElement = etree.SubElement
+    Comment = etree.Comment
+    _parser = etree.XMLParser(huge_tree=True)
+    _text_parser = etree.XMLParser(huge_tree=True, encoding="utf-8")
+else:
+    Element = ET.Element
+    SubElement = ET.SubElement
+    Comment = ET.Comment
+
+_comment_tags = {ET.Comment, Comment}
+
+
+# Parsing
+
+
+def fromstring(data):
+    """Parses a document and returns its root element.
+
+    Pass bytes where possible: lxml refuses str input that carries an
+    encoding declaration, so str is re-encoded as UTF-8 for it.
+    """
+    if etree is None:
+        return ET.fromstring(data)
+    if isinstance(data, str):
+        return etree.fromstring(data.encode("utf-8"), _text_parser)
+    return etree.fromstring(data, _parser)
+
+
+def parse(source):
+    """Parses a file name or file object and returns its root element."""
+    if etree is None:
+        return ET.parse(source).getroot()
+    return etree.parse(source, _parser).getroot()
+
+
+def iterparse(source, events=("end",)):
+    if etree is None:
+        return ET.iterparse(source, events)
+    return etree.iterparse(source, events, huge_tree=True)
+
+
+# Serialization
+
+
+def escape_cdata(text):
+    """Escapes element text as ElementTree.write does."""
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    return text
+
+
+def escape_attrib(text):
+    """Escapes an attribute value as ElementTree.write does, including tabs and line breaks."""
+    text = escape_cdata(text)
+    if '"' in text:
+        text = text.replace('"', "&quot;")
+    if "\r" in text:
+        text = text.replace("\r", "&#13;")
+    if "\n" in text:
+        text = text.replace("\n", "&#10;")
+    if "\t" in text:
+        text = text.replace("\t", "&#09;")
+    return text
+
+
+def indent(tree, space="  ", level=0):
+    """ElementTree.indent, which also works on lxml elements."""
+    ET.indent(tree, space=space, level=level)
+
+
+def _serialize(write, elem):
+    tag = elem.tag
+    if tag in _comment_tags:
+        write(f"<!--{elem.text}-->")
+    else:
+        write("<" + tag)
+        for key, value in elem.items():
+            write(f' {key}="{escape_attrib(value)}"')
+        text = elem.text
+        if text or len(elem):
+            write(">")
+            if text:
+                write(escape_cdata(text))
+            for child in elem:
+                _serialize(write, child)
+            write("</" + tag + ">")
+        else:
+            write(" />")
+    if elem.tail:
+        write(escape_cdata(elem.tail))
+
+
+def tounicode(elem):
+    """Serializes an element (and its tail) the way ElementTree.tostring(encoding="unicode") does.
+
+    XDF and A2L-derived XML carry no namespaces, so unlike ElementTree this
+    skips the namespace-collection pass over the whole tree. lxml elements are
+    serialized by lxml itself and brought to ElementTree's form.
+    """
+    if etree is not None and isinstance(elem, etree._Element):
+        text = etree.tostring(elem, encoding="unicode")
+        # Outside comments, "/>" only closes empty elements and "&#9;" only comes
+        # from a tab in an attribute. "&#13;" is also how lxml writes a carriage
+        # return in text, which ElementTree leaves as it is.
+        if "<!--" not in text and "&#13;" not in text:
+            return text.replace("/>", " />").replace("&#9;", "&#09;")
+    parts = []
+    _serialize(parts.append, elem)
+    return "".join(parts)
+
+
+def start_tag(elem):
+    """The opening tag of elem as tounicode writes it, for writers that stream the children."""
+    return "<" + elem.tag + "".join(f' {key}="{escape_attrib(value)}"' for key, value in elem.items()) + ">"
+
+
+def _declaration(encoding, xml_declaration):
+    if xml_declaration or (xml_declaration is None and encoding.lower() not in ("utf-8", "us-ascii")):
+        return f"<?xml version='1.0' encoding='{encoding}'?>\n"
+    return ""
+
+
+def tostring(elem, encoding="us-ascii", xml_declaration=None):
+    text = _declaration(encoding, xml_declaration) + tounicode(elem)
+    return text.encode(encoding, "xmlcharrefreplace")
+
+
+def write(elem, file, encoding="us-ascii", xml_declaration=None):
+    """Writes elem like ElementTree(elem).write(file, encoding, xml_declaration)."""
+    if hasattr(elem, "getroot"):
+        elem = elem.getroot()
+    text = _declaration(encoding, xml_declaration) + tounicode(elem)
+    if hasattr(file, "write"):
+        file.write(text.encode(encoding, "xmlcharrefreplace"))
+        return
+    with open(file, "w", encoding=encoding, errors="xmlcharrefreplace") as f:
+        f.write(text)